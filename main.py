@@ -2,60 +2,117 @@ import time
 import logging
 import os
 import threading
-from typing import Dict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
 from pathlib import Path
-from datetime import datetime
 import cv2
 
 from scripts.setup_directories import ensure_directories
 from src.core.config import Config
 from src.core.camera_discovery import CameraDiscovery
 from src.core.camera_manager import CameraManager
+from src.core.camera_source import StaticCameraList
+from src.core.crop_writer import CropWriter
+from src.core.capture_index import CaptureIndex
+from src.core.event_store import EventStore
+from src.core.attribute_store import AttributeStore
+from src.core.retention import RetentionManager
+from src.core.load_governor import LoadGovernor, Policy
+from src.core.metrics import get_metrics, gauge_series
+from src.core.http_server import HttpServer, send
+from src.core.async_runtime import get_runtime
+from src.core.preview import PreviewHub
 from src.vision.face_detection import FaceDetector
 from src.vision.face_recognition import FaceRecognizer
 from src.vision.person_detection import PersonDetector
 from src.vision.object_detection import ObjectDetector
+from src.vision.batch_detector import BatchedObjectDetector
 from src.vision.vehicle_recognition import VehicleRecognizer
+from src.vision.plates import PlateReader, build_ocr
 from src.vision.pet_recognition import PetRecognizer
+from src.vision.gallery_cache import GalleryCache
 from src.actions.tuya import TuyaActionEngine
+from src.actions.scheduler import DelayedActionScheduler
 from src.actions.whatsapp_bot import WhatsAppBot
-from src.core.capture_session import is_active, append_image, touch
-from src.vision.image_quality import is_good
+from src.core.capture_session import is_active, append_image, add_listener
+from src.core.enrollment import EnrollmentService
+from src.core.control import ControlServer, CONTROL_SOCKET
+from src.core import capture_session
+from src.vision.image_quality import evaluate, evaluate_batch, batch_row_to_dict
+from src.vision.perceptual_hash import DuplicateSuppressor
+from src.vision.gallery_cache import IMAGE_EXTENSIONS
+from src.vision.tracking import BestShotSelector, Track
+from src.vision.zones import ZoneMap, offset_boxes
+
+# Grupo de ObjectDetector -> categoría de zona
+ZONE_CATEGORIES = {"vehicle": "vehicles", "pet": "pets"}
+GALLERY_CATEGORIES = ("faces", "vehicles", "pets")
 
 
 def setup_logging(level: str) -> None:
     logging.basicConfig(level=getattr(logging, level.upper(), logging.INFO), format="%(asctime)s %(levelname)s %(message)s")
 
 
-def save_unknown(frame, bbox: tuple, camera_ip: str, category: str) -> str:
-    """Guarda imagen de elemento desconocido y retorna path."""
-    x, y, w, h = bbox
-    crop = frame[y:y+h, x:x+w]
-    if crop.size == 0:
+def seed_known_hashes(known_dupes: DuplicateSuppressor, category: str, identity: str) -> None:
+    """Carga los hashes de las imágenes ya guardadas en known/<identidad>."""
+    hashes = []
+    folder = capture_session.known_dir(category, identity)
+    if folder.is_dir():
+        for path in folder.iterdir():
+            if path.suffix.lower() not in IMAGE_EXTENSIONS:
+                continue
+            img = cv2.imread(str(path))
+            if img is not None and img.size:
+                hashes.append(known_dupes.hash(img))
+    known_dupes.seed((category, identity), hashes)
+
+
+def save_unknown(crop_writer: CropWriter, capture_index: CaptureIndex, recent_dupes: DuplicateSuppressor, known_dupes: DuplicateSuppressor, crop, camera_ip: str, category: str, quality: Optional[dict] = None, track_id: Optional[int] = None, attributes: Optional[AttributeStore] = None) -> Optional[str]:
+    """
+    Encola el guardado de un recorte desconocido y retorna el path destino.
+    Retorna None si el recorte es casi idéntico a uno reciente de la misma cámara.
+    """
+    if crop is None or crop.size == 0:
         return ""
-    
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    safe_ip = camera_ip.replace(".", "_")
-    filename = f"{timestamp}_{safe_ip}.jpg"
-    
-    unknown_dir = f"data/{category}/unknown"
-    os.makedirs(unknown_dir, exist_ok=True)
-    
-    filepath = os.path.join(unknown_dir, filename)
-    cv2.imwrite(filepath, crop)
+    if recent_dupes.is_duplicate((camera_ip, category), crop):
+        return None
+    captured_at = time.time()
 
-    # Dynamic capture: if a session is active for this category+camera,
-    # append this frame into known dataset and refresh session activity.
-    try:
-        if is_active(category, camera_ip):
+    def _on_saved(filepath: str, saved_crop) -> None:
+        # Runs in the writer thread, once the file exists on disk.
+        nonlocal quality
+        if quality is None:
+            quality = evaluate(saved_crop, category)
+        try:
+            capture_index.add(filepath, category, camera_ip, captured_at, quality=quality.get("sharpness"), quality_ok=quality.get("ok", False), track_id=track_id, size=os.path.getsize(filepath))
+        except Exception as e:
+            logging.debug(f"Capture index write failed: {e}")
+        if attributes is not None:
+            try:
+                attributes.add(category, camera_ip, captured_at, saved_crop, filepath)
+            except Exception as e:
+                logging.debug(f"Attribute store write failed: {e}")
+        # Dynamic capture: if a session is active for this category+camera,
+        # append this frame into known dataset (which also refreshes the
+        # session TTL).
+        try:
             # Solo anexar si la imagen cumple criterios de calidad
-            if is_good(crop, category):
+            if quality.get("ok", False) and is_active(category, camera_ip):
+                identity = capture_session.active_identity(category, camera_ip)
+                if identity is None:
+                    return
+                # Evitar copias casi idénticas dentro de la galería de la identidad
+                if known_dupes.enabled and not known_dupes.has_key((category, identity)):
+                    seed_known_hashes(known_dupes, category, identity)
+                if known_dupes.is_duplicate((category, identity), saved_crop):
+                    return
                 append_image(category, camera_ip, Path(filepath))
-                touch(category, camera_ip)
-    except Exception:
-        pass
+        except Exception:
+            pass
 
-    return filepath
+    pending = crop_writer.submit(crop, category, camera_ip, on_saved=_on_saved)
+    return pending.path if pending else ""
 
 
 def build_action_engine(cfg: Dict) -> object:
@@ -73,132 +130,626 @@ def build_whatsapp_bot(cfg: Dict) -> WhatsAppBot:
     )
 
 
-def on_frame_factory(face_det: FaceDetector, face_rec: FaceRecognizer, person_det: PersonDetector, obj_det: ObjectDetector | None, vehicle_rec: VehicleRecognizer, pet_rec: PetRecognizer, action_engine, whatsapp_bot: WhatsAppBot, min_conf: float, emit_unknown: bool, unknown_alarm_delay_sec: int):
-    def on_frame(camera_ip: str, frame):
-        ts = int(time.time() * 1000)
+def build_control_server(cfg: Config, scheduler: DelayedActionScheduler, enrollment: EnrollmentService, retention: RetentionManager, pipeline: "Pipeline") -> ControlServer:
+    control = ControlServer(cfg.get("control", {}).get("socket_path", CONTROL_SOCKET))
+
+    def trigger_alarm(target: str = "alarm", seconds: int = 15) -> int:
+        # delay 0 through the scheduler: the pulse runs on the I/O loop, never on the control thread
+        return scheduler.schedule("alarm_immediate", {"target": target, "action": "pulse", "seconds": seconds}, 0)
+
+    control.register("trigger_alarm", trigger_alarm)
+    control.register("find_alarm", scheduler.find)
+    control.register("cancel_alarm", scheduler.cancel)
+    control.register("start_session", capture_session.start_session)
+    control.register("reload_gallery", lambda category=None: enrollment.rescan(category))
+    # El webhook avisa qué capturas movió a known/ para que no sigan en las búsquedas
+    control.register("forget_captures", lambda paths: pipeline.attributes.forget(paths) if pipeline.attributes else 0)
+    control.register("stats", lambda: {
+        "pending_actions": scheduler.pending(),
+        "enrolled": enrollment.enrolled,
+        "crop_writer": pipeline.crop_writer.stats(),
+        "retention": retention.stats(),
+        "duplicates": {"recent": pipeline.recent_dupes.stats(), "known": pipeline.known_dupes.stats()},
+        "best_shot": pipeline.best_shots.stats(),
+        "load": pipeline.governor.stats(),
+        "events": pipeline.event_store.stats() if pipeline.event_store else None,
+        "attributes": pipeline.attributes.stats() if pipeline.attributes else None,
+        "plates": pipeline.plate_reader.stats() if pipeline.plate_reader else None,
+        "galleries_ready": {category: ready.is_set() for category, ready in pipeline.recognition_ready.items()},
+    })
+    event_store = pipeline.event_store
+    if event_store is not None:
+        def events(before=None, **filters) -> list:
+            # before llega como lista [ts, id] por JSON
+            return event_store.query(before=tuple(before) if before else None, **filters)
+
+        control.register("events", events)
+        control.register("event_counts", event_store.counts)
+    attributes = pipeline.attributes
+    if attributes is not None:
+        def similar(path: str, **filters) -> list:
+            image = cv2.imread(path)
+            if image is None:
+                raise ValueError(f"Cannot read image: {path}")
+            return attributes.similar(image, **filters)
+
+        control.register("search_attributes", attributes.search)
+        control.register("similar", similar)
+    return control
+
+
+def register_gauges(manager: CameraManager, crop_writer: CropWriter, obj_det, governor: LoadGovernor, scheduler: DelayedActionScheduler, best_shots: BestShotSelector, recent_dupes: DuplicateSuppressor) -> None:
+    """Métricas que se calculan solo cuando Prometheus consulta /metrics."""
+    metrics = get_metrics()
+    queues = {"crop_writer": lambda: crop_writer.stats()["queue_depth"]}
+    if isinstance(obj_det, BatchedObjectDetector):
+        queues["object_detector"] = lambda: obj_det.stats()["queue_depth"]
+    metrics.gauge("nvr_queue_depth", lambda: gauge_series("queue", {name: fn() for name, fn in queues.items()}), "Items waiting per internal queue")
+    metrics.gauge("nvr_cameras_active", lambda: len(manager.workers), "Cameras with a running stream worker")
+    metrics.gauge("nvr_load_level", lambda: governor.level, "Current degradation level (0 = full service)")
+    metrics.gauge("nvr_load_pressure", lambda: governor.pressure, "Worst pressure signal seen by the load governor")
+    metrics.gauge("nvr_pending_actions", scheduler.pending, "Delayed alarms waiting to fire")
+    metrics.gauge("nvr_active_tracks", lambda: best_shots.stats()["active_tracks"], "Unknown objects currently tracked")
+    # Totales: FPS y tasas por cámara con rate() en Prometheus (p. ej. rate(nvr_frames_total[1m]))
+    metrics.counter_fn("nvr_crops_dropped_total", lambda: crop_writer.stats()["dropped"], "Unknown crops dropped because the writer queue was full")
+    metrics.counter_fn("nvr_load_transitions_total", lambda: gauge_series("kind", governor.transitions), "Load governor degrade/recover transitions")
+    metrics.counter_fn("nvr_duplicates_suppressed_total", lambda: recent_dupes.stats()["suppressed"], "Near-duplicate unknown crops not saved")
+
+
+def build_http_server(cfg: Config, preview: Optional[PreviewHub] = None) -> Optional[HttpServer]:
+    http_cfg = cfg.get("http", {})
+    if not bool(http_cfg.get("enabled", True)):
+        return None
+    host = http_cfg.get("host", "127.0.0.1")
+    server = HttpServer(host=host, port=int(http_cfg.get("port", 9100)))
+    server.route("/metrics", lambda req: send(req, 200, "text/plain; version=0.0.4; charset=utf-8", get_metrics().render().encode("utf-8")))
+    if preview is not None:
+        # La vista en vivo muestra cámaras y nombres: fuera de localhost exige token
+        if not preview.token and host not in ("127.0.0.1", "localhost", "::1"):
+            logging.warning(f"Vista en vivo desactivada: http.host={host} sin preview.token configurado")
+        else:
+            server.route("/preview", preview.index)
+            server.route("/preview.mjpg", preview.stream)
+    return server
+
+
+def on_frame_factory(face_det: FaceDetector, face_rec: FaceRecognizer, person_det: PersonDetector, obj_det: ObjectDetector | None, vehicle_rec: VehicleRecognizer, plate_reader: Optional[PlateReader], pet_rec: PetRecognizer, action_engine, scheduler: DelayedActionScheduler, whatsapp_bot: WhatsAppBot, crop_writer: CropWriter, capture_index: CaptureIndex, recent_dupes: DuplicateSuppressor, known_dupes: DuplicateSuppressor, best_shots: BestShotSelector, zone_map: ZoneMap, governor: LoadGovernor, event_store: Optional[EventStore], attributes: Optional[AttributeStore], preview: Optional[PreviewHub], recognition_ready: Dict[str, threading.Event], min_conf: float, emit_unknown: bool, unknown_alarm_delay_sec: int):
+    stage = get_metrics().stage
+
+    def emit(camera_ip: str, event_type: str, payload: Dict) -> None:
+        with stage(camera_ip, "action"):
+            action_engine.emit(event_type, payload)
+        if event_store is not None:
+            event_store.append(event_type, payload)
+
+    def report_unknown(track: Track) -> None:
+        """Guarda las mejores tomas de un track y emite un solo aviso/alarma con la mejor."""
+        shots = track.best()
+        with stage(track.camera_ip, "save"):
+            paths = [save_unknown(crop_writer, capture_index, recent_dupes, known_dupes, crop, track.camera_ip, track.category, quality=quality, track_id=track.track_id, attributes=attributes) for _, crop, quality, _ in shots]
+        # Todas casi idénticas a algo recién reportado: no repetir aviso ni alarma
+        if all(p is None for p in paths):
+            return
+        saved_path = next((p for p in paths if p), "")
+        context = shots[0][3]
+        # Se registra al detectarse; la alarma diferida puede cancelarse después
+        if event_store is not None:
+            event_store.append(context["event_type"], {**context["payload"], "saved_path": saved_path, "track_id": track.track_id})
+        with stage(track.camera_ip, "action"):
+            action_id = scheduler.schedule(context["event_type"], {**context["payload"], "saved_path": saved_path, "track_id": track.track_id}, unknown_alarm_delay_sec)
+        with stage(track.camera_ip, "notify"):
+            # Envío HTTP en el runtime de I/O: el hilo de la cámara no espera a Twilio.
+            # El SID del aviso se asocia a su alarma cuando Twilio responde.
+            sent = whatsapp_bot.notify(track.category, saved_path, track.camera_ip, context.get("metadata"))
+            if sent is not None:
+                def tag_alarm(future) -> None:
+                    if not future.cancelled() and future.exception() is None:
+                        scheduler.tag(action_id, future.result())
+                sent.add_done_callback(tag_alarm)
+
+    def offer_unknown(camera_ip: str, category: str, bbox: tuple, crop, frame_ts=None, quality: Optional[dict] = None, context: Optional[dict] = None) -> None:
+        """Toma de un objeto desconocido para el selector de mejores tomas."""
+        track_id = best_shots.offer(camera_ip, category, bbox, crop, context=context, frame_ts=frame_ts, quality=quality)
+        # Track ya reportado: el selector descarta la toma, pero con una sesión de
+        # captura activa (el dueño acaba de nombrarlo) se guarda si pasa calidad
+        if crop is None or crop.size == 0 or not best_shots.reported(track_id) or not is_active(category, camera_ip):
+            return
+        if quality is None:
+            quality = evaluate(crop, category)
+        if quality.get("ok", False):
+            save_unknown(crop_writer, capture_index, recent_dupes, known_dupes, crop, camera_ip, category, quality=quality, track_id=track_id, attributes=attributes)
 
-        def schedule_delayed(event_type: str, payload: Dict, delay: int) -> None:
-            """Programa la activación de la alarma/luz tras un retraso."""
-            def _fire():
-                action_engine.emit(event_type, payload)
-            t = threading.Timer(delay, _fire)
-            t.daemon = True
-            t.start()
+    def on_frame(camera_ip: str, frame, policy: Optional[Policy] = None):
+        ts = int(time.time() * 1000)
+        # Etapas recortadas por el gobernador de carga (cámaras de alta prioridad: servicio completo).
+        # StreamWorker pasa la política con la que ya redujo el frame: el nivel pudo cambiar desde entonces
+        if policy is None:
+            policy = governor.policy(camera_ip)
+        # Zonas de la cámara: los detectores solo ven el ROI y se descarta lo de fuera.
+        # Las zonas en píxeles siguen al frame cuando el gobernador lo reduce
+        zones = zone_map.for_frame(camera_ip, frame.shape, policy.analysis_scale)
+        # Cajas y nombres para la vista en vivo, solo si alguien la está mirando
+        overlays = [] if preview is not None and preview.wants_frame(camera_ip) else None
         # People detection
-        people = person_det.detect(frame)
+        view, ox, oy = zones.crop(frame, "person")
+        people = []
+        if view is not None and policy.allows("person_detection"):
+            with stage(camera_ip, "person"):
+                people = zones.filter("person", offset_boxes(person_det.detect(view), ox, oy))
+        if overlays is not None:
+            overlays.extend((bbox, "person", None) for bbox in people)
         if people:
-            action_engine.emit("person", {"camera_ip": camera_ip, "count": len(people), "ts": ts})
+            emit(camera_ip, "person", {"camera_ip": camera_ip, "count": len(people), "ts": ts})
         # Face detection + recognition
-        faces = face_det.detect(frame)
-        recs = face_rec.recognize(frame, faces)
+        view, ox, oy = zones.crop(frame, "faces")
+        faces = []
+        if view is not None:
+            with stage(camera_ip, "face_detect"):
+                faces = zones.filter("faces", offset_boxes(face_det.detect(view), ox, oy))
+        # Mientras la galería entrena solo se detecta: sin nombres no hay "desconocidos" ni alarmas
+        recs = []
+        if recognition_ready["faces"].is_set():
+            with stage(camera_ip, "face_recognition"):
+                recs = face_rec.recognize(frame, faces)
+        elif overlays is not None:
+            overlays.extend((bbox, "face", None) for bbox in faces)
+        unknown_faces = []
         for name, conf, (x, y, w, h) in recs:
-            if name and conf >= min_conf:
-                action_engine.emit("face_known", {"camera_ip": camera_ip, "name": name, "confidence": conf, "bbox": [x, y, w, h], "ts": ts})
+            known = bool(name) and conf >= min_conf
+            if overlays is not None:
+                overlays.append(((x, y, w, h), f"{name} {conf:.2f}" if known else "unknown", known))
+            if known:
+                emit(camera_ip, "face_known", {"camera_ip": camera_ip, "name": name, "confidence": conf, "bbox": [x, y, w, h], "ts": ts})
             elif emit_unknown:
-                saved_path = save_unknown(frame, (x, y, w, h), camera_ip, "faces")
-                whatsapp_bot.send_notification("faces", saved_path, camera_ip)
-                schedule_delayed(
-                    "face_unknown",
-                    {"camera_ip": camera_ip, "confidence": conf, "bbox": [x, y, w, h], "ts": ts, "saved_path": saved_path, "target": "alarm", "action": "pulse"},
-                    unknown_alarm_delay_sec,
-                )
+                unknown_faces.append((conf, (x, y, w, h), frame[y:y+h, x:x+w]))
+        # Calidad de todos los rostros del frame en una sola pasada
+        with stage(camera_ip, "quality"):
+            face_quality = evaluate_batch([crop for _, _, crop in unknown_faces], "faces")
+        for (conf, (x, y, w, h), crop), quality in zip(unknown_faces, face_quality):
+            offer_unknown(
+                camera_ip, "faces", (x, y, w, h), crop, frame_ts=ts, quality=batch_row_to_dict(quality, "faces"),
+                context={"event_type": "face_unknown", "payload": {"camera_ip": camera_ip, "confidence": conf, "bbox": [x, y, w, h], "ts": ts, "target": "alarm", "action": "pulse"}},
+            )
         # Object detection for pets/vehicles with recognition
-        if obj_det is not None and obj_det.available:
-            objs = obj_det.detect(frame)
+        if obj_det is not None and obj_det.available and policy.allows("object_detection"):
+            view, ox, oy = zones.crop(frame, "vehicles", "pets")
+            objs = []
+            if view is not None:
+                with stage(camera_ip, "ssd"):
+                    objs = obj_det.detect(view)
             for label, conf, bbox in objs:
+                bbox = offset_boxes([bbox], ox, oy)[0]
                 group = obj_det.classify_group(label)
+                if group in ZONE_CATEGORIES and not zones.allows(ZONE_CATEGORIES[group], bbox):
+                    continue
+                if group in ZONE_CATEGORIES and not policy.allows(f"{group}_recognition"):
+                    continue
+                if group in ZONE_CATEGORIES and not recognition_ready[ZONE_CATEGORIES[group]].is_set():
+                    if overlays is not None:
+                        overlays.append((bbox, label, None))
+                    continue
                 if group == "vehicle":
-                    plate = vehicle_rec.detect_plate(frame, bbox)
-                    vehicle_id, rec_conf = vehicle_rec.recognize(frame, bbox, plate)
-                    features = vehicle_rec.extract_features(frame, bbox)
+                    plate = None
+                    if plate_reader is not None:
+                        # OCR en segundo plano y solo en los mejores frames del vehículo; luego se usa la placa votada
+                        with stage(camera_ip, "plate"):
+                            plate = plate_reader.observe(camera_ip, bbox, frame)
+                    with stage(camera_ip, "vehicle_recognition"):
+                        vehicle_id, rec_conf = vehicle_rec.recognize(frame, bbox, plate)
+                        features = vehicle_rec.extract_features(frame, bbox)
+                    if overlays is not None:
+                        known = bool(vehicle_id) and rec_conf >= min_conf
+                        overlays.append((bbox, " ".join(filter(None, [vehicle_id if known else label, plate])), known))
                     if vehicle_id and rec_conf >= min_conf:
-                        action_engine.emit("vehicle_known", {"camera_ip": camera_ip, "vehicle_id": vehicle_id, "plate": plate, "confidence": rec_conf, "features": features, "bbox": list(bbox), "ts": ts})
+                        emit(camera_ip, "vehicle_known", {"camera_ip": camera_ip, "vehicle_id": vehicle_id, "plate": plate, "confidence": rec_conf, "features": features, "bbox": list(bbox), "ts": ts})
                     else:
-                        saved_path = save_unknown(frame, bbox, camera_ip, "vehicles")
-                        whatsapp_bot.send_notification("vehicles", saved_path, camera_ip, {"plate": plate, "features": features})
-                        schedule_delayed(
-                            "vehicle_unknown",
-                            {"camera_ip": camera_ip, "plate": plate, "features": features, "bbox": list(bbox), "ts": ts, "saved_path": saved_path, "target": "alarm", "action": "pulse", "seconds": 15},
-                            unknown_alarm_delay_sec,
+                        x, y, w, h = bbox
+                        offer_unknown(
+                            camera_ip, "vehicles", bbox, frame[y:y+h, x:x+w], frame_ts=ts,
+                            context={
+                                "event_type": "vehicle_unknown",
+                                "metadata": {"plate": plate, "features": features},
+                                "payload": {"camera_ip": camera_ip, "plate": plate, "features": features, "bbox": list(bbox), "ts": ts, "target": "alarm", "action": "pulse", "seconds": 15},
+                            },
                         )
                 elif group == "pet":
-                    pet_name, rec_conf = pet_rec.recognize(frame, bbox)
-                    features = pet_rec.extract_features(frame, bbox)
+                    with stage(camera_ip, "pet_recognition"):
+                        pet_name, rec_conf = pet_rec.recognize(frame, bbox)
+                        features = pet_rec.extract_features(frame, bbox)
+                    if overlays is not None:
+                        known = bool(pet_name) and rec_conf >= min_conf
+                        overlays.append((bbox, pet_name if known else label, known))
                     if pet_name and rec_conf >= min_conf:
-                        action_engine.emit("pet_known", {"camera_ip": camera_ip, "pet_name": pet_name, "confidence": rec_conf, "features": features, "bbox": list(bbox), "ts": ts})
+                        emit(camera_ip, "pet_known", {"camera_ip": camera_ip, "pet_name": pet_name, "confidence": rec_conf, "features": features, "bbox": list(bbox), "ts": ts})
                     else:
-                        saved_path = save_unknown(frame, bbox, camera_ip, "pets")
-                        whatsapp_bot.send_notification("pets", saved_path, camera_ip, {"features": features})
-                        schedule_delayed(
-                            "pet_unknown",
-                            {"camera_ip": camera_ip, "features": features, "bbox": list(bbox), "ts": ts, "saved_path": saved_path, "target": "alarm", "action": "pulse"},
-                            unknown_alarm_delay_sec,
+                        x, y, w, h = bbox
+                        offer_unknown(
+                            camera_ip, "pets", bbox, frame[y:y+h, x:x+w], frame_ts=ts,
+                            context={
+                                "event_type": "pet_unknown",
+                                "metadata": {"features": features},
+                                "payload": {"camera_ip": camera_ip, "features": features, "bbox": list(bbox), "ts": ts, "target": "alarm", "action": "pulse"},
+                            },
                         )
-    return on_frame
+        # Objetos desconocidos que salieron de escena (o llevan max_track_sec): reportar sus mejores tomas
+        for track in best_shots.pop_ready(camera_ip):
+            report_unknown(track)
+        if overlays is not None:
+            with stage(camera_ip, "preview"):
+                preview.publish(camera_ip, frame, overlays)
+    return on_frame, report_unknown
 
 
-def main() -> None:
-    # Ensure directory structure exists
-    ensure_directories()
-    
-    cfg = Config()
-    setup_logging(cfg.logging.get("level", "INFO"))
+@dataclass
+class Pipeline:
+    """Componentes de análisis de frames compartidos por main() y scripts/replay_benchmark.py."""
+    on_frame: Callable[..., None]
+    crop_writer: CropWriter
+    capture_index: CaptureIndex
+    recent_dupes: DuplicateSuppressor
+    known_dupes: DuplicateSuppressor
+    best_shots: BestShotSelector
+    face_rec: FaceRecognizer
+    vehicle_rec: VehicleRecognizer
+    plate_reader: Optional[PlateReader]
+    pet_rec: PetRecognizer
+    obj_det: Any
+    governor: LoadGovernor
+    event_store: Optional[EventStore]
+    attributes: Optional[AttributeStore]
+    preview: Optional[PreviewHub]
+    face_det: FaceDetector
+    # Categoría -> galería entrenada (reconocimiento activo en on_frame)
+    recognition_ready: Dict[str, threading.Event]
 
-    # Build action engine
-    action_engine = build_action_engine(cfg.actions)
-    
-    # Build WhatsApp bot
-    whatsapp_bot = build_whatsapp_bot(cfg.actions)
+    def stop(self) -> None:
+        # Antes que el escritor y el event store: lo pendiente se guarda y se avisa
+        self.best_shots.stop(flush=True)
+        logging.info(f"Best shots: {self.best_shots.stats()}")
+        if self.plate_reader is not None:
+            self.plate_reader.stop()
+        if isinstance(self.obj_det, BatchedObjectDetector):
+            self.obj_det.stop()
+            logging.info(f"Batched detector: {self.obj_det.stats()}")
+        self.crop_writer.stop()
+        logging.info(f"Crop writer: {self.crop_writer.stats()}")
+        if self.event_store is not None:
+            self.event_store.stop()
+            logging.info(f"Event store: {self.event_store.stats()}")
+        if self.attributes is not None:
+            self.attributes.flush()
+        if self.preview is not None:
+            self.preview.stop()
+        logging.info(f"Duplicates suppressed: {self.recent_dupes.stats()['suppressed']} unknown, {self.known_dupes.stats()['suppressed']} known")
+
+
+def build_pipeline(cfg: Config, action_engine, scheduler, whatsapp_bot, data_dir: str = "data") -> Pipeline:
+    """
+    Construye detectores, reconocedores, escritor de recortes y on_frame.
+    Los reconocedores quedan sin entrenar (solo detección) hasta llamar a
+    train_galleries(). El gobernador de carga se crea sin arrancar: main()
+    lo inicia.
+    """
+    # Background writer for unknown crops
+    storage_cfg = cfg.get("storage", {})
+    crop_writer = CropWriter(
+        base_dir=data_dir,
+        queue_size=int(storage_cfg.get("queue_size", 64)),
+        workers=int(storage_cfg.get("writer_threads", 1)),
+        jpeg_quality=int(storage_cfg.get("jpeg_quality", 90)),
+        fsync_batch=int(storage_cfg.get("fsync_batch", 16)),
+        fsync_interval_sec=float(storage_cfg.get("fsync_interval_sec", 2.0)),
+    )
+    crop_writer.start()
+    capture_index = CaptureIndex(Path(data_dir) / "captures.db")
+
+    # Historial consultable de eventos (data/events.db)
+    events_cfg = cfg.get("events", {})
+    event_store = None
+    if bool(events_cfg.get("enabled", True)):
+        event_store = EventStore(
+            Path(data_dir) / "events.db",
+            queue_size=int(events_cfg.get("queue_size", 2048)),
+            batch_size=int(events_cfg.get("batch_size", 200)),
+            flush_interval_sec=float(events_cfg.get("flush_interval_sec", 1.0)),
+            min_interval_sec=float(events_cfg.get("min_interval_sec", 5)),
+        )
+        event_store.start()
+
+    # Atributos de apariencia de cada recorte guardado (búsqueda por color/parecido)
+    attr_cfg = cfg.get("attributes", {})
+    attributes = None
+    if bool(attr_cfg.get("enabled", True)):
+        attributes = AttributeStore(
+            Path(data_dir) / "attributes",
+            crops_dir=data_dir,
+            initial_capacity=int(attr_cfg.get("initial_capacity", 65536)),
+            flush_every=int(attr_cfg.get("flush_every", 64)),
+        )
+
+    # Supresión de recortes casi duplicados (objeto quieto frente a la cámara)
+    dedupe_cfg = cfg.get("dedupe", {})
+    dedupe_args = {
+        "max_distance": int(dedupe_cfg.get("max_distance", 6)),
+        "method": dedupe_cfg.get("method", "dhash"),
+        "enabled": bool(dedupe_cfg.get("enabled", True)),
+    }
+    recent_dupes = DuplicateSuppressor(window_sec=float(dedupe_cfg.get("window_sec", 10)), **dedupe_args)
+    # Sin caducidad: se compara contra toda la galería known/<identidad>
+    known_dupes = DuplicateSuppressor(window_sec=0, **dedupe_args)
+
+    # Solo las mejores tomas de cada objeto se guardan, notifican y enrolan
+    best_cfg = cfg.get("best_shot", {})
+    best_shots = BestShotSelector(
+        top_k=int(best_cfg.get("top_k", 3)),
+        iou_threshold=float(best_cfg.get("iou_threshold", 0.3)),
+        track_idle_sec=float(best_cfg.get("track_idle_sec", 1.5)),
+        max_track_sec=float(best_cfg.get("max_track_sec", 3.0)),
+        weights=best_cfg.get("weights"),
+    )
 
     # Vision components
     face_det = FaceDetector(min_size=int(cfg.recognition.get("min_face_size", 60)))
     face_rec = FaceRecognizer()
-    face_rec.train_from_dir(cfg.recognition.get("face_dir", "data/faces/known"), detector=face_det)
     person_det = PersonDetector()
     # Object detector
     obj_cfg = cfg.get("object_detection", {})
     obj_det = None
+    if "opencv_threads" in obj_cfg:
+        cv2.setNumThreads(int(obj_cfg["opencv_threads"]))
     if bool(obj_cfg.get("enabled", True)):
         obj_det = ObjectDetector(
             prototxt=obj_cfg.get("prototxt", "models/MobileNetSSD_deploy.prototxt"),
             model=obj_cfg.get("model", "models/MobileNetSSD_deploy.caffemodel"),
             conf_thresh=float(obj_cfg.get("confidence_threshold", 0.5)),
+            onnx_model=obj_cfg.get("onnx_model") or None,
+            backend=obj_cfg.get("backend", "default"),
+            target=obj_cfg.get("target", "cpu"),
         )
+        # Un solo forward para frames de varias cámaras que llegan casi juntos
+        batch_size = int(obj_cfg.get("batch_size", 1))
+        if batch_size > 1 and obj_det.available:
+            obj_det = BatchedObjectDetector(obj_det, max_batch=batch_size, max_wait_ms=float(obj_cfg.get("batch_wait_ms", 15)), timeout_ms=float(obj_cfg.get("batch_timeout_ms", 2000)))
+            obj_det.start()
     # Vehicle recognizer
-    vehicle_rec = VehicleRecognizer()
-    vehicle_rec.train_from_dir(cfg.recognition.get("vehicle_dir", "data/vehicles/known"))
+    # Lectura de placas: localización por morfología + OCR (opcional)
+    plates_cfg = cfg.get("plates", {})
+    ocr = None
+    if bool(plates_cfg.get("enabled", True)):
+        ocr = build_ocr(
+            plates_cfg.get("ocr", "tesseract"),
+            psm=int(plates_cfg.get("tesseract_psm", 7)),
+            model=plates_cfg.get("dnn_model", "models/crnn.onnx"),
+            vocabulary=plates_cfg.get("vocabulary", "models/alphabet_36.txt"),
+        )
+    plate_reader = None
+    if ocr is not None:
+        plate_reader = PlateReader(
+            ocr,
+            top_k=int(plates_cfg.get("top_k", 3)),
+            max_reads=int(plates_cfg.get("max_reads", 5)),
+            min_votes=int(plates_cfg.get("min_votes", 2)),
+            iou_threshold=float(plates_cfg.get("iou_threshold", 0.3)),
+            track_idle_sec=float(plates_cfg.get("track_idle_sec", 2.0)),
+            min_quality=float(plates_cfg.get("min_quality", 0.3)),
+            workers=int(plates_cfg.get("ocr_workers", 1)),
+            max_pending=int(plates_cfg.get("max_pending", 8)),
+        )
+    vehicle_rec = VehicleRecognizer(plate_max_edits=int(cfg.recognition.get("plate_max_edits", 1)), ocr=ocr)
     # Pet recognizer
     pet_rec = PetRecognizer()
-    pet_rec.train_from_dir(cfg.recognition.get("pet_dir", "data/pets/known"))
+    recognition_ready = {category: threading.Event() for category in GALLERY_CATEGORIES}
 
-    # Discovery + manager
-    discovery = CameraDiscovery(
-        scan_subnets=cfg.network.get("scan_subnets", []),
-        ws_enabled=bool(cfg.network.get("ws_discovery_enabled", True)),
-        timeout=2.0,
+    # Degradación escalonada bajo carga de CPU
+    gov_cfg = cfg.get("load_governor", {})
+    governor = LoadGovernor(
+        levels=gov_cfg.get("levels", []) if bool(gov_cfg.get("enabled", True)) else [],
+        priorities=gov_cfg.get("priorities", {}),
+        default_priority=gov_cfg.get("default_priority", "normal"),
+        target_latency_ms=float(gov_cfg.get("target_latency_ms", 400)),
+        check_interval_sec=float(gov_cfg.get("check_interval_sec", 2)),
+        degrade_checks=int(gov_cfg.get("degrade_checks", 2)),
+        recover_checks=int(gov_cfg.get("recover_checks", 5)),
+        recover_below=float(gov_cfg.get("recover_below", 0.6)),
+        latency_ttl_sec=float(gov_cfg.get("latency_ttl_sec", 5)),
+    )
+    governor.add_probe("crop_writer", lambda: crop_writer.stats()["queue_depth"], int(storage_cfg.get("queue_size", 64)))
+    if isinstance(obj_det, BatchedObjectDetector):
+        governor.add_probe("object_detector", lambda: obj_det.stats()["queue_depth"], obj_det.max_batch * 2)
+
+    # Vista en vivo MJPEG: se codifica una vez por frame y solo con espectadores
+    preview_cfg = cfg.get("preview", {})
+    preview = None
+    if bool(preview_cfg.get("enabled", False)):
+        preview = PreviewHub(
+            max_fps=float(preview_cfg.get("max_fps", 5)),
+            max_width=int(preview_cfg.get("max_width", 960)),
+            jpeg_quality=int(preview_cfg.get("jpeg_quality", 70)),
+            token=str(preview_cfg.get("token") or ""),
+        )
+
+    on_frame, report_unknown = on_frame_factory(
+        face_det=face_det,
+        face_rec=face_rec,
+        person_det=person_det,
+        obj_det=obj_det,
+        vehicle_rec=vehicle_rec,
+        plate_reader=plate_reader,
+        pet_rec=pet_rec,
+        action_engine=action_engine,
+        scheduler=scheduler,
+        whatsapp_bot=whatsapp_bot,
+        crop_writer=crop_writer,
+        capture_index=capture_index,
+        recent_dupes=recent_dupes,
+        known_dupes=known_dupes,
+        best_shots=best_shots,
+        zone_map=ZoneMap(cfg.get("zones") or {}),
+        governor=governor,
+        event_store=event_store,
+        attributes=attributes,
+        preview=preview,
+        recognition_ready=recognition_ready,
+        min_conf=float(cfg.recognition.get("min_confidence", 0.5)),
+        emit_unknown=bool(cfg.recognition.get("emit_unknown_face_events", True)),
+        unknown_alarm_delay_sec=int(cfg.actions.get("unknown_alarm_delay_sec", 30)),
+    )
+    # Barrido de todas las cámaras: una cámara caída no deja tracks sin reportar
+    best_shots.start(report_unknown, interval_sec=float(best_cfg.get("sweep_interval_sec", 1.0)))
+    return Pipeline(
+        on_frame=on_frame,
+        crop_writer=crop_writer,
+        capture_index=capture_index,
+        recent_dupes=recent_dupes,
+        known_dupes=known_dupes,
+        best_shots=best_shots,
+        face_rec=face_rec,
+        vehicle_rec=vehicle_rec,
+        plate_reader=plate_reader,
+        pet_rec=pet_rec,
+        obj_det=obj_det,
+        governor=governor,
+        event_store=event_store,
+        attributes=attributes,
+        preview=preview,
+        face_det=face_det,
+        recognition_ready=recognition_ready,
+    )
+
+
+def train_galleries(cfg: Config, pipeline: Pipeline, enrollment: Optional[EnrollmentService] = None) -> List[Future]:
+    """
+    Entrena las galerías de rostros, vehículos y mascotas en paralelo (LBPH
+    y ORB de OpenCV liberan el GIL) sin bloquear el arranque. Cada categoría
+    activa su reconocimiento en on_frame apenas termina; si falla, queda
+    inactiva (sin avisos de desconocidos) hasta reiniciar. Con enrollment, cada
+    galería le pasa la lista de archivos con la que entrenó (seed) y el
+    enrolamiento incremental arranca cuando terminaron las tres.
+    """
+    rec_cfg = cfg.recognition
+    cache_dir = rec_cfg.get("cache_dir", "data/cache")
+    dirs = {
+        "faces": rec_cfg.get("face_dir", "data/faces/known"),
+        "vehicles": rec_cfg.get("vehicle_dir", "data/vehicles/known"),
+        "pets": rec_cfg.get("pet_dir", "data/pets/known"),
+    }
+    jobs = {
+        "faces": lambda entries: pipeline.face_rec.train_from_dir(dirs["faces"], detector=pipeline.face_det, cache_dir=cache_dir, entries=entries),
+        "vehicles": lambda entries: pipeline.vehicle_rec.train_from_dir(dirs["vehicles"], cache_dir=cache_dir, entries=entries),
+        "pets": lambda entries: pipeline.pet_rec.train_from_dir(dirs["pets"], cache_dir=cache_dir, entries=entries),
+    }
+    remaining = [len(jobs)]
+    lock = threading.Lock()
+
+    def train(category: str, job: Callable[[Dict], None]) -> None:
+        start = time.monotonic()
+        # Un solo escaneo: lo que entrena la galería es lo que el enrolamiento da por visto
+        entries = GalleryCache.scan(dirs[category])
+        try:
+            job(entries)
+            if enrollment is not None:
+                enrollment.seed(entries)
+        except Exception as e:
+            # Sin galería todo sería "desconocido": la categoría sigue sin avisos ni alarmas
+            logging.error(f"Gallery training failed ({category}): {e}; unknown alerts stay off for {category}")
+        else:
+            pipeline.recognition_ready[category].set()
+            logging.info(f"Galería {category} lista en {time.monotonic() - start:.1f}s: reconocimiento activo")
+        with lock:
+            remaining[0] -= 1
+            done = remaining[0] == 0
+        if done and enrollment is not None:
+            enrollment.start()
+
+    executor = ThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix="gallery")
+    futures = [executor.submit(train, category, job) for category, job in jobs.items()]
+    executor.shutdown(wait=False)
+    return futures
+
+
+def main() -> None:
+    # Ensure directory structure exists
+    ensure_directories()
+    
+    cfg = Config()
+    setup_logging(cfg.logging.get("level", "INFO"))
+
+    # Un solo event loop para la E/S de red: descubrimiento, Tuya, Twilio y alarmas diferidas
+    io_runtime = get_runtime()
+
+    # Build action engine
+    action_engine = build_action_engine(cfg.actions)
+    # Alarmas diferidas (cancelables desde el canal de control)
+    scheduler = DelayedActionScheduler(action_engine)
+    
+    # Build WhatsApp bot
+    whatsapp_bot = build_whatsapp_bot(cfg.actions)
+
+    pipeline = build_pipeline(cfg, action_engine, scheduler, whatsapp_bot)
+    governor = pipeline.governor
+    governor.start()
+
+    # Presupuesto de disco para data/*/unknown, aplicado en segundo plano
+    retention_cfg = cfg.get("retention", {})
+    retention = RetentionManager(
+        pipeline.capture_index,
+        budgets=retention_cfg.get("budgets", {}),
+        tick_sec=float(retention_cfg.get("tick_sec", 30)),
+        max_deletes_per_tick=int(retention_cfg.get("max_deletes_per_tick", 50)),
+        scan_per_tick=int(retention_cfg.get("scan_per_tick", 200)),
+        dup_window_sec=float(retention_cfg.get("dup_window_sec", 2.0)),
+        attributes=pipeline.attributes,
     )
+    retention.start()
+
+    # Incremental enrollment: capture sessions and the webhook add images to known/
+    enrollment = EnrollmentService(
+        recognizers={"faces": pipeline.face_rec, "vehicles": pipeline.vehicle_rec, "pets": pipeline.pet_rec},
+        known_dirs={
+            "faces": cfg.recognition.get("face_dir", "data/faces/known"),
+            "vehicles": cfg.recognition.get("vehicle_dir", "data/vehicles/known"),
+            "pets": cfg.recognition.get("pet_dir", "data/pets/known"),
+        },
+        scan_interval_sec=float(cfg.recognition.get("enrollment_scan_interval_sec", 10)),
+    )
+    add_listener(enrollment.submit)
+
+    # Discovery + manager
+    static_cameras = cfg.network.get("static_cameras") or []
+    if static_cameras:
+        # Lista fija (cámaras reales o sintéticas desde archivo) en lugar de descubrimiento en red
+        discovery = StaticCameraList(static_cameras)
+    else:
+        discovery = CameraDiscovery(
+            scan_subnets=cfg.network.get("scan_subnets", []),
+            ws_enabled=bool(cfg.network.get("ws_discovery_enabled", True)),
+            timeout=2.0,
+        )
     manager = CameraManager(
         discovery=discovery,
         rtsp_paths=cfg.camera.get("rtsp_paths", []),
         credentials={"username": cfg.camera.get("username", ""), "password": cfg.camera.get("password", "")},
-        on_frame=on_frame_factory(
-            face_det=face_det,
-            face_rec=face_rec,
-            person_det=person_det,
-            obj_det=obj_det,
-            vehicle_rec=vehicle_rec,
-            pet_rec=pet_rec,
-            action_engine=action_engine,
-            whatsapp_bot=whatsapp_bot,
-            min_conf=float(cfg.recognition.get("min_confidence", 0.5)),
-            emit_unknown=bool(cfg.recognition.get("emit_unknown_face_events", True)),
-            unknown_alarm_delay_sec=int(cfg.actions.get("unknown_alarm_delay_sec", 30)),
-        ),
+        governor=governor,
+        on_frame=pipeline.on_frame,
     )
 
+    # Local control channel: the webhook and CLI tools reuse these live engines
+    control = build_control_server(cfg, scheduler, enrollment, retention, pipeline)
+    control.start()
+
+    # Endpoint /metrics (Prometheus)
+    register_gauges(manager, pipeline.crop_writer, pipeline.obj_det, governor, scheduler, pipeline.best_shots, pipeline.recent_dupes)
+    http_server = build_http_server(cfg, pipeline.preview)
+    if http_server is not None:
+        http_server.start()
+
     discovery_interval = int(cfg.network.get("discovery_interval_sec", 20))
     manager.start(interval_sec=discovery_interval)
 
+    # Las cámaras arrancan ya con detección; el reconocimiento se activa por
+    # categoría al terminar cada galería, y el enrolamiento cuando están todas
+    train_galleries(cfg, pipeline, enrollment)
+
     try:
         logging.info("NVR AI service running. Press Ctrl+C to stop.")
         while True:
@@ -206,6 +757,14 @@ def main() -> None:
     except KeyboardInterrupt:
         logging.info("Stopping...")
         manager.stop()
+        governor.stop()
+        control.stop()
+        if http_server is not None:
+            http_server.stop()
+        enrollment.stop()
+        retention.stop()
+        pipeline.stop()
+        io_runtime.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,92 @@
+"""
+Mide el rendimiento del detector de objetos según el tamaño de lote.
+
+Usa la configuración de object_detection en config/settings.yaml (modelo,
+ONNX, backend, target) y frames sintéticos o una imagen dada.
+
+Uso:
+    python scripts/benchmark_inference.py
+    python scripts/benchmark_inference.py --batch-sizes 1,2,4,8 --iterations 30 --threads 4
+    python scripts/benchmark_inference.py --image data/test.jpg --backend opencv --target cpu
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.vision.object_detection import ObjectDetector
+
+
+def build_detector(obj_cfg: dict, backend: str = None, target: str = None) -> ObjectDetector:
+    return ObjectDetector(
+        prototxt=obj_cfg.get("prototxt", "models/MobileNetSSD_deploy.prototxt"),
+        model=obj_cfg.get("model", "models/MobileNetSSD_deploy.caffemodel"),
+        conf_thresh=float(obj_cfg.get("confidence_threshold", 0.5)),
+        onnx_model=obj_cfg.get("onnx_model") or None,
+        backend=backend or obj_cfg.get("backend", "default"),
+        target=target or obj_cfg.get("target", "cpu"),
+    )
+
+
+def run(detector: ObjectDetector, frame: np.ndarray, batch_size: int, iterations: int, warmup: int = 3) -> dict:
+    frames = [frame] * batch_size
+    for _ in range(warmup):
+        detector.detect_batch(frames)
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        detector.detect_batch(frames)
+        timings.append(time.perf_counter() - start)
+    timings_ms = np.array(timings) * 1000.0
+    return {
+        "batch_size": batch_size,
+        "ms_per_batch_p50": round(float(np.percentile(timings_ms, 50)), 2),
+        "ms_per_batch_p95": round(float(np.percentile(timings_ms, 95)), 2),
+        "ms_per_frame": round(float(np.median(timings_ms)) / batch_size, 2),
+        "frames_per_sec": round(batch_size * 1000.0 / float(np.median(timings_ms)), 2),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de inferencia por lotes")
+    parser.add_argument("--batch-sizes", default="1,2,4,8")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=None, help="cv2.setNumThreads")
+    parser.add_argument("--image", default=None, help="imagen de prueba (por defecto, frame sintético 640x480)")
+    parser.add_argument("--backend", default=None)
+    parser.add_argument("--target", default=None)
+    parser.add_argument("--config", default="config/settings.yaml")
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        obj_cfg = (yaml.safe_load(f) or {}).get("object_detection", {})
+    threads = args.threads if args.threads is not None else obj_cfg.get("opencv_threads")
+    if threads is not None:
+        cv2.setNumThreads(int(threads))
+
+    detector = build_detector(obj_cfg, args.backend, args.target)
+    if not detector.available:
+        print("Modelo no encontrado; ejecuta scripts/download_models.py o revisa object_detection en settings.yaml")
+        return 1
+
+    if args.image:
+        frame = cv2.imread(args.image)
+        if frame is None:
+            print(f"No se pudo leer {args.image}")
+            return 1
+    else:
+        frame = np.random.default_rng(0).integers(0, 255, (480, 640, 3), dtype=np.uint8)
+
+    results = [run(detector, frame, int(b), args.iterations) for b in args.batch_sizes.split(",") if b.strip()]
+    print(json.dumps({"threads": cv2.getNumThreads(), "results": results}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
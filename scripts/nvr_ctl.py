@@ -0,0 +1,58 @@
+"""
+Envía comandos al servicio NVR en ejecución por el canal de control.
+
+Uso:
+    python scripts/nvr_ctl.py ping
+    python scripts/nvr_ctl.py trigger_alarm seconds=15
+    python scripts/nvr_ctl.py find_alarm
+    python scripts/nvr_ctl.py cancel_alarm action_id=3
+    python scripts/nvr_ctl.py start_session category=faces camera_ip=192.168.1.100 base_name=juan_masculino_192_168_1_100.png
+    python scripts/nvr_ctl.py reload_gallery category=vehicles
+    python scripts/nvr_ctl.py stats
+    python scripts/nvr_ctl.py events identity=ABC123 limit=1
+    python scripts/nvr_ctl.py events camera_ip=192.168.1.100 types='["vehicle_known","vehicle_unknown"]' start_ts=1700000000
+    python scripts/nvr_ctl.py event_counts bucket_sec=3600 types=person start_ts=1700000000
+    python scripts/nvr_ctl.py search_attributes category=vehicles color=red camera_ip=192.168.1.100 start_ts=1700000000
+    python scripts/nvr_ctl.py similar path=data/vehicles/unknown/20240101_120000_000_0001_192_168_1_100.jpg category=vehicles
+"""
+import json
+import sys
+from pathlib import Path
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.core.control import ControlClient, ControlError, CONTROL_SOCKET
+
+
+def _parse_value(raw: str):
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return raw
+
+
+def main() -> int:
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return 2
+    settings = Path("config/settings.yaml")
+    socket_path = CONTROL_SOCKET
+    if settings.exists():
+        with settings.open("r", encoding="utf-8") as f:
+            socket_path = (yaml.safe_load(f) or {}).get("control", {}).get("socket_path", CONTROL_SOCKET)
+    args = {}
+    for token in sys.argv[2:]:
+        key, _, value = token.partition("=")
+        args[key] = _parse_value(value)
+    try:
+        result = ControlClient(socket_path, timeout=5.0).call(sys.argv[1], **args)
+    except ControlError as e:
+        print(f"Error: {e}")
+        return 1
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
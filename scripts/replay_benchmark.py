@@ -0,0 +1,268 @@
+"""
+Reproduce videos o carpetas de imágenes a través del mismo on_frame que
+construye main.py y mide el pipeline sin cámaras.
+
+Las acciones (Tuya), las alarmas diferidas y WhatsApp se sustituyen por
+sumideros que solo cuentan eventos; los recortes desconocidos, los índices,
+las sesiones de captura y lo que estas anexen a known/ se escriben en un
+directorio temporal. Cada cámara simulada corre en su propio hilo,
+como un StreamWorker, y reproduce una de las fuentes (en rueda).
+
+Uso:
+    python scripts/replay_benchmark.py grabaciones/entrada.mp4
+    python scripts/replay_benchmark.py clip1.mp4 clip2.mp4 --cameras 4 --loops 2
+    python scripts/replay_benchmark.py data/test_frames/ --pacing realtime --fps 10
+    python scripts/replay_benchmark.py clip.mp4 --camera-ips 192.168.1.100 --output bench.json
+"""
+import argparse
+import itertools
+import json
+import logging
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import main as nvr
+from src.actions.base import ActionEngine
+from src.core import capture_session
+from src.core.config import Config
+from src.core.metrics import Histogram, get_metrics
+from src.core.stream_worker import prepare_frame
+from src.vision.gallery_cache import IMAGE_EXTENSIONS
+
+
+class RecordingActionEngine(ActionEngine):
+    """Cuenta los eventos en lugar de accionar dispositivos."""
+
+    def __init__(self) -> None:
+        self.events: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def emit(self, event_type: str, payload) -> None:
+        with self._lock:
+            self.events[event_type] += 1
+
+
+class RecordingScheduler:
+    """Cuenta las alarmas que se habrían programado."""
+
+    def __init__(self) -> None:
+        self.scheduled: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def schedule(self, event_type: str, payload: Dict, delay: float, ref=None) -> int:
+        with self._lock:
+            self.scheduled[event_type] += 1
+            return sum(self.scheduled.values())
+
+    def tag(self, action_id: int, ref) -> None:
+        pass
+
+    def find(self, ref=None):
+        return None
+
+    def cancel(self, action_id: int) -> bool:
+        return False
+
+    def pending(self) -> int:
+        return 0
+
+
+class RecordingBot:
+    """Cuenta las notificaciones de WhatsApp por categoría."""
+
+    def __init__(self) -> None:
+        self.notifications: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def send_notification(self, category: str, image_path: str, camera_ip: str, metadata: dict = None) -> bool:
+        with self._lock:
+            self.notifications[category] += 1
+        return True
+
+    def notify(self, category: str, image_path: str, camera_ip: str, metadata: dict = None) -> None:
+        self.send_notification(category, image_path, camera_ip, metadata)
+
+
+def iter_frames(source: str, loops: int, decode: Optional[Histogram] = None) -> Iterator[np.ndarray]:
+    """
+    Frames de un video o de una carpeta de imágenes (orden alfabético).
+    Con decode, registra cuánto tarda cada lectura (cap.read() o imread),
+    como la etapa "decode" de StreamWorker.
+    """
+    path = Path(source)
+    for _ in range(loops):
+        if path.is_dir():
+            for image_path in sorted(p for p in path.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS):
+                t0 = time.perf_counter()
+                frame = cv2.imread(str(image_path))
+                if decode is not None:
+                    decode.observe(time.perf_counter() - t0)
+                if frame is not None:
+                    yield frame
+        else:
+            cap = cv2.VideoCapture(str(path))
+            try:
+                while True:
+                    t0 = time.perf_counter()
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    if decode is not None:
+                        decode.observe(time.perf_counter() - t0)
+                    yield frame
+            finally:
+                cap.release()
+
+
+def source_fps(source: str, default: float) -> float:
+    if Path(source).is_dir():
+        return default
+    cap = cv2.VideoCapture(source)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+    return fps if fps and fps > 0 else default
+
+
+def replay_camera(camera_ip: str, source: str, on_frame, loops: int, fps: float, max_frames: int, latencies: List[float], errors: Counter) -> None:
+    """Igual que StreamWorker.run: decodificar, reducir y llamar a on_frame."""
+    metrics = get_metrics()
+    frames = metrics.counter("nvr_frames_total", camera=camera_ip)
+    decode = metrics.histogram("nvr_stage_seconds", camera=camera_ip, stage="decode")
+    start = time.perf_counter()
+    frames_iter = iter_frames(source, loops, decode)
+    if max_frames:
+        frames_iter = itertools.islice(frames_iter, max_frames)
+    for index, frame in enumerate(frames_iter):
+        if fps > 0:
+            # Ritmo fijo respecto al inicio: los retrasos no se acumulan
+            delay = start + index / fps - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        with metrics.stage(camera_ip, "resize"):
+            frame = prepare_frame(frame)
+        frames.inc()
+        t0 = time.perf_counter()
+        try:
+            on_frame(camera_ip, frame)
+        except Exception as e:
+            if not errors:
+                logging.error(f"on_frame falló en {camera_ip}: {e}")
+            errors[type(e).__name__] += 1
+        latencies.append(time.perf_counter() - t0)
+
+
+def stage_percentiles() -> Dict[str, Dict]:
+    """Percentiles por etapa sumando los histogramas de todas las cámaras."""
+    merged: Dict[str, Histogram] = {}
+    for key, hist in get_metrics().histograms("nvr_stage_seconds").items():
+        stage = dict(key)["stage"]
+        merged.setdefault(stage, Histogram(hist.buckets)).merge(hist)
+    result = {}
+    for stage, hist in sorted(merged.items()):
+        result[stage] = {
+            "count": hist.count,
+            "mean_ms": round(hist.sum / hist.count * 1000.0, 2) if hist.count else 0.0,
+            "p50_ms_le": hist.percentile(50) * 1000.0,
+            "p95_ms_le": hist.percentile(95) * 1000.0,
+            "p99_ms_le": hist.percentile(99) * 1000.0,
+        }
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline sobre grabaciones")
+    parser.add_argument("sources", nargs="+", help="videos o carpetas de imágenes")
+    parser.add_argument("--cameras", type=int, default=None, help="cámaras simuladas (por defecto, una por fuente)")
+    parser.add_argument("--camera-ips", default=None, help="IPs separadas por coma (para aplicar zonas/prioridades configuradas)")
+    parser.add_argument("--pacing", choices=("fast", "realtime"), default="fast")
+    parser.add_argument("--fps", type=float, default=None, help="fps en modo realtime (por defecto, el del video; 10 para carpetas)")
+    parser.add_argument("--loops", type=int, default=1)
+    parser.add_argument("--max-frames", type=int, default=0, help="frames por cámara (0 = sin límite)")
+    parser.add_argument("--config", default="config/settings.yaml")
+    parser.add_argument("--secrets", default="config/secrets.yaml")
+    parser.add_argument("--keep-crops", default=None, help="directorio donde conservar los recortes (por defecto, temporal)")
+    parser.add_argument("--output", default=None, help="archivo JSON (por defecto, stdout)")
+    args = parser.parse_args()
+
+    cfg = Config(args.config, args.secrets)
+    nvr.setup_logging(cfg.logging.get("level", "INFO"))
+    ips = [ip.strip() for ip in args.camera_ips.split(",") if ip.strip()] if args.camera_ips else []
+    n_cameras = args.cameras or max(len(ips), len(args.sources))
+    ips += [f"replay-{i + 1}" for i in range(len(ips), n_cameras)]
+
+    data_dir = args.keep_crops or tempfile.mkdtemp(prefix="nvr_replay_")
+    # Sesiones de captura y known/ también en el directorio del benchmark: nada toca config/ ni data/
+    capture_session.configure(db_path=Path(data_dir) / "capture_sessions.db", data_dir=data_dir)
+    action_engine, scheduler, bot = RecordingActionEngine(), RecordingScheduler(), RecordingBot()
+    # El gobernador no se arranca: servicio completo en todas las cámaras, resultados comparables
+    pipeline = nvr.build_pipeline(cfg, action_engine, scheduler, bot, data_dir=data_dir)
+    # El benchmark mide el servicio completo: esperar a las galerías antes de reproducir
+    for future in nvr.train_galleries(cfg, pipeline):
+        future.result()
+
+    latencies: Dict[str, List[float]] = {ip: [] for ip in ips}
+    errors: Counter = Counter()
+    threads = []
+    for i, ip in enumerate(ips):
+        source = args.sources[i % len(args.sources)]
+        fps = (args.fps or source_fps(source, 10.0)) if args.pacing == "realtime" else 0.0
+        threads.append(threading.Thread(target=replay_camera, args=(ip, source, pipeline.on_frame, args.loops, fps, args.max_frames, latencies[ip], errors), name=f"replay-{ip}"))
+
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    pipeline.stop()
+
+    all_latencies = np.array([lat for values in latencies.values() for lat in values]) * 1000.0
+    total_frames = int(all_latencies.size)
+    report = {
+        "sources": args.sources,
+        "cameras": n_cameras,
+        "pacing": args.pacing,
+        "frames": total_frames,
+        "wall_sec": round(wall, 3),
+        "throughput_fps": round(total_frames / wall, 2) if wall > 0 else 0.0,
+        "per_camera_fps": {ip: round(len(values) / wall, 2) if wall > 0 else 0.0 for ip, values in latencies.items()},
+        "frame_latency_ms": {
+            "p50": round(float(np.percentile(all_latencies, 50)), 2),
+            "p95": round(float(np.percentile(all_latencies, 95)), 2),
+            "p99": round(float(np.percentile(all_latencies, 99)), 2),
+            "max": round(float(all_latencies.max()), 2),
+        } if total_frames else {},
+        # Cota superior del bucket del histograma (mismos buckets que /metrics)
+        "stages": stage_percentiles(),
+        "events": dict(action_engine.events),
+        "notifications": dict(bot.notifications),
+        "alarms_scheduled": dict(scheduler.scheduled),
+        "best_shot": pipeline.best_shots.stats(),
+        "crop_writer": pipeline.crop_writer.stats(),
+        "duplicates_suppressed": pipeline.recent_dupes.stats()["suppressed"],
+        "event_store": pipeline.event_store.stats() if pipeline.event_store else None,
+        "errors": dict(errors),
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    if not args.keep_crops:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,9 +4,10 @@ Maneja clasificación guiada de elementos desconocidos.
 """
 import os
 import sys
+import ipaddress
 import shutil
 from pathlib import Path
-from flask import Flask, request
+from flask import Flask, request, jsonify
 from twilio.twiml.messaging_response import MessagingResponse
 import yaml
 import time
@@ -14,25 +15,35 @@ import time
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from src.actions.whatsapp_bot import WhatsAppBot
-from src.vision.image_quality import is_good
+from src.vision.image_quality import evaluate_batch
 from src.core.capture_session import start_session
+from src.core.capture_index import CaptureIndex
+from src.core.job_queue import JobQueue
+from src.core.control import ControlClient, ControlError, CONTROL_SOCKET
+from src.core.conversation_store import build_conversation_store
+
+ROOT = Path(__file__).parent.parent
 
 app = Flask(__name__)
 
-# Estado conversacional (en producción usar Redis/DB)
-# Estructura: {phone_number: {step, category, filename, camera_ip, data}}
-conversation_state = {}
+# Índice SQLite de capturas unknown (lo escribe main.py al guardar cada recorte)
+capture_index = CaptureIndex(ROOT / "data" / "captures.db")
 
-def _parse_camera_ip_from_filename(name: str) -> str:
-    # name format: YYYYMMDD_HHMMSS_192_168_1_100.jpg
-    parts = name.split("_")
-    if len(parts) >= 6:
-        ip_parts = parts[-4:]
-        last = ip_parts[-1]
-        if "." in last:
-            ip_parts[-1] = last.split(".")[0]
-        return ".".join(ip_parts)
-    return "unknown"
+# Trabajo pesado (mover archivos, Twilio, alarma) fuera del request:
+# el handler solo actualiza el estado, encola y responde TwiML de inmediato
+jobs = JobQueue(workers=2)
+jobs.start()
+
+with open('config/settings.yaml', 'r', encoding='utf-8') as f:
+    settings = yaml.safe_load(f) or {}
+
+# Canal de control hacia el servicio NVR en ejecución (alarma, sesiones, galerías)
+control = ControlClient(settings.get('control', {}).get('socket_path', CONTROL_SOCKET))
+
+# Estado conversacional con expiración por TTL; backend "sqlite" compartido entre
+# workers (gunicorn -w N) o "memory" para un solo proceso
+# Estructura por número: {step, category, name, camera_ip, ...}
+conversation_state = build_conversation_store(settings.get('webhook', {}))
 
 # Cargar WhatsApp bot para enviar respuestas
 with open('config/secrets.yaml', 'r', encoding='utf-8') as f:
@@ -78,52 +89,52 @@ def move_recent_captures(category: str, base_name: str, time_window_seconds: int
     Returns:
         Número de imágenes movidas
     """
-    base_dir = Path(__file__).parent.parent / "data" / category
-    unknown_dir = base_dir / "unknown"
-    
-    if not unknown_dir.exists():
-        return 0
-    
-    # Obtener todas las imágenes unknown ordenadas por fecha (más recientes primero)
-    unknowns = sorted(unknown_dir.glob("*.jpg"), key=lambda p: p.stat().st_mtime, reverse=True)
+    base_dir = ROOT / "data" / category
 
     # Filtrar por IP de cámara derivada del base_name para evitar mezclar cámaras
     # base_name ejemplo: juan_masculino_192_168_1_100.png
     parts = base_name.split("_")
-    ip_token = None
+    camera_ip = None
     if len(parts) >= 4:
         ip_parts = parts[-4:]
         # El último trae extensión .png
         ip_parts[-1] = ip_parts[-1].split(".")[0]
-        ip_token = "_".join(ip_parts)
-    if ip_token:
-        unknowns = [p for p in unknowns if p.name.endswith(f"{ip_token}.jpg")]
-    
-    if not unknowns:
+        try:
+            camera_ip = str(ipaddress.ip_address(".".join(ip_parts)))
+        except ValueError:
+            camera_ip = None
+
+    # Ráfaga más reciente (ventana relativa a la última captura), consulta indexada
+    rows = capture_index.recent(category, camera_ip, window_sec=time_window_seconds, limit=max_images)
+    if not rows:
         return 0
     
-    # Obtener timestamp de la imagen más reciente
-    latest_time = unknowns[0].stat().st_mtime
-    
-    # Filtrar imágenes dentro de la ventana temporal
-    recent_images = []
-    for img in unknowns:
-        if (latest_time - img.stat().st_mtime) <= time_window_seconds:
-            recent_images.append(img)
-        else:
-            break  # Ya que están ordenadas, no hay más recientes
-        
-        if len(recent_images) >= max_images:
-            break
-    
     # Crear carpeta en known
     name_prefix = base_name.split('_')[0]
     known_dir = base_dir / "known" / name_prefix
     known_dir.mkdir(parents=True, exist_ok=True)
     
+    def _resolve(row) -> Path:
+        img = Path(row["path"])
+        return img if img.is_absolute() else ROOT / img
+
+    # Calidad: usar la evaluación guardada en el índice; las que no la tengan
+    # se decodifican y evalúan juntas en un solo lote
+    unscored = [row for row in rows if row["quality_ok"] is None and _resolve(row).exists()]
+    if unscored:
+        import cv2
+        scores = evaluate_batch([cv2.imread(str(_resolve(row))) for row in unscored], category)
+        for row, score in zip(unscored, scores):
+            row["quality_ok"] = bool(score["ok"])
+
     # Mover todas las imágenes recientes con nombres secuenciales
     moved_count = 0
-    for idx, img in enumerate(recent_images, start=1):
+    handled = []
+    for idx, row in enumerate(rows, start=1):
+        img = _resolve(row)
+        handled.append(row["path"])
+        if not img.exists():
+            continue
         # Agregar índice al nombre para evitar colisiones
         name_parts = base_name.rsplit('.', 1)
         if len(name_parts) == 2:
@@ -134,10 +145,7 @@ def move_recent_captures(category: str, base_name: str, time_window_seconds: int
         dest_file = known_dir / new_name
         
         try:
-            # Cargar y filtrar por calidad
-            import cv2
-            image = cv2.imread(str(img))
-            if image is None or not is_good(image, category):
+            if not row["quality_ok"]:
                 # descartar sin mover si no cumple calidad
                 img.unlink()
                 continue
@@ -148,11 +156,24 @@ def move_recent_captures(category: str, base_name: str, time_window_seconds: int
             print(f"Error moviendo {img}: {e}")
             continue
     
+    capture_index.remove(handled)
+    # Sacarlas también del índice de atributos del servicio (búsquedas por color)
+    try:
+        control.call("forget_captures", paths=handled)
+    except ControlError as e:
+        print(f"No se pudieron descartar atributos de capturas movidas: {e}")
     return moved_count
 
 
 def trigger_alarm():
     """Activa la alarma inmediatamente para desconocidos."""
+    # Preferir el motor Tuya ya conectado del servicio principal
+    try:
+        control.call("trigger_alarm", target="alarm", seconds=15)
+        return
+    except ControlError as e:
+        print(f"Canal de control no disponible, usando Tuya directo: {e}")
+
     # Importar TuyaActionEngine y disparar alarma
     from src.core.config import Config
     from src.actions.tuya import TuyaActionEngine
@@ -171,6 +192,54 @@ def trigger_alarm():
     })
 
 
+def find_pending_alarm(replied_sid: str = None):
+    """
+    Alarma diferida de la alerta a la que responde el usuario: la del mensaje
+    citado (OriginalRepliedMessageSid) o, sin cita, la única pendiente.
+    None si no hay ninguna o hay varias y no se puede saber cuál.
+    """
+    try:
+        return control.call("find_alarm", ref=replied_sid)
+    except ControlError as e:
+        print(f"No se pudo consultar la alarma pendiente: {e}")
+        return None
+
+
+def cancel_pending_alarm(action_id: int):
+    """Cancela solo la alarma diferida de esa alerta: el usuario indicó que es conocida."""
+    try:
+        control.call("cancel_alarm", action_id=action_id)
+    except ControlError as e:
+        print(f"No se pudo cancelar la alarma pendiente: {e}")
+
+
+def save_known_job(category: str, base_name: str, camera_ip: str, entity_type: str, details: dict) -> int:
+    """
+    Trabajo en segundo plano: mueve las capturas recientes a known/, inicia la
+    sesión de captura dinámica y confirma por WhatsApp.
+    """
+    # Mover múltiples capturas de los últimos 30 segundos (máximo 10 imágenes)
+    moved_count = move_recent_captures(category, base_name, time_window_seconds=30, max_images=10)
+
+    # Iniciar sesión de captura dinámica mientras la cámara siga viendo al objeto
+    # Derivar camera_ip desde la última captura unknown si no está en estado
+    if camera_ip == "unknown":
+        camera_ip = capture_index.latest_camera(category) or camera_ip
+    try:
+        control.call("start_session", category=category, camera_ip=camera_ip, base_name=base_name, ttl_sec=10, max_images=50)
+        # Enrolar de inmediato las imágenes movidas, sin esperar el escaneo periódico
+        control.call("reload_gallery", category=category)
+    except ControlError:
+        start_session(category, camera_ip, base_name, ttl_sec=10, max_images=50)
+
+    if moved_count > 0:
+        whatsapp_bot.send_confirmation(entity_type, details)
+        whatsapp_bot.send_text(f"✅ Se guardaron {moved_count} imágenes para entrenamiento.")
+    else:
+        whatsapp_bot.send_text("❌ Error al guardar. No se encontraron imágenes recientes.")
+    return moved_count
+
+
 @app.route("/whatsapp", methods=["POST"])
 def whatsapp_webhook():
     """Recibe mensajes de WhatsApp y maneja flujo conversacional."""
@@ -185,26 +254,48 @@ def whatsapp_webhook():
         return str(resp)
     
     # Obtener o crear estado de conversación
-    state = conversation_state.get(from_number, {})
+    state = conversation_state.get(from_number) or {}
+    expected_step = state.get("step")
+
+    # Los trabajos se encolan solo si la transición de estado gana (compare-and-set):
+    # si otro worker ya procesó una respuesta de esta conversación, no se duplican
+    deferred = []
+
+    def defer(name, fn, *args, **kwargs):
+        deferred.append((name, fn, args, kwargs))
+
+    def commit(new_state):
+        if not conversation_state.compare_and_set(from_number, expected_step, new_state):
+            busy = MessagingResponse()
+            busy.message("⏳ Tu respuesta anterior aún se está procesando. Intenta de nuevo.")
+            return str(busy)
+        for name, fn, args, kwargs in deferred:
+            jobs.submit(name, fn, *args, **kwargs)
+        return str(resp)
     
     # PASO 1: Clasificación inicial (Conocido / Desconocido)
     if not state or state.get("step") == "initial":
         if incoming_msg == "1":
-            # Conocido - pedir tipo
-            whatsapp_bot.send_menu("¿Qué tipo de elemento es?", [
+            # Conocido - cancelar la alarma diferida de esa alerta (nunca todas) y pedir tipo
+            alarm = find_pending_alarm(request.values.get("OriginalRepliedMessageSid") or None)
+            if alarm:
+                defer("cancel_alarm", cancel_pending_alarm, alarm["action_id"])
+            else:
+                msg.body("⚠️ No se identificó la alerta; su alarma no se canceló. Si hay varias, responde *1* citando el mensaje de la alerta.")
+            defer("send_menu", whatsapp_bot.send_menu, "¿Qué tipo de elemento es?", [
                 "Persona",
                 "Vehículo",
                 "Mascota"
             ])
             state = {"step": "ask_type"}
-            conversation_state[from_number] = state
-            return str(resp)
+            if alarm and alarm.get("camera_ip"):
+                state["camera_ip"] = alarm["camera_ip"]
+            return commit(state)
         elif incoming_msg == "2":
             # Desconocido - activar alarma
-            trigger_alarm()
+            defer("trigger_alarm", trigger_alarm)
             msg.body("🚨 *Alarma activada* por elemento desconocido.")
-            conversation_state.pop(from_number, None)
-            return str(resp)
+            return commit(None)
         else:
             msg.body("❓ Opción inválida. Responde *1* (Conocido) o *2* (Desconocido).")
             return str(resp)
@@ -215,29 +306,26 @@ def whatsapp_webhook():
             # Persona
             state["category"] = "faces"
             state["step"] = "ask_person_name"
-            whatsapp_bot.send_text("👤 *Persona*\n\n📝 Escribe el nombre de la persona:")
-            conversation_state[from_number] = state
-            return str(resp)
+            defer("send_text", whatsapp_bot.send_text, "👤 *Persona*\n\n📝 Escribe el nombre de la persona:")
+            return commit(state)
         elif incoming_msg == "2":
             # Vehículo
             state["category"] = "vehicles"
             state["step"] = "ask_vehicle_type"
-            whatsapp_bot.send_menu("🚗 *Vehículo*\n\n¿Qué tipo de vehículo es?", [
+            defer("send_menu", whatsapp_bot.send_menu, "🚗 *Vehículo*\n\n¿Qué tipo de vehículo es?", [
                 "Carro",
                 "Bicicleta",
                 "Motocicleta",
                 "Scooter",
                 "Otros"
             ])
-            conversation_state[from_number] = state
-            return str(resp)
+            return commit(state)
         elif incoming_msg == "3":
             # Mascota
             state["category"] = "pets"
             state["step"] = "ask_pet_name"
-            whatsapp_bot.send_text("🐾 *Mascota*\n\n📝 Escribe el nombre de la mascota:")
-            conversation_state[from_number] = state
-            return str(resp)
+            defer("send_text", whatsapp_bot.send_text, "🐾 *Mascota*\n\n📝 Escribe el nombre de la mascota:")
+            return commit(state)
         else:
             msg.body("❓ Opción inválida. Responde *1*, *2* o *3*.")
             return str(resp)
@@ -246,9 +334,8 @@ def whatsapp_webhook():
     elif state.get("step") == "ask_person_name":
         state["name"] = incoming_msg
         state["step"] = "ask_person_gender"
-        whatsapp_bot.send_menu("¿Género?", ["Hombre", "Mujer"])
-        conversation_state[from_number] = state
-        return str(resp)
+        defer("send_menu", whatsapp_bot.send_menu, "¿Género?", ["Hombre", "Mujer"])
+        return commit(state)
     
     elif state.get("step") == "ask_person_gender":
         if incoming_msg == "1":
@@ -263,29 +350,13 @@ def whatsapp_webhook():
         camera_ip = state.get("camera_ip", "unknown")
         base_filename = f"{state['name'].lower().replace(' ', '_')}_{state['gender'].lower()}_{camera_ip.replace('.', '_')}.png"
         
-        # Mover múltiples capturas de los últimos 30 segundos (máximo 10 imágenes)
-        moved_count = move_recent_captures("faces", base_filename, time_window_seconds=30, max_images=10)
-
-        # Iniciar sesión de captura dinámica mientras la cámara siga viendo al objeto
-        # Derivar camera_ip desde la última captura unknown si no está en estado
-        if camera_ip == "unknown":
-            base_dir = Path(__file__).parent.parent / "data" / "faces" / "unknown"
-            unknowns = sorted(base_dir.glob("*.jpg"), key=lambda p: p.stat().st_mtime, reverse=True)
-            if unknowns:
-                camera_ip = _parse_camera_ip_from_filename(unknowns[0].name)
-        start_session("faces", camera_ip, base_filename, ttl_sec=10, max_images=50)
-        
-        if moved_count > 0:
-            whatsapp_bot.send_confirmation("person", {
-                "name": state['name'],
-                "gender": state['gender']
-            })
-            whatsapp_bot.send_text(f"✅ Se guardaron {moved_count} imágenes para entrenamiento.")
-        else:
-            msg.body("❌ Error al guardar. No se encontraron imágenes recientes.")
+        # Mover capturas recientes e iniciar sesión de captura en segundo plano
+        defer("save_known", save_known_job, "faces", base_filename, camera_ip, "person", {
+            "name": state['name'],
+            "gender": state['gender']
+        })
         
-        conversation_state.pop(from_number, None)
-        return str(resp)
+        return commit(None)
     
     # FLUJO VEHÍCULO
     elif state.get("step") == "ask_vehicle_type":
@@ -300,15 +371,13 @@ def whatsapp_webhook():
         if incoming_msg in vehicle_types:
             if incoming_msg == "5":
                 state["step"] = "ask_vehicle_other_type"
-                whatsapp_bot.send_text("📝 Escribe el tipo de vehículo:")
-                conversation_state[from_number] = state
-                return str(resp)
+                defer("send_text", whatsapp_bot.send_text, "📝 Escribe el tipo de vehículo:")
+                return commit(state)
             else:
                 state["vehicle_type"] = vehicle_types[incoming_msg]
                 state["step"] = "ask_vehicle_plate"
-                whatsapp_bot.send_text(f"🚗 {vehicle_types[incoming_msg]}\n\n¿Tiene placa? Si sí, escríbela. Si no, escribe el nombre del propietario:")
-                conversation_state[from_number] = state
-                return str(resp)
+                defer("send_text", whatsapp_bot.send_text, f"🚗 {vehicle_types[incoming_msg]}\n\n¿Tiene placa? Si sí, escríbela. Si no, escribe el nombre del propietario:")
+                return commit(state)
         else:
             msg.body("❓ Opción inválida. Responde *1*, *2*, *3*, *4* o *5*.")
             return str(resp)
@@ -316,9 +385,8 @@ def whatsapp_webhook():
     elif state.get("step") == "ask_vehicle_other_type":
         state["vehicle_type"] = incoming_msg
         state["step"] = "ask_vehicle_plate"
-        whatsapp_bot.send_text("¿Tiene placa? Si sí, escríbela. Si no, escribe el nombre del propietario:")
-        conversation_state[from_number] = state
-        return str(resp)
+        defer("send_text", whatsapp_bot.send_text, "¿Tiene placa? Si sí, escríbela. Si no, escribe el nombre del propietario:")
+        return commit(state)
     
     elif state.get("step") == "ask_vehicle_plate":
         # Determinar si es placa o propietario
@@ -331,36 +399,20 @@ def whatsapp_webhook():
             state["owner"] = incoming_msg
             new_filename = f"{incoming_msg.lower().replace(' ', '_')}_{state['vehicle_type'].lower()}_{state.get('camera_ip', 'unknown').replace('.', '_')}.png"
         
-        # Guardar vehículo con múltiples capturas recientes
-        moved_count = move_recent_captures("vehicles", new_filename, time_window_seconds=30, max_images=10)
-
-        # Iniciar sesión de captura dinámica
-        camera_ip = state.get("camera_ip", "unknown")
-        if camera_ip == "unknown":
-            base_dir = Path(__file__).parent.parent / "data" / "vehicles" / "unknown"
-            unknowns = sorted(base_dir.glob("*.jpg"), key=lambda p: p.stat().st_mtime, reverse=True)
-            if unknowns:
-                camera_ip = _parse_camera_ip_from_filename(unknowns[0].name)
-        start_session("vehicles", camera_ip, new_filename, ttl_sec=10, max_images=50)
-        
-        if moved_count > 0:
-            whatsapp_bot.send_confirmation("vehicle", {
-                "vehicle_type": state['vehicle_type'],
-                "plate": state.get('plate'),
-                "owner": state.get('owner')
-            })
-            whatsapp_bot.send_text(f"✅ Se guardaron {moved_count} imágenes para entrenamiento.")
-        else:
-            msg.body("❌ Error al guardar. No se encontraron imágenes recientes.")
+        # Guardar vehículo con múltiples capturas recientes (en segundo plano)
+        defer("save_known", save_known_job, "vehicles", new_filename, state.get("camera_ip", "unknown"), "vehicle", {
+            "vehicle_type": state['vehicle_type'],
+            "plate": state.get('plate'),
+            "owner": state.get('owner')
+        })
         
-        conversation_state.pop(from_number, None)
-        return str(resp)
+        return commit(None)
     
     # FLUJO MASCOTA
     elif state.get("step") == "ask_pet_name":
         state["name"] = incoming_msg
         state["step"] = "ask_pet_type"
-        whatsapp_bot.send_menu("¿Qué tipo de mascota es?", [
+        defer("send_menu", whatsapp_bot.send_menu, "¿Qué tipo de mascota es?", [
             "Perro",
             "Gato",
             "Gallina",
@@ -368,8 +420,7 @@ def whatsapp_webhook():
             "Cabra",
             "Otros"
         ])
-        conversation_state[from_number] = state
-        return str(resp)
+        return commit(state)
     
     elif state.get("step") == "ask_pet_type":
         pet_types = {
@@ -384,9 +435,8 @@ def whatsapp_webhook():
         if incoming_msg in pet_types:
             if incoming_msg == "6":
                 state["step"] = "ask_pet_other_type"
-                whatsapp_bot.send_text("📝 Escribe el tipo de mascota:")
-                conversation_state[from_number] = state
-                return str(resp)
+                defer("send_text", whatsapp_bot.send_text, "📝 Escribe el tipo de mascota:")
+                return commit(state)
             else:
                 state["pet_type"] = pet_types[incoming_msg]
                 
@@ -394,28 +444,12 @@ def whatsapp_webhook():
                 camera_ip = state.get("camera_ip", "unknown")
                 new_filename = f"{state['name'].lower().replace(' ', '_')}_{state['pet_type'].lower()}_{camera_ip.replace('.', '_')}.png"
                 
-                moved_count = move_recent_captures("pets", new_filename, time_window_seconds=30, max_images=10)
-
-                # Iniciar sesión de captura dinámica
-                cam_ip = state.get("camera_ip", "unknown")
-                if cam_ip == "unknown":
-                    base_dir = Path(__file__).parent.parent / "data" / "pets" / "unknown"
-                    unknowns = sorted(base_dir.glob("*.jpg"), key=lambda p: p.stat().st_mtime, reverse=True)
-                    if unknowns:
-                        cam_ip = _parse_camera_ip_from_filename(unknowns[0].name)
-                start_session("pets", cam_ip, new_filename, ttl_sec=10, max_images=50)
-                
-                if moved_count > 0:
-                    whatsapp_bot.send_confirmation("pet", {
-                        "name": state['name'],
-                        "pet_type": state['pet_type']
-                    })
-                    whatsapp_bot.send_text(f"✅ Se guardaron {moved_count} imágenes para entrenamiento.")
-                else:
-                    msg.body("❌ Error al guardar. No se encontraron imágenes recientes.")
+                defer("save_known", save_known_job, "pets", new_filename, camera_ip, "pet", {
+                    "name": state['name'],
+                    "pet_type": state['pet_type']
+                })
                 
-                conversation_state.pop(from_number, None)
-                return str(resp)
+                return commit(None)
         else:
             msg.body("❓ Opción inválida. Responde *1*, *2*, *3*, *4*, *5* o *6*.")
             return str(resp)
@@ -427,33 +461,22 @@ def whatsapp_webhook():
         camera_ip = state.get("camera_ip", "unknown")
         new_filename = f"{state['name'].lower().replace(' ', '_')}_{state['pet_type'].lower()}_{camera_ip.replace('.', '_')}.png"
         
-        moved_count = move_recent_captures("pets", new_filename, time_window_seconds=30, max_images=10)
-
-        # Iniciar sesión de captura dinámica
-        cam_ip = state.get("camera_ip", "unknown")
-        if cam_ip == "unknown":
-            base_dir = Path(__file__).parent.parent / "data" / "pets" / "unknown"
-            unknowns = sorted(base_dir.glob("*.jpg"), key=lambda p: p.stat().st_mtime, reverse=True)
-            if unknowns:
-                cam_ip = _parse_camera_ip_from_filename(unknowns[0].name)
-        start_session("pets", cam_ip, new_filename, ttl_sec=10, max_images=50)
-        
-        if moved_count > 0:
-            whatsapp_bot.send_confirmation("pet", {
-                "name": state['name'],
-                "pet_type": state['pet_type']
-            })
-            whatsapp_bot.send_text(f"✅ Se guardaron {moved_count} imágenes para entrenamiento.")
-        else:
-            msg.body("❌ Error al guardar. No se encontraron imágenes recientes.")
+        defer("save_known", save_known_job, "pets", new_filename, camera_ip, "pet", {
+            "name": state['name'],
+            "pet_type": state['pet_type']
+        })
         
-        conversation_state.pop(from_number, None)
-        return str(resp)
+        return commit(None)
     
     # Estado desconocido
     msg.body("❓ Estado de conversación inválido. Por favor inicia de nuevo.")
-    conversation_state.pop(from_number, None)
-    return str(resp)
+    return commit(None)
+
+
+@app.route("/jobs", methods=["GET"])
+def jobs_status():
+    """Estado de la cola de trabajos en segundo plano (profundidad, latencias, recientes)."""
+    return jsonify({"stats": jobs.stats(), "recent": jobs.recent()})
 
 
 if __name__ == "__main__":
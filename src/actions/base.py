@@ -6,5 +6,9 @@ class ActionEngine:
     """Abstract base class for action engines."""
     
     def emit(self, event_type: str, payload: Any) -> None:
-        """Emit an event with payload."""
+        """
+        Emit an event with payload.
+        Called from frame threads and the I/O loop, so it must return
+        quickly: engines doing network I/O submit it to the async runtime.
+        """
         raise NotImplementedError
@@ -0,0 +1,73 @@
+"""Delayed action scheduling with cancellation."""
+import itertools
+import threading
+from typing import Any, Dict, Optional
+
+from src.core.async_runtime import AsyncRuntime, get_runtime
+
+from .base import ActionEngine
+
+
+class DelayedActionScheduler:
+    """
+    Fires action_engine.emit(event_type, payload) after a delay.
+    Pending actions can be looked up and cancelled one at a time (e.g. when
+    the owner answers that a detection is known before the alarm goes off).
+    An action may carry a ref, such as the SID of the WhatsApp notification
+    about it, so a reply can be tied back to its own alarm.
+
+    Delays are timers on the shared I/O loop, not a thread per action.
+    """
+
+    def __init__(self, action_engine: ActionEngine, runtime: Optional[AsyncRuntime] = None) -> None:
+        self.action_engine = action_engine
+        self.runtime = runtime or get_runtime()
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def schedule(self, event_type: str, payload: Dict[str, Any], delay: float, ref: Optional[str] = None) -> int:
+        action_id = next(self._ids)
+
+        def _fire() -> None:
+            with self._lock:
+                if self._pending.pop(action_id, None) is None:
+                    return
+            self.action_engine.emit(event_type, payload)
+
+        with self._lock:
+            # Scheduled under the lock so _fire() and cancel() always find the entry
+            self._pending[action_id] = {"timer": self.runtime.call_later(delay, _fire), "event_type": event_type, "camera_ip": payload.get("camera_ip"), "ref": ref}
+        return action_id
+
+    def tag(self, action_id: int, ref: Optional[str]) -> None:
+        """Attach a ref once it is known (e.g. the SID of a notification sent afterwards)."""
+        with self._lock:
+            p = self._pending.get(action_id)
+            if p is not None and ref is not None:
+                p["ref"] = ref
+
+    def find(self, ref: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        The pending action tagged ref. Without ref, the only pending tagged
+        action, or None when there are several (the caller cannot tell which).
+        """
+        with self._lock:
+            tagged = [(i, p) for i, p in self._pending.items() if p["ref"] is not None and (ref is None or p["ref"] == ref)]
+        if len(tagged) != 1:
+            return None
+        action_id, p = tagged[0]
+        return {"action_id": action_id, "event_type": p["event_type"], "camera_ip": p["camera_ip"], "ref": p["ref"]}
+
+    def cancel(self, action_id: int) -> bool:
+        """Cancel one pending action; False if it already fired or was cancelled."""
+        with self._lock:
+            p = self._pending.pop(int(action_id), None)
+        if p is None:
+            return False
+        p["timer"].cancel()
+        return True
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
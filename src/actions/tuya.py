@@ -1,10 +1,7 @@
-from typing import Any, Dict
-import time
+from typing import Any, Dict, Optional
+import asyncio
 
-try:
-    import tinytuya
-except Exception:
-    tinytuya = None
+from src.core.async_runtime import AsyncRuntime, get_runtime
 
 from .base import ActionEngine
 
@@ -25,12 +22,25 @@ class TuyaActionEngine(ActionEngine):
         ip: "192.168.1.51"
         local_key: "..."
         dps: 1
+
+    Commands run on the shared I/O runtime, so emit() returns at once. A
+    pulse on a device that is already pulsing extends its off time instead
+    of stacking another on/off cycle.
     """
 
-    def __init__(self, devices: Dict[str, Dict[str, Any]], default_on_seconds: int = 10) -> None:
+    def __init__(self, devices: Dict[str, Dict[str, Any]], default_on_seconds: int = 10, runtime: Optional[AsyncRuntime] = None) -> None:
         self.default_on_seconds = int(default_on_seconds)
+        self.runtime = runtime or get_runtime()
         self.devices: Dict[str, Any] = {}
-        if tinytuya is None:
+        # Loop-only state: per-device command lock and pulse deadline (loop.time())
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._off_at: Dict[str, float] = {}
+        if not devices:
+            return
+        # Imported only when devices are configured: tinytuya pulls in requests and crypto libraries
+        try:
+            import tinytuya
+        except Exception:
             return
         for name, cfg in devices.items():
             dev = tinytuya.OutletDevice(cfg.get("device_id"), cfg.get("ip"), cfg.get("local_key"))
@@ -46,18 +56,40 @@ class TuyaActionEngine(ActionEngine):
         target = payload.get("target") or payload.get("device") or "light"
         action = payload.get("action") or "pulse"
         seconds = int(payload.get("seconds", self.default_on_seconds))
-        dev = self.devices.get(target)
-        if dev is None:
+        if target not in self.devices:
             return
+        self.runtime.submit(self._apply(target, action, seconds))
+
+    async def _apply(self, target: str, action: str, seconds: int) -> None:
         try:
             if action == "on":
-                dev.set_status(True, dev._dps_index)
+                await self._set(target, True)
             elif action == "off":
-                dev.set_status(False, dev._dps_index)
+                await self._set(target, False)
             elif action == "pulse":
-                dev.set_status(True, dev._dps_index)
-                time.sleep(seconds)
-                dev.set_status(False, dev._dps_index)
+                await self._pulse(target, seconds)
         except Exception:
             # Ignore errors to keep pipeline running
             pass
+
+    async def _pulse(self, target: str, seconds: int) -> None:
+        loop = asyncio.get_running_loop()
+        off_at = loop.time() + seconds
+        if target in self._off_at:
+            self._off_at[target] = max(self._off_at[target], off_at)
+            return
+        self._off_at[target] = off_at
+        try:
+            await self._set(target, True)
+            while self._off_at[target] > loop.time():
+                await asyncio.sleep(self._off_at[target] - loop.time())
+        finally:
+            del self._off_at[target]
+            await self._set(target, False)
+
+    async def _set(self, target: str, on: bool) -> None:
+        # tinytuya is blocking and a device takes one command at a time
+        lock = self._locks.setdefault(target, asyncio.Lock())
+        dev = self.devices[target]
+        async with lock:
+            await self.runtime.run_blocking(dev.set_status, on, dev._dps_index)
@@ -1,25 +1,49 @@
 import os
 import logging
+from concurrent.futures import Future
 from typing import Optional
-from twilio.rest import Client
-from twilio.base.exceptions import TwilioRestException
+
+from src.core.async_runtime import AsyncRuntime, get_runtime
 
 
 class WhatsAppBot:
     """
     Bot de WhatsApp usando Twilio para gestionar elementos desconocidos.
     Envía notificaciones con imágenes y permite comandos para mover a conocidos.
+    Desde los hilos de frames usar notify(): el envío HTTP corre en el
+    runtime de I/O compartido y no bloquea el análisis.
     """
 
-    def __init__(self, account_sid: str, auth_token: str, from_number: str, to_number: str) -> None:
+    def __init__(self, account_sid: str, auth_token: str, from_number: str, to_number: str, runtime: Optional[AsyncRuntime] = None) -> None:
         self.from_number = from_number  # formato: whatsapp:+14155238886
         self.to_number = to_number      # formato: whatsapp:+573001234567
-        self.client = Client(account_sid, auth_token) if account_sid and auth_token else None
+        self.client = None
+        # Errores de Twilio capturados al enviar; vacío mientras no se importe el SDK
+        self._send_errors: tuple = ()
+        if account_sid and auth_token:
+            # Import diferido: sin credenciales el SDK de Twilio no se carga
+            from twilio.rest import Client
+            from twilio.base.exceptions import TwilioRestException
+            self.client = Client(account_sid, auth_token)
+            self._send_errors = (TwilioRestException,)
         self.enabled = self.client is not None
+        self._runtime = runtime
+
+    def notify(self, category: str, image_path: str, camera_ip: str, metadata: dict = None) -> Optional[Future]:
+        """
+        Igual que send_notification() pero sin esperar a Twilio: retorna un
+        Future con el resultado (o None si el bot está desactivado).
+        """
+        if not self.enabled:
+            return None
+        runtime = self._runtime or get_runtime()
+        return runtime.submit(runtime.run_blocking(self.send_notification, category, image_path, camera_ip, metadata))
 
-    def send_notification(self, category: str, image_path: str, camera_ip: str, metadata: dict = None) -> bool:
+    def send_notification(self, category: str, image_path: str, camera_ip: str, metadata: dict = None) -> Optional[str]:
         """
         Envía notificación de elemento desconocido con imagen y menú de opciones.
+        Retorna el SID del mensaje (None si no se envió): las respuestas que
+        lo citan traen ese SID y permiten saber a qué alerta responden.
         
         Args:
             category: 'faces', 'vehicles', 'pets'
@@ -28,7 +52,7 @@ class WhatsAppBot:
             metadata: dict con info adicional (placa, características, etc)
         """
         if not self.enabled:
-            return False
+            return None
         
         category_emoji = {"faces": "👤", "vehicles": "🚗", "pets": "🐾"}
         emoji = category_emoji.get(category, "❓")
@@ -48,7 +72,8 @@ class WhatsAppBot:
                 if "dominant_hue" in features:
                     msg_parts.append(f"🎨 Color HSV: {features['dominant_hue']}, {features['dominant_saturation']}, {features['dominant_value']}")
         
-        if image_path and os.path.exists(image_path):
+        # La ruta puede seguir en cola de escritura (CropWriter), no exigir que exista
+        if image_path:
             filename = os.path.basename(image_path)
             msg_parts.append(f"\n_Archivo: {filename}_")
         
@@ -61,7 +86,7 @@ class WhatsAppBot:
         
         try:
             # Enviar con o sin imagen según disponibilidad
-            if image_path and os.path.exists(image_path):
+            if image_path:
                 # Nota: file:// no funciona con Twilio
                 # En producción, subir a servidor/S3 y usar URL pública
                 # Por ahora, enviar solo texto
@@ -77,10 +102,10 @@ class WhatsAppBot:
                     body=message_body
                 )
             logging.info(f"WhatsApp notification sent: {message.sid}")
-            return True
-        except TwilioRestException as e:
+            return message.sid
+        except self._send_errors as e:
             logging.error(f"WhatsApp send failed: {e}")
-            return False
+            return None
 
     def send_confirmation(self, entity_type: str, details: dict) -> bool:
         """Envía confirmación personalizada según el tipo de entidad guardada."""
@@ -106,7 +131,7 @@ class WhatsAppBot:
                 body=msg
             )
             return True
-        except TwilioRestException as e:
+        except self._send_errors as e:
             logging.error(f"WhatsApp confirmation failed: {e}")
             return False
     
@@ -124,7 +149,7 @@ class WhatsAppBot:
                 body="\n".join(msg_parts)
             )
             return True
-        except TwilioRestException as e:
+        except self._send_errors as e:
             logging.error(f"WhatsApp menu send failed: {e}")
             return False
     
@@ -139,7 +164,7 @@ class WhatsAppBot:
                 body=text
             )
             return True
-        except TwilioRestException as e:
+        except self._send_errors as e:
             logging.error(f"WhatsApp text send failed: {e}")
             return False
 
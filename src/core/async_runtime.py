@@ -0,0 +1,130 @@
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Optional
+
+
+class TimerHandle:
+    """Thread-safe handle of a callback scheduled with AsyncRuntime.call_later()."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self.cancelled = False
+
+    def _schedule(self, delay: float, fn: Callable, args: tuple) -> None:
+        # Runs on the loop; a cancel() issued before this point wins
+        if not self.cancelled:
+            self._handle = self._loop.call_later(delay, fn, *args)
+
+    def _cancel(self) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+
+    def cancel(self) -> None:
+        self.cancelled = True
+        try:
+            self._loop.call_soon_threadsafe(self._cancel)
+        except RuntimeError:
+            # Loop already closed: nothing left to fire
+            pass
+
+
+class AsyncRuntime:
+    """
+    One asyncio event loop in a daemon thread that owns the service's
+    network I/O: camera discovery probes, device commands, notifications
+    and delayed actions.
+
+    Other threads never block on it: submit() hands over a coroutine and
+    returns a concurrent.futures.Future, call_later() schedules a callback
+    and returns a cancellable handle. Client libraries without an asyncio
+    API (tinytuya, the Twilio SDK) go through run_blocking(), which uses a
+    small bounded executor shared by all of them instead of a thread per
+    call.
+    """
+
+    def __init__(self, blocking_workers: int = 4, name: str = "io-loop") -> None:
+        self.name = name
+        self.loop = asyncio.new_event_loop()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, int(blocking_workers)), thread_name_prefix="io-blocking")
+        self.loop.set_default_executor(self._executor)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+            # Let cancelled tasks run their finally blocks (e.g. switch a pulsed device off)
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        finally:
+            self.loop.close()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        thread.join(timeout)
+        self._executor.shutdown(wait=False)
+
+    def in_loop(self) -> bool:
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coro: Awaitable) -> concurrent.futures.Future:
+        """Run coro on the loop from any thread."""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        future.add_done_callback(_log_failure)
+        return future
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None) -> Any:
+        """Run coro on the loop and wait for its result (not from the loop thread)."""
+        if self.in_loop():
+            raise RuntimeError("AsyncRuntime.run() called from the loop thread; await the coroutine instead")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def call_later(self, delay: float, fn: Callable, *args) -> TimerHandle:
+        """Call fn(*args) on the loop after delay seconds; replaces threading.Timer."""
+        handle = TimerHandle(self.loop)
+        self.loop.call_soon_threadsafe(handle._schedule, max(0.0, float(delay)), fn, args)
+        return handle
+
+    async def run_blocking(self, fn: Callable, *args, **kwargs) -> Any:
+        """Await a blocking call on the shared executor (libraries with no asyncio API)."""
+        return await self.loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+
+def _log_failure(future: concurrent.futures.Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        logging.error(f"I/O task failed: {future.exception()!r}")
+
+
+_runtime: Optional[AsyncRuntime] = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime() -> AsyncRuntime:
+    """Process-wide runtime, started on first use."""
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                runtime = AsyncRuntime()
+                runtime.start()
+                _runtime = runtime
+    return _runtime
@@ -0,0 +1,264 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from src.vision.appearance import HIST_BINS, color_fraction, color_histogram, histogram_similarity
+
+ATTRIBUTES_DIR = Path("data/attributes")
+CATEGORIES = ("faces", "vehicles", "pets")
+NAME_BYTES = 64
+
+# Column -> (dtype, per-row shape); one memory-mapped file per column
+COLUMNS: Dict[str, Tuple[str, tuple]] = {
+    "ts": ("f8", ()),
+    "camera": ("u2", ()),
+    "category": ("u1", ()),
+    "width": ("u2", ()),
+    "height": ("u2", ()),
+    "hist": ("u1", (HIST_BINS,)),
+    "name": (f"S{NAME_BYTES}", ()),
+    "deleted": ("u1", ()),
+}
+
+
+class AttributeStore:
+    """
+    Columnar appearance attributes of every saved unknown crop.
+
+    One memory-mapped NumPy file per column under base_dir (ts, camera,
+    category, size, colour histogram, file name), plus meta.json with the
+    row count and the camera code table. A search only touches the columns
+    it filters on, so scanning millions of rows is a few vectorized passes
+    over a few MB; time ranges use a binary search on ts while rows are
+    appended in time order.
+
+    Rows are appended by the crop writer thread; readers take a snapshot of
+    the row count and never see partially written rows.
+
+    Rows are never removed, only tombstoned in the deleted column: forget()
+    is called when retention deletes a crop or the webhook moves it to
+    known/. As a backstop, search() and similar() tombstone and skip any
+    result whose file is gone.
+    """
+
+    def __init__(self, base_dir=ATTRIBUTES_DIR, crops_dir: str = "data", initial_capacity: int = 65536, flush_every: int = 64) -> None:
+        self.base_dir = Path(base_dir)
+        self.crops_dir = crops_dir
+        self.flush_every = max(1, int(flush_every))
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        meta = self._load_meta()
+        self.count = int(meta.get("count", 0))
+        self.cameras: List[str] = list(meta.get("cameras", []))
+        self._camera_codes = {ip: i for i, ip in enumerate(self.cameras)}
+        self.time_ordered = bool(meta.get("time_ordered", True))
+        self.capacity = max(int(meta.get("capacity", 0)), int(initial_capacity), self.count)
+        self._cols = self._open_columns(self.capacity)
+        self._unflushed = 0
+
+    def _load_meta(self) -> Dict:
+        try:
+            with open(self.base_dir / "meta.json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _open_columns(self, capacity: int) -> Dict[str, np.memmap]:
+        cols = {}
+        for name, (dtype, shape) in COLUMNS.items():
+            path = self.base_dir / f"{name}.bin"
+            nbytes = capacity * int(np.dtype(dtype).itemsize * int(np.prod(shape, dtype=np.int64)))
+            # Grow (or create) the file in place; existing rows keep their offsets
+            with open(path, "ab") as f:
+                if f.tell() < nbytes:
+                    f.truncate(nbytes)
+            cols[name] = np.memmap(path, dtype=dtype, mode="r+", shape=(capacity,) + shape)
+        return cols
+
+    def _camera_code(self, camera_ip: str) -> int:
+        code = self._camera_codes.get(camera_ip)
+        if code is None:
+            code = len(self.cameras)
+            self.cameras.append(camera_ip)
+            self._camera_codes[camera_ip] = code
+        return code
+
+    def add(self, category: str, camera_ip: str, ts: float, crop: np.ndarray, path: str) -> int:
+        """Append one saved crop; returns its row number."""
+        hist = color_histogram(crop)
+        height, width = crop.shape[:2] if crop is not None else (0, 0)
+        name = os.path.basename(str(path)).encode("utf-8")[:NAME_BYTES]
+        with self._lock:
+            if self.count >= self.capacity:
+                self._flush_locked()
+                self.capacity *= 2
+                self._cols = self._open_columns(self.capacity)
+            row = self.count
+            cols = self._cols
+            if row and ts < cols["ts"][row - 1]:
+                self.time_ordered = False
+            cols["ts"][row] = ts
+            cols["camera"][row] = self._camera_code(camera_ip)
+            cols["category"][row] = CATEGORIES.index(category) if category in CATEGORIES else 255
+            cols["width"][row] = min(int(width), 65535)
+            cols["height"][row] = min(int(height), 65535)
+            cols["hist"][row] = hist
+            cols["name"][row] = name
+            cols["deleted"][row] = 0
+            self.count = row + 1
+            self._unflushed += 1
+            if self._unflushed >= self.flush_every:
+                self._flush_locked()
+        return row
+
+    def forget(self, paths: Iterable[str]) -> int:
+        """Tombstone the rows of crops that were deleted or moved; returns how many."""
+        names = np.array([os.path.basename(str(p)).encode("utf-8")[:NAME_BYTES] for p in paths], dtype=f"S{NAME_BYTES}")
+        if not names.size:
+            return 0
+        with self._lock:
+            count, cols = self.count, self._cols
+            hit = np.flatnonzero(np.isin(cols["name"][:count], names) & (cols["deleted"][:count] == 0))
+            if hit.size:
+                cols["deleted"][hit] = 1
+                self._flush_locked()
+        return int(hit.size)
+
+    def _prune_missing(self, rows: List[dict]) -> bool:
+        """Tombstone result rows whose file no longer exists; True if any was."""
+        missing = [r["row"] for r in rows if not os.path.exists(r["path"])]
+        if not missing:
+            return False
+        with self._lock:
+            self._cols["deleted"][np.asarray(missing, dtype=np.int64)] = 1
+            self._unflushed += 1
+        return True
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        for col in self._cols.values():
+            col.flush()
+        meta = {"count": self.count, "capacity": self.capacity, "cameras": self.cameras, "time_ordered": self.time_ordered}
+        tmp = self.base_dir / "meta.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self.base_dir / "meta.json")
+        self._unflushed = 0
+
+    def _candidates(self, category: Optional[str], camera_ip: Optional[str], start_ts: Optional[float], end_ts: Optional[float], min_size: int) -> Tuple[np.ndarray, Dict[str, np.memmap]]:
+        """Row numbers passing the cheap column filters."""
+        with self._lock:
+            count, cols = self.count, self._cols
+            camera_code = self._camera_codes.get(camera_ip) if camera_ip else None
+            time_ordered = self.time_ordered
+        if camera_ip and camera_code is None:
+            return np.empty(0, dtype=np.int64), cols
+        lo, hi = 0, count
+        ts = cols["ts"][:count]
+        if time_ordered:
+            if start_ts is not None:
+                lo = int(np.searchsorted(ts, start_ts, side="left"))
+            if end_ts is not None:
+                hi = int(np.searchsorted(ts, end_ts, side="left"))
+        mask = cols["deleted"][lo:hi] == 0
+        if not time_ordered:
+            if start_ts is not None:
+                mask &= ts[lo:hi] >= start_ts
+            if end_ts is not None:
+                mask &= ts[lo:hi] < end_ts
+        if category:
+            mask &= cols["category"][lo:hi] == (CATEGORIES.index(category) if category in CATEGORIES else 255)
+        if camera_code is not None:
+            mask &= cols["camera"][lo:hi] == camera_code
+        if min_size:
+            mask &= np.minimum(cols["width"][lo:hi], cols["height"][lo:hi]) >= min_size
+        return np.flatnonzero(mask) + lo, cols
+
+    def _rows(self, idx: np.ndarray, cols: Dict[str, np.memmap], score_name: Optional[str] = None, scores: Optional[np.ndarray] = None) -> List[dict]:
+        result = []
+        for i, row in enumerate(idx):
+            category_code = int(cols["category"][row])
+            category = CATEGORIES[category_code] if category_code < len(CATEGORIES) else None
+            name = cols["name"][row].decode("utf-8", errors="ignore")
+            item = {
+                "row": int(row),
+                "ts": float(cols["ts"][row]),
+                "camera_ip": self.cameras[int(cols["camera"][row])],
+                "category": category,
+                "width": int(cols["width"][row]),
+                "height": int(cols["height"][row]),
+                "path": os.path.join(self.crops_dir, category or "", "unknown", name),
+            }
+            if score_name is not None:
+                item[score_name] = round(float(scores[i]), 3)
+            result.append(item)
+        return result
+
+    def search(self, category: Optional[str] = None, camera_ip: Optional[str] = None, start_ts: Optional[float] = None, end_ts: Optional[float] = None, color: Optional[str] = None, min_fraction: float = 0.3, min_size: int = 0, limit: int = 50) -> List[dict]:
+        """
+        E.g. search("vehicles", "192.168.1.100", yesterday, today, color="red").
+        With a colour, results are the best colour matches first; otherwise
+        newest first.
+        """
+        return self._existing(lambda: self._search(category, camera_ip, start_ts, end_ts, color, min_fraction, min_size, limit))
+
+    def _existing(self, run) -> List[dict]:
+        # A pass that hit deleted files is rerun once they are tombstoned, so limit still holds
+        for _ in range(3):
+            rows = run()
+            if not self._prune_missing(rows):
+                return rows
+        return [r for r in run() if os.path.exists(r["path"])]
+
+    def _search(self, category, camera_ip, start_ts, end_ts, color, min_fraction, min_size, limit) -> List[dict]:
+        idx, cols = self._candidates(category, camera_ip, start_ts, end_ts, min_size)
+        limit = max(1, int(limit))
+        if color is None:
+            idx = idx[::-1][:limit]
+            return self._rows(idx, cols)
+        fraction = color_fraction(self._take(cols["hist"], idx), color)
+        keep = fraction >= float(min_fraction)
+        idx, fraction = idx[keep], fraction[keep]
+        order = self._top(fraction, limit)
+        return self._rows(idx[order], cols, "color_fraction", fraction[order])
+
+    def similar(self, image: np.ndarray, category: Optional[str] = None, camera_ip: Optional[str] = None, start_ts: Optional[float] = None, end_ts: Optional[float] = None, limit: int = 10, min_similarity: float = 0.0) -> List[dict]:
+        """Crops whose colour histogram best matches image's, most similar first."""
+        query = color_histogram(image)
+
+        def run() -> List[dict]:
+            idx, cols = self._candidates(category, camera_ip, start_ts, end_ts, 0)
+            similarity = histogram_similarity(self._take(cols["hist"], idx), query)
+            keep = similarity >= float(min_similarity)
+            idx, similarity = idx[keep], similarity[keep]
+            order = self._top(similarity, max(1, int(limit)))
+            return self._rows(idx[order], cols, "similarity", similarity[order])
+
+        return self._existing(run)
+
+    @staticmethod
+    def _take(col: np.memmap, idx: np.ndarray) -> np.ndarray:
+        # A contiguous run (no camera/category filter) is read as a view, not copied
+        if idx.size and int(idx[-1]) - int(idx[0]) + 1 == idx.size:
+            return col[int(idx[0]):int(idx[-1]) + 1]
+        return col[idx]
+
+    @staticmethod
+    def _top(scores: np.ndarray, limit: int) -> np.ndarray:
+        """Indices of the limit highest scores, highest first (argpartition, not a full sort)."""
+        if scores.size > limit:
+            part = np.argpartition(-scores, limit - 1)[:limit]
+            return part[np.argsort(-scores[part], kind="stable")]
+        return np.argsort(-scores, kind="stable")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            deleted = int(np.count_nonzero(self._cols["deleted"][:self.count]))
+        return {"rows": self.count, "deleted": deleted, "capacity": self.capacity, "cameras": len(self.cameras)}
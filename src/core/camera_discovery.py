@@ -1,7 +1,9 @@
+import asyncio
 import socket
-import time
 import ipaddress
-from typing import List, Set
+from typing import List, Optional, Set
+
+from .async_runtime import AsyncRuntime, get_runtime
 
 WS_DISCOVERY_ADDR = "239.255.255.250"
 WS_DISCOVERY_PORT = 3702
@@ -49,54 +51,84 @@ def _parse_ips(raw_xml: bytes) -> Set[str]:
     return ips
 
 
+class _ProbeReplies(asyncio.DatagramProtocol):
+    def __init__(self) -> None:
+        self.ips: Set[str] = set()
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.ips.update(_parse_ips(data))
+
+
 class CameraDiscovery:
-    def __init__(self, scan_subnets: List[str], ws_enabled: bool = True, timeout: float = 2.0) -> None:
+    """
+    WS-Discovery multicast plus RTSP port probes over the configured subnets.
+
+    All probes are coroutines on the shared I/O runtime: the multicast
+    listen window and the whole subnet scan (bounded concurrency) overlap
+    instead of running one blocking socket at a time. discover_ips() keeps
+    the synchronous API for the camera manager thread.
+    """
+
+    def __init__(self, scan_subnets: List[str], ws_enabled: bool = True, timeout: float = 2.0, runtime: Optional[AsyncRuntime] = None, max_concurrent_probes: int = 64) -> None:
         self.scan_subnets = scan_subnets
         self.ws_enabled = ws_enabled
         self.timeout = timeout
+        self.runtime = runtime or get_runtime()
+        self.max_concurrent_probes = max(1, int(max_concurrent_probes))
 
     def discover_ips(self) -> Set[str]:
-        ips: Set[str] = set()
+        return self.runtime.run(self.discover_ips_async())
+
+    async def discover_ips_async(self) -> Set[str]:
+        probes = [self._scan_rtsp_subnet(subnet) for subnet in self.scan_subnets or []]
         if self.ws_enabled:
-            ips.update(self._ws_discovery())
-        for subnet in self.scan_subnets or []:
-            ips.update(self._scan_rtsp_subnet(subnet))
+            probes.append(self._ws_discovery())
+        ips: Set[str] = set()
+        for found in await asyncio.gather(*probes):
+            ips.update(found)
         return ips
 
-    def _ws_discovery(self) -> Set[str]:
-        ips: Set[str] = set()
+    async def _ws_discovery(self) -> Set[str]:
+        loop = asyncio.get_running_loop()
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
+        sock.setblocking(False)
         try:
-            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
-            sock.settimeout(self.timeout)
-            sock.sendto(WS_PROBE.encode("utf-8"), (WS_DISCOVERY_ADDR, WS_DISCOVERY_PORT))
-            start = time.time()
-            while time.time() - start < self.timeout:
-                try:
-                    data, _ = sock.recvfrom(65535)
-                    ips.update(_parse_ips(data))
-                except socket.timeout:
-                    break
-        finally:
+            transport, replies = await loop.create_datagram_endpoint(_ProbeReplies, sock=sock)
+        except OSError:
             sock.close()
-        return ips
+            return set()
+        try:
+            transport.sendto(WS_PROBE.encode("utf-8"), (WS_DISCOVERY_ADDR, WS_DISCOVERY_PORT))
+            # Replies arrive through the protocol while the loop serves other work
+            await asyncio.sleep(self.timeout)
+        finally:
+            transport.close()
+        return replies.ips
 
-    def _scan_rtsp_subnet(self, cidr: str) -> Set[str]:
-        ips: Set[str] = set()
+    async def _scan_rtsp_subnet(self, cidr: str) -> Set[str]:
         try:
             network = ipaddress.ip_network(cidr, strict=False)
         except ValueError:
-            return ips
-        for ip in network.hosts():
-            ip_str = str(ip)
-            if self._is_port_open(ip_str, 554, 0.3):
-                ips.add(ip_str)
-        return ips
+            return set()
+        slots = asyncio.Semaphore(self.max_concurrent_probes)
+
+        async def probe(ip_str: str) -> Optional[str]:
+            async with slots:
+                return ip_str if await self._is_port_open(ip_str, 554, 0.3) else None
+
+        found = await asyncio.gather(*(probe(str(ip)) for ip in network.hosts()))
+        return {ip for ip in found if ip}
 
     @staticmethod
-    def _is_port_open(host: str, port: int, timeout: float) -> bool:
+    async def _is_port_open(host: str, port: int, timeout: float) -> bool:
         try:
-            with socket.create_connection((host, port), timeout=timeout):
-                return True
-        except Exception:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        except (OSError, asyncio.TimeoutError):
             return False
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return True
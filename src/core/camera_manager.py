@@ -1,15 +1,18 @@
 import threading
 import time
-from typing import Dict, Set, List, Optional
+from typing import Dict, Set, List, Optional, Union
 import cv2
 
 from .camera_discovery import CameraDiscovery
+from .camera_source import FrameSource, RtspSource, StaticCameraList
+from .load_governor import LoadGovernor
 from .stream_worker import StreamWorker
 
 
 class CameraManager:
-    def __init__(self, discovery: CameraDiscovery, rtsp_paths: List[str], credentials: Dict[str, str], on_frame) -> None:
+    def __init__(self, discovery: Union[CameraDiscovery, StaticCameraList], rtsp_paths: List[str], credentials: Dict[str, str], on_frame, governor: Optional[LoadGovernor] = None) -> None:
         self.discovery = discovery
+        self.governor = governor
         self.rtsp_paths = rtsp_paths
         self.credentials = credentials
         self.on_frame = on_frame
@@ -50,6 +53,15 @@ class CameraManager:
                 return url
         return None
 
+    def _select_source(self, ip: str) -> Optional[FrameSource]:
+        # Static lists may pin a URL or a synthetic (file-backed) camera
+        if isinstance(self.discovery, StaticCameraList):
+            source = self.discovery.source_for(ip)
+            if source is not None:
+                return source
+        rtsp = self._select_rtsp(ip)
+        return RtspSource(rtsp) if rtsp else None
+
     def start(self, interval_sec: int = 20) -> None:
         threading.Thread(target=self._discovery_loop, args=(interval_sec,), daemon=True).start()
 
@@ -65,13 +77,15 @@ class CameraManager:
             if ip not in ips:
                 w = self.workers.pop(ip)
                 w.stop()
+                if self.governor is not None:
+                    self.governor.forget(ip)
         # Start workers for new cameras
         for ip in ips:
             if ip not in self.workers:
-                rtsp = self._select_rtsp(ip)
-                if not rtsp:
+                source = self._select_source(ip)
+                if source is None:
                     continue
-                worker = StreamWorker(ip, rtsp, self.on_frame, threading.Event())
+                worker = StreamWorker(ip, source, self.on_frame, threading.Event(), governor=self.governor)
                 self.workers[ip] = worker
                 worker.start()
 
@@ -0,0 +1,167 @@
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import cv2
+
+from src.vision.gallery_cache import IMAGE_EXTENSIONS
+
+
+class FrameSource:
+    """
+    Where a StreamWorker reads frames from.
+
+    Mirrors the cv2.VideoCapture calls the worker uses: grab() advances to
+    the next frame (blocking until it is due), retrieve() decodes it.
+    """
+
+    def open(self) -> bool:
+        raise NotImplementedError
+
+    def grab(self) -> bool:
+        raise NotImplementedError
+
+    def retrieve(self) -> Tuple[bool, Optional[object]]:
+        raise NotImplementedError
+
+    def release(self) -> None:
+        pass
+
+
+class RtspSource(FrameSource):
+    """A live camera stream (any URL cv2.VideoCapture understands)."""
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.cap: Optional[cv2.VideoCapture] = None
+
+    def open(self) -> bool:
+        self.cap = cv2.VideoCapture(self.url)
+        return self.cap.isOpened()
+
+    def grab(self) -> bool:
+        return self.cap.grab()
+
+    def retrieve(self) -> Tuple[bool, Optional[object]]:
+        return self.cap.retrieve()
+
+    def release(self) -> None:
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+class SyntheticSource(FrameSource):
+    """
+    Plays a local video file or image folder as if it were a camera.
+
+    grab() is paced to fps against a fixed schedule (like a camera that
+    pushes frames at its configured rate), the file or folder restarts when
+    it ends if loop is set, and retrieve() resizes frames to width x height
+    so one recording can stand in for cameras of any resolution.
+    """
+
+    def __init__(self, path: str, fps: float = 10.0, width: int = 0, height: int = 0, loop: bool = True) -> None:
+        self.path = Path(path)
+        self.fps = float(fps)
+        self.size = (int(width), int(height)) if width and height else None
+        self.loop = loop
+        self.cap: Optional[cv2.VideoCapture] = None
+        self.images: List[Path] = []
+        self._index = -1
+        self._next_due = 0.0
+
+    def open(self) -> bool:
+        self._next_due = time.monotonic()
+        if self.path.is_dir():
+            self.images = sorted(p for p in self.path.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+            return bool(self.images)
+        self.cap = cv2.VideoCapture(str(self.path))
+        return self.cap.isOpened()
+
+    def _advance(self) -> bool:
+        if self.images:
+            self._index += 1
+            if self._index >= len(self.images):
+                if not self.loop:
+                    return False
+                self._index = 0
+            return True
+        if self.cap.grab():
+            return True
+        if not self.loop:
+            return False
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        return self.cap.grab()
+
+    def grab(self) -> bool:
+        if self.fps > 0:
+            delay = self._next_due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            # If the consumer fell behind, restart the schedule instead of bursting
+            self._next_due = max(self._next_due, time.monotonic() - 1.0 / self.fps) + 1.0 / self.fps
+        return self._advance()
+
+    def retrieve(self) -> Tuple[bool, Optional[object]]:
+        if self.images:
+            frame = cv2.imread(str(self.images[self._index]))
+            ret = frame is not None
+        else:
+            ret, frame = self.cap.retrieve()
+        if ret and self.size is not None and (frame.shape[1], frame.shape[0]) != self.size:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        return ret, frame
+
+    def release(self) -> None:
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+class StaticCameraList:
+    """
+    Fixed camera list used instead of CameraDiscovery (network.static_cameras).
+
+    Each entry is one of:
+    - {"ip": "192.168.1.100"}: a real camera, RTSP URL probed as usual
+    - {"ip": "192.168.1.100", "url": "rtsp://..."}: a real camera, fixed URL
+    - {"id": "sim", "path": "data/test.mp4", "count": 16, "fps": 10,
+       "width": 640, "height": 480}: synthetic cameras sim-1 .. sim-16
+       playing the file (or image folder) in a loop
+    """
+
+    def __init__(self, cameras: List[Dict]) -> None:
+        self.entries: Dict[str, Dict] = {}
+        for entry in cameras or []:
+            name = str(entry.get("ip") or entry.get("id") or "")
+            if not name:
+                logging.warning(f"Static camera without ip/id ignored: {entry}")
+                continue
+            count = int(entry.get("count", 1))
+            if count > 1:
+                for i in range(1, count + 1):
+                    self.entries[f"{name}-{i}"] = entry
+            else:
+                self.entries[name] = entry
+
+    def discover_ips(self) -> Set[str]:
+        return set(self.entries)
+
+    def source_for(self, camera_id: str) -> Optional[FrameSource]:
+        """The source for a listed camera; None means "probe RTSP paths for it"."""
+        entry = self.entries.get(camera_id)
+        if entry is None:
+            return None
+        if entry.get("path"):
+            return SyntheticSource(
+                entry["path"],
+                fps=float(entry.get("fps", 10)),
+                width=int(entry.get("width", 0)),
+                height=int(entry.get("height", 0)),
+                loop=bool(entry.get("loop", True)),
+            )
+        if entry.get("url"):
+            return RtspSource(entry["url"])
+        return None
@@ -0,0 +1,132 @@
+import threading
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+from .sqlite_store import connect
+
+INDEX_DB = Path("data/captures.db")
+
+
+class CaptureIndex:
+    """
+    SQLite index of crops saved under data/<category>/unknown.
+
+    Written by the NVR service when a crop lands on disk, read by the webhook,
+    so "latest N captures from camera X in the last 30 s" is one indexed query
+    instead of a glob + stat() over the whole unknown directory.
+    """
+
+    def __init__(self, db_path=INDEX_DB) -> None:
+        self._lock = threading.Lock()
+        self._conn = connect(db_path)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS captures (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL UNIQUE,
+                category TEXT NOT NULL,
+                camera_ip TEXT NOT NULL,
+                ts REAL NOT NULL,
+                quality REAL,
+                quality_ok INTEGER,
+                track_id INTEGER,
+                size INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_captures_cat_cam_ts ON captures (category, camera_ip, ts);
+            CREATE INDEX IF NOT EXISTS idx_captures_cat_ts ON captures (category, ts);
+            """
+        )
+        self._ensure_columns({"size": "INTEGER"})
+
+    def _ensure_columns(self, columns: dict) -> None:
+        """Add columns introduced after the table was first created."""
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(captures)")}
+        for name, decl in columns.items():
+            if name not in existing:
+                self._conn.execute(f"ALTER TABLE captures ADD COLUMN {name} {decl}")
+
+    def add(self, path: str, category: str, camera_ip: str, ts: float, quality: Optional[float] = None, quality_ok: Optional[bool] = None, track_id: Optional[int] = None, size: Optional[int] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO captures (path, category, camera_ip, ts, quality, quality_ok, track_id, size) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (str(path), category, camera_ip, ts, quality, None if quality_ok is None else int(quality_ok), track_id, size),
+            )
+
+    def remove(self, paths: Iterable[str]) -> None:
+        rows = [(str(p),) for p in paths]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany("DELETE FROM captures WHERE path = ?", rows)
+
+    def recent(self, category: str, camera_ip: Optional[str] = None, window_sec: float = 30, limit: int = 10) -> List[dict]:
+        """
+        Captures within window_sec of the newest one for category (and camera),
+        newest first. Mirrors the webhook's "last burst" semantics.
+        """
+        where = "category = ?" + (" AND camera_ip = ?" if camera_ip else "")
+        args = (category, camera_ip) if camera_ip else (category,)
+        sql = (
+            f"SELECT path, category, camera_ip, ts, quality, quality_ok, track_id FROM captures "
+            f"WHERE {where} AND ts >= (SELECT MAX(ts) FROM captures WHERE {where}) - ? "
+            f"ORDER BY ts DESC LIMIT ?"
+        )
+        with self._lock:
+            cur = self._conn.execute(sql, args + args + (window_sec, limit))
+            cols = [c[0] for c in cur.description]
+            return [dict(zip(cols, row)) for row in cur.fetchall()]
+
+    def latest_camera(self, category: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT camera_ip FROM captures WHERE category = ? ORDER BY ts DESC LIMIT 1", (category,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def usage(self, category: str) -> Tuple[int, int]:
+        """(file count, total bytes) indexed for a category."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM captures WHERE category = ?", (category,)
+            ).fetchone()
+        return int(row[0]), int(row[1])
+
+    def has_paths(self, paths: Iterable[str]) -> set:
+        rows = [str(p) for p in paths]
+        if not rows:
+            return set()
+        marks = ",".join("?" * len(rows))
+        with self._lock:
+            return {r[0] for r in self._conn.execute(f"SELECT path FROM captures WHERE path IN ({marks})", rows)}
+
+    def eviction_candidates(self, category: str, kind: str, limit: int, before_ts: Optional[float] = None, dup_window_sec: float = 2.0) -> List[Tuple[str, int]]:
+        """
+        (path, size) pairs to evict, oldest first, for one retention pass:
+        - "expired": older than before_ts
+        - "low_quality": failed the quality check when saved
+        - "duplicate": another capture of the same camera within dup_window_sec
+          has a better quality score (the best of each burst survives)
+        - "oldest": everything, by age
+        """
+        if kind == "expired":
+            sql = "SELECT path, size FROM captures WHERE category = ? AND ts < ? ORDER BY ts LIMIT ?"
+            args: tuple = (category, before_ts, limit)
+        elif kind == "low_quality":
+            sql = "SELECT path, size FROM captures WHERE category = ? AND quality_ok = 0 ORDER BY ts LIMIT ?"
+            args = (category, limit)
+        elif kind == "duplicate":
+            sql = (
+                "SELECT c.path, c.size FROM captures c WHERE c.category = ? AND EXISTS ("
+                " SELECT 1 FROM captures d WHERE d.category = c.category AND d.camera_ip = c.camera_ip"
+                " AND d.ts BETWEEN c.ts - ? AND c.ts + ? AND d.id != c.id"
+                " AND (COALESCE(d.quality, 0) > COALESCE(c.quality, 0) OR (COALESCE(d.quality, 0) = COALESCE(c.quality, 0) AND d.id > c.id))"
+                ") ORDER BY c.ts LIMIT ?"
+            )
+            args = (category, dup_window_sec, dup_window_sec, limit)
+        elif kind == "oldest":
+            sql = "SELECT path, size FROM captures WHERE category = ? ORDER BY ts LIMIT ?"
+            args = (category, limit)
+        else:
+            raise ValueError(f"unknown eviction kind: {kind}")
+        with self._lock:
+            return [(r[0], int(r[1] or 0)) for r in self._conn.execute(sql, args)]
@@ -1,78 +1,216 @@
-import json
+import threading
 import time
 from pathlib import Path
 import shutil
-
-SESSIONS_FILE = Path("config/capture_sessions.json")
-
-
-def _load_sessions() -> dict:
-    if not SESSIONS_FILE.exists():
-        return {}
-    try:
-        return json.loads(SESSIONS_FILE.read_text(encoding="utf-8"))
-    except Exception:
-        return {}
-
-
-def _save_sessions(sessions: dict) -> None:
-    SESSIONS_FILE.parent.mkdir(parents=True, exist_ok=True)
-    SESSIONS_FILE.write_text(json.dumps(sessions, indent=2), encoding="utf-8")
+from typing import Dict, Optional
+
+from .sqlite_store import connect
+
+SESSIONS_DB = Path("config/capture_sessions.db")
+# Root of data/<category>/known/<identity>; configure() points both elsewhere
+DATA_DIR = Path("data")
+
+# Callbacks (category, dest_path) invoked after an image lands in known/
+_listeners = []
+
+
+def add_listener(callback) -> None:
+    """Register a callback notified of every image appended to a known dataset."""
+    _listeners.append(callback)
+
+
+class SessionRegistry:
+    """
+    In-memory view of capture sessions backed by a shared SQLite (WAL) table.
+
+    The webhook process starts sessions; the NVR process checks them for every
+    unknown crop. is_active() is a dict lookup: the local copy is reloaded only
+    when another process has committed (PRAGMA data_version changes), checked
+    at most every refresh_interval_sec. Sessions expire by TTL since their last
+    update, and expired rows are purged whenever a new session starts.
+    """
+
+    def __init__(self, db_path=SESSIONS_DB, refresh_interval_sec: float = 0.5) -> None:
+        self.refresh_interval_sec = refresh_interval_sec
+        self._lock = threading.Lock()
+        self._conn = connect(db_path)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                key TEXT PRIMARY KEY,
+                category TEXT NOT NULL,
+                camera_ip TEXT NOT NULL,
+                base_name TEXT NOT NULL,
+                ttl_sec REAL NOT NULL,
+                max_images INTEGER NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                last_updated REAL NOT NULL
+            )
+            """
+        )
+        self._sessions: Dict[str, dict] = {}
+        self._data_version: Optional[int] = None
+        self._next_refresh = 0.0
+        self._reload()
+
+    @staticmethod
+    def _key(category: str, camera_ip: str) -> str:
+        return f"{category}:{camera_ip}"
+
+    def _reload(self) -> None:
+        cur = self._conn.execute("SELECT key, category, camera_ip, base_name, ttl_sec, max_images, count, last_updated FROM sessions")
+        cols = [c[0] for c in cur.description]
+        self._sessions = {row[0]: dict(zip(cols, row)) for row in cur.fetchall()}
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _maybe_refresh(self) -> None:
+        now = time.monotonic()
+        if now < self._next_refresh:
+            return
+        self._next_refresh = now + self.refresh_interval_sec
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._reload()
+
+    @staticmethod
+    def _alive(s: Optional[dict], now: float) -> bool:
+        if not s:
+            return False
+        if s["count"] >= s["max_images"]:
+            return False
+        return (now - s["last_updated"]) <= s["ttl_sec"]
+
+    def start_session(self, category: str, camera_ip: str, base_name: str, ttl_sec: int = 10, max_images: int = 50) -> None:
+        now = time.time()
+        key = self._key(category, camera_ip)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM sessions WHERE last_updated + ttl_sec < ?", (now,))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sessions (key, category, camera_ip, base_name, ttl_sec, max_images, count, last_updated) VALUES (?, ?, ?, ?, ?, ?, 0, ?)",
+                    (key, category, camera_ip, base_name, ttl_sec, max_images, now),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._reload()
+
+    def is_active(self, category: str, camera_ip: str) -> bool:
+        with self._lock:
+            self._maybe_refresh()
+            return self._alive(self._sessions.get(self._key(category, camera_ip)), time.time())
+
+    def session(self, category: str, camera_ip: str) -> Optional[dict]:
+        """Snapshot of the active session for category+camera, or None."""
+        with self._lock:
+            self._maybe_refresh()
+            s = self._sessions.get(self._key(category, camera_ip))
+            return dict(s) if self._alive(s, time.time()) else None
+
+    def touch(self, category: str, camera_ip: str) -> None:
+        key = self._key(category, camera_ip)
+        now = time.time()
+        with self._lock:
+            s = self._sessions.get(key)
+            if s is None:
+                return
+            s["last_updated"] = now
+            self._conn.execute("UPDATE sessions SET last_updated = ? WHERE key = ?", (now, key))
+
+    def claim_slot(self, category: str, camera_ip: str) -> Optional[dict]:
+        """
+        Atomically reserve the next image number of an active session.
+        Returns a snapshot of the session with the new count, or None.
+        """
+        key = self._key(category, camera_ip)
+        now = time.time()
+        with self._lock:
+            self._maybe_refresh()
+            if not self._alive(self._sessions.get(key), now):
+                return None
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cur = self._conn.execute(
+                    "UPDATE sessions SET count = count + 1, last_updated = ? WHERE key = ? AND count < max_images AND ? - last_updated <= ttl_sec",
+                    (now, key, now),
+                )
+                row = None
+                if cur.rowcount == 1:
+                    row = self._conn.execute("SELECT count FROM sessions WHERE key = ?", (key,)).fetchone()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            if row is None:
+                return None
+            s = self._sessions[key]
+            s["count"] = row[0]
+            s["last_updated"] = now
+            return dict(s)
+
+
+_registry: Optional[SessionRegistry] = None
+_registry_lock = threading.Lock()
+_db_path = SESSIONS_DB
+_data_dir = DATA_DIR
+
+
+def configure(db_path=SESSIONS_DB, data_dir=DATA_DIR) -> None:
+    """Use another sessions table and data root (e.g. a benchmark's temp dir); call before first use."""
+    global _registry, _db_path, _data_dir
+    with _registry_lock:
+        _db_path, _data_dir = Path(db_path), Path(data_dir)
+        _registry = None
+
+
+def get_registry() -> SessionRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = SessionRegistry(_db_path)
+    return _registry
+
+
+def known_dir(category: str, identity: str) -> Path:
+    """Folder of an identity's known images, data/<category>/known/<identity>."""
+    return _data_dir / category / "known" / identity
 
 
 def start_session(category: str, camera_ip: str, base_name: str, ttl_sec: int = 10, max_images: int = 50) -> None:
     """Start or reset a capture session for a given category+camera."""
-    sessions = _load_sessions()
-    key = f"{category}:{camera_ip}"
-    sessions[key] = {
-        "category": category,
-        "camera_ip": camera_ip,
-        "base_name": base_name,
-        "ttl_sec": ttl_sec,
-        "max_images": max_images,
-        "count": 0,
-        "last_updated": time.time(),
-    }
-    _save_sessions(sessions)
+    get_registry().start_session(category, camera_ip, base_name, ttl_sec=ttl_sec, max_images=max_images)
 
 
 def is_active(category: str, camera_ip: str) -> bool:
-    sessions = _load_sessions()
-    key = f"{category}:{camera_ip}"
-    s = sessions.get(key)
-    if not s:
-        return False
-    if s.get("count", 0) >= s.get("max_images", 0):
-        return False
-    return (time.time() - s.get("last_updated", 0)) <= s.get("ttl_sec", 10)
+    return get_registry().is_active(category, camera_ip)
 
 
 def touch(category: str, camera_ip: str) -> None:
-    sessions = _load_sessions()
-    key = f"{category}:{camera_ip}"
-    if key in sessions:
-        sessions[key]["last_updated"] = time.time()
-        _save_sessions(sessions)
+    get_registry().touch(category, camera_ip)
+
+
+def _identity(base_name: str) -> str:
+    return base_name.split("_")[0]
+
+
+def active_identity(category: str, camera_ip: str) -> Optional[str]:
+    """Name of the known/ folder the active session for category+camera writes to."""
+    s = get_registry().session(category, camera_ip)
+    return _identity(s["base_name"]) if s else None
 
 
 def append_image(category: str, camera_ip: str, source_path: Path) -> bool:
-    sessions = _load_sessions()
-    key = f"{category}:{camera_ip}"
-    s = sessions.get(key)
+    s = get_registry().claim_slot(category, camera_ip)
     if not s:
         return False
-    # Check active and limits
-    if not is_active(category, camera_ip):
-        return False
-    count = int(s.get("count", 0)) + 1
-    s["count"] = count
-    s["last_updated"] = time.time()
+    count = int(s["count"])
 
     # Build destination path
-    data_dir = Path("data") / category
-    name_prefix = s["base_name"].split("_")[0]
-    known_dir = data_dir / "known" / name_prefix
-    known_dir.mkdir(parents=True, exist_ok=True)
+    dest_dir = known_dir(category, _identity(s["base_name"]))
+    dest_dir.mkdir(parents=True, exist_ok=True)
 
     base_name = s["base_name"]
     name_parts = base_name.rsplit(".", 1)
@@ -81,10 +219,14 @@ def append_image(category: str, camera_ip: str, source_path: Path) -> bool:
     else:
         new_name = f"{base_name}_{count:03d}.png"
 
-    dest_file = known_dir / new_name
+    dest_file = dest_dir / new_name
     try:
         shutil.copy2(source_path, dest_file)
-        _save_sessions(sessions)
-        return True
     except Exception:
         return False
+    for callback in _listeners:
+        try:
+            callback(category, dest_file)
+        except Exception:
+            pass
+    return True
@@ -38,6 +38,12 @@ class Config:
                 actions_cfg["unknown_alarm_delay_sec"] = secrets_actions.get("unknown_alarm_delay_sec")
             self._cfg["actions"] = actions_cfg
 
+            # Live preview access token
+            if "token" in (creds.get("preview") or {}):
+                preview_cfg = self._cfg.get("preview") or {}
+                preview_cfg["token"] = creds["preview"]["token"]
+                self._cfg["preview"] = preview_cfg
+
     def get(self, key: str, default: Any = None) -> Any:
         return self._cfg.get(key, default)
 
@@ -0,0 +1,110 @@
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+from typing import Any, Callable, Dict
+
+CONTROL_SOCKET = "/tmp/nvr_ia.sock"
+
+
+class ControlError(Exception):
+    """Raised by ControlClient when the service is unreachable or a command fails."""
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        for raw in self.rfile:
+            line = raw.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+                result = self.server.dispatch(request.get("cmd", ""), request.get("args") or {})
+                reply = {"ok": True, "result": result}
+            except Exception as e:
+                reply = {"ok": False, "error": str(e)}
+            self.wfile.write((json.dumps(reply, default=str) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, commands: Dict[str, Callable[..., Any]]) -> None:
+        self.commands = commands
+        super().__init__(path, _Handler)
+
+    def dispatch(self, cmd: str, args: Dict[str, Any]) -> Any:
+        handler = self.commands.get(cmd)
+        if handler is None:
+            raise ValueError(f"unknown command: {cmd}")
+        return handler(**args)
+
+
+class ControlServer:
+    """
+    Local control channel exposed by the running NVR service.
+
+    Unix domain socket, one JSON object per line in each direction:
+        -> {"cmd": "trigger_alarm", "args": {"seconds": 15}}
+        <- {"ok": true, "result": ...}  |  {"ok": false, "error": "..."}
+    Commands are plain callables registered with register(); their keyword
+    arguments come from "args".
+    """
+
+    def __init__(self, socket_path: str = CONTROL_SOCKET) -> None:
+        self.socket_path = socket_path
+        self.commands: Dict[str, Callable[..., Any]] = {"ping": lambda: "pong", "commands": lambda: sorted(self.commands)}
+        self._server = None
+
+    def register(self, name: str, handler: Callable[..., Any]) -> None:
+        self.commands[name] = handler
+
+    def start(self) -> None:
+        if os.path.exists(self.socket_path):
+            # Stale socket from a previous run
+            os.unlink(self.socket_path)
+        self._server = _Server(self.socket_path, self.commands)
+        os.chmod(self.socket_path, 0o660)
+        threading.Thread(target=self._server.serve_forever, name="control-server", daemon=True).start()
+        logging.info(f"Control channel listening on {self.socket_path}")
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+
+
+class ControlClient:
+    """Client for ControlServer; used by the webhook and command-line tools."""
+
+    def __init__(self, socket_path: str = CONTROL_SOCKET, timeout: float = 2.0) -> None:
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def available(self) -> bool:
+        return os.path.exists(self.socket_path)
+
+    def call(self, cmd: str, **args) -> Any:
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.timeout)
+                sock.connect(self.socket_path)
+                sock.sendall((json.dumps({"cmd": cmd, "args": args}) + "\n").encode("utf-8"))
+                with sock.makefile("rb") as f:
+                    line = f.readline()
+        except OSError as e:
+            raise ControlError(f"NVR service unreachable at {self.socket_path}: {e}") from e
+        if not line:
+            raise ControlError("empty reply from NVR service")
+        reply = json.loads(line)
+        if not reply.get("ok"):
+            raise ControlError(reply.get("error", "command failed"))
+        return reply.get("result")
@@ -0,0 +1,150 @@
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .sqlite_store import connect
+
+CONVERSATIONS_DB = Path("config/conversations.db")
+
+
+class ConversationStore:
+    """
+    Per-phone-number conversation state for the WhatsApp webhook.
+
+    Entries expire ttl_sec after their last write. Step transitions use
+    compare_and_set(): the write only happens if the stored step still equals
+    the one the caller read, so two webhook workers cannot both advance (or
+    both finish) the same conversation.
+    """
+
+    def __init__(self, ttl_sec: float = 600) -> None:
+        self.ttl_sec = float(ttl_sec)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def compare_and_set(self, key: str, expected_step: Optional[str], new_state: Optional[Dict[str, Any]]) -> bool:
+        """
+        Replace the state of key if its current step is expected_step (None
+        meaning "no live conversation"). new_state=None ends the conversation.
+        """
+        raise NotImplementedError
+
+    def purge_expired(self) -> int:
+        raise NotImplementedError
+
+
+class MemoryConversationStore(ConversationStore):
+    """In-process store; only correct with a single webhook worker."""
+
+    def __init__(self, ttl_sec: float = 600) -> None:
+        super().__init__(ttl_sec)
+        self._entries: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        state, expires_at = entry
+        if expires_at < now:
+            del self._entries[key]
+            return None
+        return state
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            state = self._live(key, time.time())
+            return dict(state) if state is not None else None
+
+    def compare_and_set(self, key: str, expected_step: Optional[str], new_state: Optional[Dict[str, Any]]) -> bool:
+        now = time.time()
+        with self._lock:
+            current = self._live(key, now)
+            current_step = current.get("step") if current is not None else None
+            if current_step != expected_step:
+                return False
+            if new_state is None:
+                self._entries.pop(key, None)
+            else:
+                self._entries[key] = (dict(new_state), now + self.ttl_sec)
+            return True
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [k for k, (_, expires_at) in self._entries.items() if expires_at < now]
+            for k in expired:
+                del self._entries[k]
+        return len(expired)
+
+
+class SQLiteConversationStore(ConversationStore):
+    """Store shared by every webhook worker process through SQLite (WAL)."""
+
+    def __init__(self, db_path=CONVERSATIONS_DB, ttl_sec: float = 600) -> None:
+        super().__init__(ttl_sec)
+        self._lock = threading.Lock()
+        self._conn = connect(db_path)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS conversations (
+                key TEXT PRIMARY KEY,
+                step TEXT,
+                state TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM conversations WHERE key = ? AND expires_at >= ?", (key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def compare_and_set(self, key: str, expected_step: Optional[str], new_state: Optional[Dict[str, Any]]) -> bool:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT step FROM conversations WHERE key = ? AND expires_at >= ?", (key, now)
+                ).fetchone()
+                current_step = row[0] if row else None
+                if current_step != expected_step:
+                    self._conn.execute("ROLLBACK")
+                    return False
+                if new_state is None:
+                    self._conn.execute("DELETE FROM conversations WHERE key = ?", (key,))
+                else:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO conversations (key, step, state, expires_at) VALUES (?, ?, ?, ?)",
+                        (key, new_state.get("step"), json.dumps(new_state), now + self.ttl_sec),
+                    )
+                # Evict stale entries opportunistically while holding the write lock
+                self._conn.execute("DELETE FROM conversations WHERE expires_at < ?", (now,))
+                self._conn.execute("COMMIT")
+                return True
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM conversations WHERE expires_at < ?", (time.time(),))
+            return cur.rowcount
+
+
+def build_conversation_store(cfg: Dict[str, Any]) -> ConversationStore:
+    """cfg: the 'webhook' section of settings.yaml."""
+    ttl_sec = float(cfg.get("conversation_ttl_sec", 600))
+    backend = cfg.get("conversation_store", "memory")
+    if backend == "sqlite":
+        return SQLiteConversationStore(cfg.get("conversation_db", CONVERSATIONS_DB), ttl_sec=ttl_sec)
+    if backend != "memory":
+        raise ValueError(f"Unknown conversation_store backend: {backend}")
+    return MemoryConversationStore(ttl_sec=ttl_sec)
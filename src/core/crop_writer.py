@@ -0,0 +1,172 @@
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Set
+
+import cv2
+
+from .metrics import get_metrics
+
+
+@dataclass
+class PendingCrop:
+    """Handle returned by CropWriter.submit: the final path is known up front."""
+    path: str
+    future: Future
+
+
+class CropWriter:
+    """
+    Background persistence for unknown crops, off the frame loop.
+
+    - Bounded queue: when the SD card falls behind, new crops are dropped
+      (and counted) instead of stalling detection.
+    - Each crop is JPEG-encoded exactly once, in a writer thread.
+    - Names are <YYYYMMDD_HHMMSS>_<ms>_<seq>_<camera_ip>.jpg, so crops taken
+      in the same second never overwrite each other.
+    - fsync is batched: files become readable immediately (the future
+      resolves after write()), durability is flushed every N files or T sec.
+    """
+
+    def __init__(self, base_dir: str = "data", queue_size: int = 64, workers: int = 1, jpeg_quality: int = 90, fsync_batch: int = 16, fsync_interval_sec: float = 2.0) -> None:
+        self.base_dir = base_dir
+        self.queue: "queue.Queue[tuple]" = queue.Queue(maxsize=max(1, int(queue_size)))
+        self.workers = max(1, int(workers))
+        self.encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), int(jpeg_quality)]
+        self.fsync_batch = max(1, int(fsync_batch))
+        self.fsync_interval_sec = float(fsync_interval_sec)
+        self.stop_event = threading.Event()
+        self._seq = itertools.count()
+        self._dirs_ready: Set[str] = set()
+        self._threads: List[threading.Thread] = []
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"crop-writer-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self.stop_event.set()
+        for t in self._threads:
+            t.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+    def build_path(self, category: str, camera_ip: str) -> str:
+        now = time.time()
+        stamp = datetime.fromtimestamp(now).strftime("%Y%m%d_%H%M%S")
+        ms = int((now % 1) * 1000)
+        seq = next(self._seq) % 10000
+        safe_ip = camera_ip.replace(".", "_")
+        return os.path.join(self.base_dir, category, "unknown", f"{stamp}_{ms:03d}_{seq:04d}_{safe_ip}.jpg")
+
+    def submit(self, crop, category: str, camera_ip: str, on_saved: Optional[Callable[[str, Any], None]] = None) -> Optional[PendingCrop]:
+        """
+        Queue a crop for writing. Returns immediately with the destination
+        path, or None if the queue is full. on_saved(path, crop) runs in the
+        writer thread once the file is on disk.
+        """
+        path = self.build_path(category, camera_ip)
+        future: Future = Future()
+        try:
+            # Copy: the crop is a view into a frame the caller keeps using
+            self.queue.put_nowait((path, crop.copy(), on_saved, future))
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 100 == 0:
+                logging.warning(f"Crop writer queue full, dropped {self.dropped} crop(s) so far")
+            return None
+        return PendingCrop(path=path, future=future)
+
+    def _ensure_dir(self, directory: str) -> None:
+        if directory not in self._dirs_ready:
+            os.makedirs(directory, exist_ok=True)
+            self._dirs_ready.add(directory)
+
+    def _run(self) -> None:
+        pending_fds: List[int] = []
+        pending_dirs: Set[str] = set()
+        last_sync = time.time()
+        while not (self.stop_event.is_set() and self.queue.empty()):
+            try:
+                item = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                item = None
+            if item is not None:
+                fd = self._write(*item)
+                if fd is not None:
+                    pending_fds.append(fd)
+                    pending_dirs.add(os.path.dirname(item[0]))
+            if pending_fds and (len(pending_fds) >= self.fsync_batch or time.time() - last_sync >= self.fsync_interval_sec):
+                self._sync(pending_fds, pending_dirs)
+                pending_fds, pending_dirs = [], set()
+                last_sync = time.time()
+        self._sync(pending_fds, pending_dirs)
+
+    def _write(self, path: str, crop, on_saved, future: Future) -> Optional[int]:
+        with get_metrics().timer("nvr_crop_write_seconds"):
+            return self._write_file(path, crop, on_saved, future)
+
+    def _write_file(self, path: str, crop, on_saved, future: Future) -> Optional[int]:
+        try:
+            ok, buf = cv2.imencode(".jpg", crop, self.encode_params)
+            if not ok:
+                raise ValueError("JPEG encode failed")
+            self._ensure_dir(os.path.dirname(path))
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                view = memoryview(buf).cast("B")
+                while view:
+                    view = view[os.write(fd, view):]
+            except Exception:
+                os.close(fd)
+                raise
+        except Exception as e:
+            self.failed += 1
+            logging.error(f"Crop write failed {path}: {e}")
+            future.set_exception(e)
+            return None
+        self.written += 1
+        future.set_result(path)
+        if on_saved is not None:
+            try:
+                on_saved(path, crop)
+            except Exception as e:
+                logging.debug(f"on_saved callback failed for {path}: {e}")
+        return fd
+
+    @staticmethod
+    def _sync(fds: List[int], dirs: Set[str]) -> None:
+        for fd in fds:
+            try:
+                os.fsync(fd)
+            except OSError as e:
+                logging.warning(f"fsync failed: {e}")
+            finally:
+                os.close(fd)
+        for directory in dirs:
+            try:
+                dfd = os.open(directory, os.O_RDONLY)
+                try:
+                    os.fsync(dfd)
+                finally:
+                    os.close(dfd)
+            except OSError:
+                pass
@@ -0,0 +1,124 @@
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from src.vision.gallery_cache import GalleryCache
+
+
+class EnrollmentService:
+    """
+    Feeds new images under data/<category>/known/<identity>/ into the running
+    recognizers without a restart.
+
+    Images arrive through two paths:
+    - submit(): explicit enqueue, used by in-process capture sessions.
+    - a polling watcher over the known dirs, which picks up files written by
+      other processes (e.g. the WhatsApp webhook's move_recent_captures).
+
+    A single worker thread calls recognizer.enroll(); each recognizer swaps
+    in its new gallery atomically, so detection threads never take a lock.
+
+    While the galleries are still training, seed() records the files each
+    training run scanned, submit() only holds paths back and rescan() does
+    nothing. start() then replays the held paths and rescans once, so
+    images added during warm-up are enrolled exactly once and the trained
+    ones never twice.
+    """
+
+    def __init__(self, recognizers: Dict[str, object], known_dirs: Dict[str, str], scan_interval_sec: float = 10.0) -> None:
+        self.recognizers = recognizers
+        self.known_dirs = known_dirs
+        self.scan_interval_sec = scan_interval_sec
+        self.queue: "queue.Queue[Tuple[str, str]]" = queue.Queue()
+        self.stop_event = threading.Event()
+        self._seen: Set[str] = set()
+        self._seen_lock = threading.Lock()
+        self._started = False
+        self._held: List[Tuple[str, str]] = []
+        self.enrolled = 0
+
+    def seed(self, paths) -> None:
+        """Mark paths as already loaded (the file list train_from_dir() used)."""
+        with self._seen_lock:
+            self._seen.update(os.path.normpath(str(p)) for p in paths)
+
+    def start(self) -> None:
+        with self._seen_lock:
+            if self._started:
+                return
+            self._started = True
+            held, self._held = self._held, []
+        threading.Thread(target=self._worker_loop, daemon=True).start()
+        if self.scan_interval_sec > 0:
+            threading.Thread(target=self._watch_loop, daemon=True).start()
+        for category, path in held:
+            self.submit(category, path)
+        # Files written between the training scans and now
+        self.rescan()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+    def submit(self, category: str, path) -> bool:
+        path = os.path.normpath(str(path))
+        with self._seen_lock:
+            if not self._started:
+                self._held.append((category, path))
+                return False
+            if path in self._seen:
+                return False
+            self._seen.add(path)
+        self.queue.put((category, path))
+        return True
+
+    def rescan(self, category: Optional[str] = None) -> int:
+        """Scan the known dirs now (all, or one category). Returns images queued."""
+        if not self._started:
+            return 0
+        queued = 0
+        for cat, root in self.known_dirs.items():
+            if category is not None and cat != category:
+                continue
+            try:
+                for path in GalleryCache.scan(root):
+                    queued += int(self.submit(cat, path))
+            except Exception as e:
+                logging.debug(f"Enrollment scan failed for {root}: {e}")
+        return queued
+
+    def _watch_loop(self) -> None:
+        while not self.stop_event.wait(self.scan_interval_sec):
+            self.rescan()
+
+    def _worker_loop(self) -> None:
+        while not self.stop_event.is_set():
+            try:
+                first = self.queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            # Drain whatever else is queued so a burst becomes one swap per identity
+            batch: Dict[Tuple[str, str], List[str]] = {}
+            item = first
+            while True:
+                category, path = item
+                identity = os.path.basename(os.path.dirname(path))
+                batch.setdefault((category, identity), []).append(path)
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            for (category, identity), paths in batch.items():
+                recognizer = self.recognizers.get(category)
+                if recognizer is None:
+                    continue
+                start = time.time()
+                try:
+                    added = recognizer.enroll(identity, paths)
+                except Exception as e:
+                    logging.error(f"Enrollment failed for {category}/{identity}: {e}")
+                    continue
+                self.enrolled += added
+                logging.info(f"Enrolled {added} image(s) into {category}/{identity} in {time.time() - start:.2f}s")
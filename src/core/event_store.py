@@ -0,0 +1,214 @@
+import json
+import logging
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .sqlite_store import connect
+
+EVENTS_DB = Path("data/events.db")
+
+# Payload keys naming who/what was recognised, in priority order
+IDENTITY_KEYS = ("name", "vehicle_id", "pet_name", "plate")
+
+
+def _json_default(value: Any) -> Any:
+    # numpy scalars/arrays from detectors and feature extractors
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+
+def event_plate(payload: Dict) -> Optional[str]:
+    plate = payload.get("plate")
+    return str(plate).upper() if plate else None
+
+
+def event_identity(payload: Dict) -> Optional[str]:
+    for key in IDENTITY_KEYS:
+        value = payload.get(key)
+        if value:
+            return str(value)
+    return None
+
+
+class EventStore:
+    """
+    Append-only SQLite log of pipeline events (person, face_known,
+    vehicle_unknown...).
+
+    - append() never blocks the frame loop: events go to a bounded queue and
+      a writer thread inserts them in batches, one transaction per batch.
+    - The same (camera, type, identity, track) is recorded at most once
+      every min_interval_sec, so a person standing in front of a camera is
+      one row every few seconds instead of one per frame.
+    - Indexed by time, camera, type and identity; queries page by
+      (ts, id) keyset, so "when did ABC123 last arrive" or "vehicles on
+      camera X last week" stay index range scans over months of rows.
+    - The plate read for a vehicle gets its own indexed column, since the
+      identity of a known vehicle is its vehicle_id; an identity filter
+      matches either column.
+    """
+
+    def __init__(self, db_path=EVENTS_DB, queue_size: int = 2048, batch_size: int = 200, flush_interval_sec: float = 1.0, min_interval_sec: float = 5.0) -> None:
+        self.queue: "queue.Queue[tuple]" = queue.Queue(maxsize=max(1, int(queue_size)))
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval_sec = float(flush_interval_sec)
+        self.min_interval_sec = float(min_interval_sec)
+        self.stop_event = threading.Event()
+        self.written = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self._last_seen: Dict[Tuple, float] = {}
+        self._seen_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._conn = connect(db_path)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY,
+                ts REAL NOT NULL,
+                camera_ip TEXT,
+                type TEXT NOT NULL,
+                identity TEXT,
+                confidence REAL,
+                payload TEXT,
+                plate TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_events_ts_type ON events (ts, type);
+            CREATE INDEX IF NOT EXISTS idx_events_cam_ts ON events (camera_ip, ts);
+            CREATE INDEX IF NOT EXISTS idx_events_type_ts ON events (type, ts);
+            CREATE INDEX IF NOT EXISTS idx_events_identity_ts ON events (identity, ts);
+            CREATE INDEX IF NOT EXISTS idx_events_plate_ts ON events (plate, ts);
+            """
+        )
+        # Queries use their own connection so they never wait on a batch insert
+        self._read_conn = connect(db_path)
+        self._read_lock = threading.Lock()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="event-store", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self.stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def append(self, event_type: str, payload: Dict) -> bool:
+        """Queue an event; False if coalesced with a recent one or dropped."""
+        ts = payload.get("ts")
+        # on_frame stamps events in ms
+        ts = float(ts) / 1000.0 if ts else time.time()
+        camera_ip = payload.get("camera_ip")
+        identity = event_identity(payload)
+        if self.min_interval_sec > 0:
+            # Unknowns have no identity; their track keeps two strangers on one camera apart
+            key = (camera_ip, event_type, identity, payload.get("track_id"))
+            with self._seen_lock:
+                last = self._last_seen.get(key)
+                if last is not None and 0 <= ts - last < self.min_interval_sec:
+                    self.coalesced += 1
+                    return False
+                self._last_seen[key] = ts
+                if len(self._last_seen) > 10000:
+                    cutoff = ts - self.min_interval_sec
+                    self._last_seen = {k: v for k, v in self._last_seen.items() if v >= cutoff}
+        confidence = payload.get("confidence")
+        row = (ts, camera_ip, event_type, identity, None if confidence is None else float(confidence), json.dumps(payload, default=_json_default), event_plate(payload))
+        try:
+            self.queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _run(self) -> None:
+        while not (self.stop_event.is_set() and self.queue.empty()):
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval_sec)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._insert(batch)
+                self.written += len(batch)
+            except Exception as e:
+                self.dropped += len(batch)
+                logging.error(f"Event store write failed ({len(batch)} events): {e}")
+
+    def _insert(self, rows: List[tuple]) -> None:
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.executemany("INSERT INTO events (ts, camera_ip, type, identity, confidence, payload, plate) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _where(start_ts: Optional[float], end_ts: Optional[float], camera_ip: Optional[str], types: Optional[Iterable[str]], identity: Optional[str]) -> Tuple[str, list]:
+        clauses, args = [], []
+        if start_ts is not None:
+            clauses.append("ts >= ?")
+            args.append(float(start_ts))
+        if end_ts is not None:
+            clauses.append("ts < ?")
+            args.append(float(end_ts))
+        if camera_ip:
+            clauses.append("camera_ip = ?")
+            args.append(camera_ip)
+        if types:
+            types = [types] if isinstance(types, str) else list(types)
+            clauses.append(f"type IN ({','.join('?' * len(types))})")
+            args.extend(types)
+        if identity:
+            # Known vehicles are stored under their vehicle_id; their plate is indexed apart
+            clauses.append("(identity = ? OR plate = ?)")
+            args.extend([identity, str(identity).upper()])
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", args
+
+    def query(self, start_ts: Optional[float] = None, end_ts: Optional[float] = None, camera_ip: Optional[str] = None, types: Optional[Iterable[str]] = None, identity: Optional[str] = None, limit: int = 100, before: Optional[Tuple[float, int]] = None) -> List[dict]:
+        """
+        Events newest first. For the next page pass before=(ts, id) of the
+        last row returned.
+        """
+        where, args = self._where(start_ts, end_ts, camera_ip, types, identity)
+        if before is not None:
+            where += (" AND " if where else " WHERE ") + "(ts, id) < (?, ?)"
+            args.extend([float(before[0]), int(before[1])])
+        sql = f"SELECT id, ts, camera_ip, type, identity, confidence, plate, payload FROM events{where} ORDER BY ts DESC, id DESC LIMIT ?"
+        with self._read_lock:
+            cur = self._read_conn.execute(sql, args + [max(1, int(limit))])
+            cols = [c[0] for c in cur.description]
+            rows = [dict(zip(cols, row)) for row in cur.fetchall()]
+        for row in rows:
+            row["payload"] = json.loads(row["payload"]) if row["payload"] else {}
+        return rows
+
+    def last(self, identity: Optional[str] = None, types: Optional[Iterable[str]] = None, camera_ip: Optional[str] = None) -> Optional[dict]:
+        rows = self.query(camera_ip=camera_ip, types=types, identity=identity, limit=1)
+        return rows[0] if rows else None
+
+    def counts(self, bucket_sec: float, start_ts: Optional[float] = None, end_ts: Optional[float] = None, camera_ip: Optional[str] = None, types: Optional[Iterable[str]] = None, identity: Optional[str] = None) -> List[dict]:
+        """Event counts per (time bucket, type), oldest bucket first."""
+        bucket_sec = max(1.0, float(bucket_sec))
+        where, args = self._where(start_ts, end_ts, camera_ip, types, identity)
+        sql = f"SELECT CAST(ts / ? AS INTEGER) * ? AS bucket, type, COUNT(*) FROM events{where} GROUP BY bucket, type ORDER BY bucket, type"
+        with self._read_lock:
+            rows = self._read_conn.execute(sql, [bucket_sec, bucket_sec] + args).fetchall()
+        return [{"bucket": float(b), "type": t, "count": int(c)} for b, t, c in rows]
+
+    def stats(self) -> Dict:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
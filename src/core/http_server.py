@@ -0,0 +1,64 @@
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict
+from urllib.parse import urlsplit
+
+Handler = Callable[[BaseHTTPRequestHandler], None]
+
+
+def send(request: BaseHTTPRequestHandler, status: int, content_type: str, body: bytes) -> None:
+    request.send_response(status)
+    request.send_header("Content-Type", content_type)
+    request.send_header("Content-Length", str(len(body)))
+    request.end_headers()
+    request.wfile.write(body)
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        route = self.server.routes.get(urlsplit(self.path).path)
+        if route is None:
+            send(self, 404, "text/plain; charset=utf-8", b"not found\n")
+            return
+        try:
+            route(self)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            logging.error(f"HTTP handler {self.path} failed: {e}")
+
+    def log_message(self, format, *args) -> None:
+        # Scrapes every few seconds would flood the service log
+        logging.debug("http: " + format % args)
+
+
+class HttpServer:
+    """
+    Small read-only HTTP server for local observability endpoints.
+
+    Routes are plain functions receiving the BaseHTTPRequestHandler, so a
+    route can answer once with send() or keep writing (streaming).
+    """
+
+    def __init__(self, host: str = "0.0.0.0", port: int = 9100) -> None:
+        self.host = host
+        self.port = int(port)
+        self.routes: Dict[str, Handler] = {}
+        self._server = None
+
+    def route(self, path: str, handler: Handler) -> None:
+        self.routes[path] = handler
+
+    def start(self) -> None:
+        self._server = ThreadingHTTPServer((self.host, self.port), _RequestHandler)
+        self._server.daemon_threads = True
+        self._server.routes = self.routes
+        threading.Thread(target=self._server.serve_forever, name="http-server", daemon=True).start()
+        logging.info(f"HTTP endpoints on {self.host}:{self.port}: {', '.join(sorted(self.routes))}")
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
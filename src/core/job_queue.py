@@ -0,0 +1,102 @@
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+
+class JobQueue:
+    """
+    Small background job runner so request handlers can return immediately.
+
+    Every job keeps a status record (queued/running/done/failed, timestamps,
+    error); the most recent `history` records are retained for inspection and
+    stats() summarizes queue depth plus wait/run latency.
+    """
+
+    def __init__(self, workers: int = 2, history: int = 200, max_queue: int = 0) -> None:
+        self.queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=max_queue)
+        self.workers = max(1, int(workers))
+        self.history = int(history)
+        self._ids = itertools.count(1)
+        self._jobs: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._wait_ms: Deque[float] = deque(maxlen=self.history)
+        self._run_ms: Deque[float] = deque(maxlen=self.history)
+        self.completed = 0
+        self.failed = 0
+        self._threads = []
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self) -> None:
+        for _ in self._threads:
+            self.queue.put(None)
+
+    def submit(self, name: str, fn: Callable, *args, **kwargs) -> int:
+        job_id = next(self._ids)
+        record = {"id": job_id, "name": name, "status": "queued", "enqueued_at": time.time(), "started_at": None, "finished_at": None, "error": None}
+        with self._lock:
+            self._jobs[job_id] = record
+            while len(self._jobs) > self.history:
+                self._jobs.popitem(last=False)
+        self.queue.put((job_id, record, fn, args, kwargs))
+        return job_id
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            record = self._jobs.get(job_id)
+            return dict(record) if record else None
+
+    def recent(self, limit: int = 20) -> list:
+        with self._lock:
+            return [dict(r) for r in list(self._jobs.values())[-limit:]][::-1]
+
+    @staticmethod
+    def _percentile(values, pct: float) -> Optional[float]:
+        if not values:
+            return None
+        ordered = sorted(values)
+        return round(ordered[min(len(ordered) - 1, int(pct * len(ordered)))], 1)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            wait = list(self._wait_ms)
+            run = list(self._run_ms)
+        return {
+            "queue_depth": self.queue.qsize(),
+            "completed": self.completed,
+            "failed": self.failed,
+            "wait_ms_p50": self._percentile(wait, 0.5),
+            "wait_ms_p95": self._percentile(wait, 0.95),
+            "run_ms_p50": self._percentile(run, 0.5),
+            "run_ms_p95": self._percentile(run, 0.95),
+        }
+
+    def _run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            job_id, record, fn, args, kwargs = item
+            record["status"] = "running"
+            record["started_at"] = time.time()
+            try:
+                fn(*args, **kwargs)
+                record["status"] = "done"
+                self.completed += 1
+            except Exception as e:
+                record["status"] = "failed"
+                record["error"] = str(e)
+                self.failed += 1
+                logging.error(f"Job {job_id} ({record['name']}) failed: {e}")
+            record["finished_at"] = time.time()
+            with self._lock:
+                self._wait_ms.append((record["started_at"] - record["enqueued_at"]) * 1000)
+                self._run_ms.append((record["finished_at"] - record["started_at"]) * 1000)
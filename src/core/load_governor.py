@@ -0,0 +1,174 @@
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, FrozenSet, List, Optional
+
+PRIORITIES = ("high", "normal", "low")
+
+
+@dataclass(frozen=True)
+class Policy:
+    """What a camera's pipeline may do at the current degradation level."""
+    level: int = 0
+    analysis_scale: float = 1.0
+    skip: FrozenSet[str] = field(default_factory=frozenset)
+    max_fps: float = 0.0  # 0 = analyse every frame
+
+    def allows(self, stage: str) -> bool:
+        return stage not in self.skip
+
+
+FULL_SERVICE = Policy()
+
+
+class LoadGovernor:
+    """
+    Watches per-camera frame latency and registered queue depths, and steps
+    the service through configured degradation levels under CPU pressure.
+
+    Pressure is the worst of:
+    - the per-camera EWMA of on_frame latency divided by target_latency_ms,
+    - each probed queue's depth divided by its limit.
+    A camera's latency only counts while it keeps reporting: samples older
+    than latency_ttl_sec (a stalled or dropped stream) are discarded.
+    Above 1.0 for degrade_checks consecutive checks the level goes up one
+    step; below recover_below for recover_checks checks it goes down one.
+    Level n applies levels[n-1] to "normal" and "low" cameras (low ones
+    also get low_priority_fps); "high" cameras (entrances) always keep
+    full service.
+    """
+
+    def __init__(self, levels: List[Dict], priorities: Optional[Dict[str, str]] = None, default_priority: str = "normal", target_latency_ms: float = 400.0, check_interval_sec: float = 2.0, degrade_checks: int = 2, recover_checks: int = 5, recover_below: float = 0.6, ewma_alpha: float = 0.2, latency_ttl_sec: float = 5.0) -> None:
+        self.levels = [self._build_policy(i + 1, lvl) for i, lvl in enumerate(levels)]
+        self._low_fps = [float(lvl.get("low_priority_fps", 0)) for lvl in levels]
+        self.priorities = priorities or {}
+        self.default_priority = default_priority if default_priority in PRIORITIES else "normal"
+        self.target_latency = float(target_latency_ms) / 1000.0
+        self.check_interval_sec = float(check_interval_sec)
+        self.degrade_checks = int(degrade_checks)
+        self.recover_checks = int(recover_checks)
+        self.recover_below = float(recover_below)
+        self.ewma_alpha = float(ewma_alpha)
+        self.latency_ttl_sec = float(latency_ttl_sec)
+        self.level = 0
+        self.pressure = 0.0
+        self.transitions = {"degrade": 0, "recover": 0}
+        self.events: deque = deque(maxlen=50)
+        self._latency: Dict[str, float] = {}
+        self._latency_at: Dict[str, float] = {}
+        self._probes: Dict[str, tuple] = {}
+        self._over = 0
+        self._under = 0
+        self._lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    @staticmethod
+    def _build_policy(level: int, cfg: Dict) -> Policy:
+        return Policy(
+            level=level,
+            analysis_scale=float(cfg.get("analysis_scale", 1.0)),
+            skip=frozenset(cfg.get("skip", [])),
+        )
+
+    def priority(self, camera_ip: str) -> str:
+        return self.priorities.get(camera_ip, self.default_priority)
+
+    def policy(self, camera_ip: str) -> Policy:
+        level = self.level
+        if level == 0 or self.priority(camera_ip) == "high":
+            return FULL_SERVICE
+        policy = self.levels[level - 1]
+        if self.priority(camera_ip) == "low" and self._low_fps[level - 1] > 0:
+            return Policy(policy.level, policy.analysis_scale, policy.skip, self._low_fps[level - 1])
+        return policy
+
+    def add_probe(self, name: str, depth: Callable[[], int], limit: int) -> None:
+        """Register a queue whose depth counts as pressure (depth / limit)."""
+        self._probes[name] = (depth, max(1, int(limit)))
+
+    def record(self, camera_ip: str, latency_sec: float) -> None:
+        with self._lock:
+            prev = self._latency.get(camera_ip)
+            self._latency[camera_ip] = latency_sec if prev is None else prev + self.ewma_alpha * (latency_sec - prev)
+            self._latency_at[camera_ip] = time.monotonic()
+
+    def forget(self, camera_ip: str) -> None:
+        with self._lock:
+            self._latency.pop(camera_ip, None)
+            self._latency_at.pop(camera_ip, None)
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.latency_ttl_sec
+        for ip in [ip for ip, at in self._latency_at.items() if at < cutoff]:
+            self._latency.pop(ip, None)
+            self._latency_at.pop(ip, None)
+
+    def start(self) -> None:
+        if not self.levels:
+            return
+        threading.Thread(target=self._run, name="load-governor", daemon=True).start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+    def _run(self) -> None:
+        while not self.stop_event.wait(self.check_interval_sec):
+            try:
+                self.check()
+            except Exception as e:
+                logging.error(f"Load governor check failed: {e}")
+
+    def _measure(self) -> Dict[str, float]:
+        with self._lock:
+            self._expire()
+            signals = {f"latency:{ip}": lat / self.target_latency for ip, lat in self._latency.items()}
+        for name, (depth, limit) in self._probes.items():
+            try:
+                signals[f"queue:{name}"] = depth() / limit
+            except Exception:
+                continue
+        return signals
+
+    def check(self) -> int:
+        """One evaluation step; returns the (possibly new) level."""
+        signals = self._measure()
+        worst = max(signals, key=signals.get) if signals else None
+        self.pressure = signals[worst] if worst else 0.0
+        if self.pressure > 1.0:
+            self._over += 1
+            self._under = 0
+        elif self.pressure < self.recover_below:
+            self._under += 1
+            self._over = 0
+        else:
+            self._over = self._under = 0
+
+        if self._over >= self.degrade_checks and self.level < len(self.levels):
+            self._transition("degrade", self.level + 1, worst)
+        elif self._under >= self.recover_checks and self.level > 0:
+            self._transition("recover", self.level - 1, worst)
+        return self.level
+
+    def _transition(self, kind: str, new_level: int, cause: Optional[str]) -> None:
+        old_level = self.level
+        self.level = new_level
+        self._over = self._under = 0
+        self.transitions[kind] += 1
+        event = {"ts": time.time(), "event": kind, "from": old_level, "to": new_level, "pressure": round(self.pressure, 2), "cause": cause}
+        self.events.append(event)
+        log = logging.warning if kind == "degrade" else logging.info
+        log(f"Load governor {kind}: level {old_level} -> {new_level} (pressure {self.pressure:.2f}, {cause})")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            latency_ms = {ip: round(lat * 1000.0, 1) for ip, lat in self._latency.items()}
+        return {
+            "level": self.level,
+            "max_level": len(self.levels),
+            "pressure": round(self.pressure, 2),
+            "transitions": dict(self.transitions),
+            "latency_ms": latency_ms,
+            "recent_events": list(self.events)[-10:],
+        }
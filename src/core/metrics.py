@@ -0,0 +1,208 @@
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+# Seconds; covers 1 ms (resize) to 5 s (a stalled Twilio call)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+class Histogram:
+    """Fixed-bucket histogram: observe() is a bisect plus two additions under a lock."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def merge(self, other: "Histogram") -> None:
+        """Add other's observations into this histogram (same buckets)."""
+        with other._lock:
+            counts, total, count = list(other.counts), other.sum, other.count
+        with self._lock:
+            for i, c in enumerate(counts):
+                self.counts[i] += c
+            self.sum += total
+            self.count += count
+
+    def percentile(self, q: float) -> float:
+        """Approximate percentile (0-100): upper bound of the bucket holding it."""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if total == 0:
+            return 0.0
+        target = total * q / 100.0
+        running = 0
+        for i, c in enumerate(counts):
+            running += c
+            if running >= target:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+class Counter:
+    def __init__(self) -> None:
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: Histogram) -> None:
+        self.histogram = histogram
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class MetricsRegistry:
+    """
+    Process-wide metrics rendered in the Prometheus text format.
+
+    Histograms and counters are created on first use per (name, labels) and
+    looked up by a tuple key afterwards. Gauges are callables evaluated only
+    at scrape time (queue depths, governor level...), so they cost nothing
+    on the frame path; counter_fn() does the same for totals a component
+    already keeps (crops dropped...), exported as counters for rate().
+    """
+
+    def __init__(self) -> None:
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._counters: Dict[str, Dict[LabelKey, Counter]] = {}
+        self._gauges: Dict[str, Callable[[], object]] = {}
+        self._sampled_counters: Dict[str, Callable[[], object]] = {}
+        self._help: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, buckets=DEFAULT_BUCKETS, **labels) -> Histogram:
+        key = _label_key(labels)
+        series = self._histograms.get(name)
+        if series is None or key not in series:
+            with self._lock:
+                series = self._histograms.setdefault(name, {})
+                if key not in series:
+                    series[key] = Histogram(buckets)
+        return series[key]
+
+    def counter(self, name: str, **labels) -> Counter:
+        key = _label_key(labels)
+        series = self._counters.get(name)
+        if series is None or key not in series:
+            with self._lock:
+                series = self._counters.setdefault(name, {})
+                if key not in series:
+                    series[key] = Counter()
+        return series[key]
+
+    def gauge(self, name: str, fn: Callable[[], object], help_text: str = "") -> None:
+        """fn returns a number, or {labels_dict_as_tuple_key: number} via gauge_series()."""
+        self._gauges[name] = fn
+        if help_text:
+            self._help[name] = help_text
+
+    def counter_fn(self, name: str, fn: Callable[[], object], help_text: str = "") -> None:
+        """Like gauge(), for a monotonic total read at scrape time; rendered as a counter."""
+        self._sampled_counters[name] = fn
+        if help_text:
+            self._help[name] = help_text
+
+    def timer(self, name: str, **labels) -> _Timer:
+        return _Timer(self.histogram(name, **labels))
+
+    def stage(self, camera_ip: str, stage: str) -> _Timer:
+        """Time one pipeline stage of one camera into nvr_stage_seconds."""
+        return self.timer("nvr_stage_seconds", camera=camera_ip, stage=stage)
+
+    def histograms(self, name: str) -> Dict[LabelKey, Histogram]:
+        return dict(self._histograms.get(name, {}))
+
+    def counters(self, name: str) -> Dict[LabelKey, Counter]:
+        return dict(self._counters.get(name, {}))
+
+    def render(self) -> str:
+        lines = []
+        # list(): series can gain labels while a scrape is rendering
+        for name, series in sorted(list(self._counters.items())):
+            self._header(lines, name, "counter")
+            for key, c in list(series.items()):
+                lines.append(f"{name}{_format_labels(key)} {c.value}")
+        for kind, fns in (("counter", self._sampled_counters), ("gauge", self._gauges)):
+            for name, fn in sorted(list(fns.items())):
+                try:
+                    value = fn()
+                except Exception:
+                    continue
+                self._header(lines, name, kind)
+                if isinstance(value, dict):
+                    for key, v in value.items():
+                        lines.append(f"{name}{_format_labels(key)} {float(v)}")
+                else:
+                    lines.append(f"{name} {float(value)}")
+        for name, series in sorted(list(self._histograms.items())):
+            self._header(lines, name, "histogram")
+            for key, h in list(series.items()):
+                with h._lock:
+                    counts, total, count = list(h.counts), h.sum, h.count
+                running = 0
+                for bound, c in zip(h.buckets, counts):
+                    running += c
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', repr(bound)))} {running}")
+                lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines: list, name: str, kind: str) -> None:
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+
+def gauge_series(label: str, values: Dict[str, float]) -> Dict[LabelKey, float]:
+    """{'192.168.1.100': 3} -> {(('camera', '192.168.1.100'),): 3} for a labelled gauge or counter_fn."""
+    return {((label, str(k)),): v for k, v in values.items()}
+
+
+_registry: Optional[MetricsRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_metrics() -> MetricsRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = MetricsRegistry()
+    return _registry
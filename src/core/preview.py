@@ -0,0 +1,169 @@
+import hmac
+import html
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, quote, urlsplit
+
+import cv2
+import numpy as np
+
+from .http_server import send
+
+BOUNDARY = "nvrframe"
+
+# (x, y, w, h), label, known: True = recognised, False = unknown, None = plain detection
+Overlay = Tuple[Tuple[int, int, int, int], str, Optional[bool]]
+
+COLORS = {True: (0, 200, 0), False: (0, 0, 230), None: (0, 200, 230)}
+
+
+def draw_overlays(frame: np.ndarray, overlays: List[Overlay]) -> np.ndarray:
+    """Copy of frame with boxes and labels drawn on it."""
+    image = frame.copy()
+    for (x, y, w, h), label, known in overlays:
+        color = COLORS.get(known, COLORS[None])
+        cv2.rectangle(image, (int(x), int(y)), (int(x + w), int(y + h)), color, 2)
+        if label:
+            (tw, th), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
+            top = max(int(y) - th - 6, 0)
+            cv2.rectangle(image, (int(x), top), (int(x) + tw + 4, top + th + 6), color, -1)
+            cv2.putText(image, label, (int(x) + 2, top + th + 2), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1, cv2.LINE_AA)
+    return image
+
+
+class _Channel:
+    """Latest encoded frame of one camera, shared by all of its viewers."""
+
+    def __init__(self) -> None:
+        self.cond = threading.Condition()
+        self.jpeg: Optional[bytes] = None
+        self.seq = 0
+        self.viewers = 0
+        self.next_encode = 0.0
+        self.encoded = 0
+
+
+class PreviewHub:
+    """
+    Live annotated MJPEG preview per camera.
+
+    The frame loop asks wants_frame() before collecting overlays; it is
+    True only while someone is watching that camera and the preview FPS cap
+    allows another frame, so an unwatched preview costs one dict lookup per
+    frame. publish() draws and JPEG-encodes the frame once and stores it in
+    the camera's channel; every viewer thread sends that same buffer. A
+    slow viewer just skips to the newest frame instead of queueing.
+
+    With a token, both routes answer 403 unless the request carries
+    ?token=<token>; the index page passes it on to the streams.
+    """
+
+    def __init__(self, max_fps: float = 5.0, max_width: int = 960, jpeg_quality: int = 70, token: str = "") -> None:
+        self.token = token or ""
+        self.interval = 1.0 / max(0.1, float(max_fps))
+        self.max_width = int(max_width)
+        self.jpeg_quality = int(jpeg_quality)
+        self._channels: Dict[str, _Channel] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def _channel(self, camera_ip: str) -> _Channel:
+        channel = self._channels.get(camera_ip)
+        if channel is None:
+            with self._lock:
+                channel = self._channels.setdefault(camera_ip, _Channel())
+        return channel
+
+    def wants_frame(self, camera_ip: str) -> bool:
+        channel = self._channel(camera_ip)
+        return channel.viewers > 0 and time.monotonic() >= channel.next_encode
+
+    def publish(self, camera_ip: str, frame: np.ndarray, overlays: List[Overlay]) -> None:
+        """Annotate, encode once and wake every viewer of camera_ip."""
+        channel = self._channel(camera_ip)
+        channel.next_encode = time.monotonic() + self.interval
+        h, w = frame.shape[:2]
+        if w > self.max_width:
+            scale = self.max_width / float(w)
+            frame = cv2.resize(frame, (self.max_width, int(h * scale)), interpolation=cv2.INTER_AREA)
+            overlays = [(tuple(int(v * scale) for v in bbox), label, known) for bbox, label, known in overlays]
+        ok, buf = cv2.imencode(".jpg", draw_overlays(frame, overlays), [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            return
+        with channel.cond:
+            channel.jpeg = buf.tobytes()
+            channel.seq += 1
+            channel.encoded += 1
+            channel.cond.notify_all()
+
+    def cameras(self) -> List[str]:
+        return sorted(self._channels)
+
+    def _authorized(self, request: BaseHTTPRequestHandler) -> bool:
+        if not self.token:
+            return True
+        given = parse_qs(urlsplit(request.path).query).get("token", [""])[0]
+        if hmac.compare_digest(given.encode("utf-8"), self.token.encode("utf-8")):
+            return True
+        send(request, 403, "text/plain; charset=utf-8", b"forbidden\n")
+        return False
+
+    def stream(self, request: BaseHTTPRequestHandler) -> None:
+        """HTTP route: /preview.mjpg?camera=<ip> as multipart/x-mixed-replace."""
+        if not self._authorized(request):
+            return
+        camera_ip = parse_qs(urlsplit(request.path).query).get("camera", [""])[0]
+        if camera_ip not in self._channels:
+            send(request, 404, "text/plain; charset=utf-8", b"unknown camera\n")
+            return
+        channel = self._channel(camera_ip)
+        request.send_response(200)
+        request.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+        request.send_header("Cache-Control", "no-cache, private")
+        request.send_header("Pragma", "no-cache")
+        request.end_headers()
+        with channel.cond:
+            channel.viewers += 1
+            # A new viewer gets a frame right away instead of waiting out the FPS cap
+            channel.next_encode = 0.0
+        logging.info(f"Preview viewer connected to {camera_ip} ({channel.viewers} watching)")
+        try:
+            seq = 0
+            while not self._stopped.is_set():
+                with channel.cond:
+                    channel.cond.wait_for(lambda: channel.seq != seq or self._stopped.is_set(), timeout=5.0)
+                    if channel.seq == seq or channel.jpeg is None:
+                        continue
+                    seq, jpeg = channel.seq, channel.jpeg
+                request.wfile.write(f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n".encode("ascii"))
+                request.wfile.write(jpeg)
+                request.wfile.write(b"\r\n")
+                request.wfile.flush()
+        finally:
+            with channel.cond:
+                channel.viewers -= 1
+            logging.info(f"Preview viewer left {camera_ip} ({channel.viewers} watching)")
+
+    def index(self, request: BaseHTTPRequestHandler) -> None:
+        """HTTP route: /preview, one <img> per camera."""
+        if not self._authorized(request):
+            return
+        token = f"&amp;token={quote(self.token)}" if self.token else ""
+        items = "".join(
+            f'<div><h3>{html.escape(ip)}</h3><img src="/preview.mjpg?camera={quote(ip)}{token}"></div>'
+            for ip in self.cameras()
+        )
+        body = f"<!doctype html><html><head><title>NVR preview</title></head><body>{items or 'No cameras yet'}</body></html>".encode("utf-8")
+        send(request, 200, "text/html; charset=utf-8", body)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        for channel in list(self._channels.values()):
+            with channel.cond:
+                channel.cond.notify_all()
+
+    def stats(self) -> Dict:
+        return {ip: {"viewers": c.viewers, "encoded": c.encoded} for ip, c in list(self._channels.items())}
@@ -0,0 +1,152 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+from .attribute_store import AttributeStore
+from .capture_index import CaptureIndex
+
+# Order in which files are considered least valuable once over budget
+EVICTION_ORDER = ("low_quality", "duplicate", "oldest")
+
+
+class RetentionManager:
+    """
+    Keeps data/<category>/unknown within per-category byte and age budgets.
+
+    Each tick does a bounded amount of work, so the SD card never sees a
+    burst of deletes and the frame threads are not starved of I/O:
+    - at most max_deletes_per_tick files are removed,
+    - at most scan_per_tick directory entries are reconciled with the
+      capture index (files saved before the index existed, or by hand).
+    Files past max_age_days go first; while a category is over max_bytes,
+    eviction proceeds low quality -> burst duplicates -> oldest.
+    Deleted files are dropped from the capture index and tombstoned in the
+    attribute store, if one is given.
+    """
+
+    def __init__(self, capture_index: CaptureIndex, budgets: Dict[str, Dict], base_dir: str = "data", tick_sec: float = 30.0, max_deletes_per_tick: int = 50, scan_per_tick: int = 200, dup_window_sec: float = 2.0, attributes: Optional[AttributeStore] = None) -> None:
+        self.capture_index = capture_index
+        self.attributes = attributes
+        self.budgets = budgets
+        self.base_dir = base_dir
+        self.tick_sec = float(tick_sec)
+        self.max_deletes_per_tick = int(max_deletes_per_tick)
+        self.scan_per_tick = int(scan_per_tick)
+        self.dup_window_sec = float(dup_window_sec)
+        self.stop_event = threading.Event()
+        self._scanners: Dict[str, Optional[Iterator]] = {}
+        self.deleted: Dict[str, int] = {}
+        self.freed_bytes = 0
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, name="retention", daemon=True).start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+    def _run(self) -> None:
+        while not self.stop_event.wait(self.tick_sec):
+            try:
+                self.tick()
+            except Exception as e:
+                logging.error(f"Retention tick failed: {e}")
+
+    def tick(self) -> int:
+        """One bounded retention pass over every category. Returns files deleted."""
+        budget_left = self.max_deletes_per_tick
+        for category in self.budgets:
+            self._reconcile(category)
+            if budget_left > 0:
+                budget_left -= self._enforce(category, budget_left)
+        return self.max_deletes_per_tick - budget_left
+
+    def _unknown_dir(self, category: str) -> str:
+        return os.path.join(self.base_dir, category, "unknown")
+
+    def _reconcile(self, category: str) -> None:
+        """Index up to scan_per_tick unindexed files, resuming where the last tick stopped."""
+        scanner = self._scanners.get(category)
+        if scanner is None:
+            directory = self._unknown_dir(category)
+            if not os.path.isdir(directory):
+                return
+            scanner = self._scanners[category] = os.scandir(directory)
+        batch = []
+        for _ in range(self.scan_per_tick):
+            entry = next(scanner, None)
+            if entry is None:
+                # Directory exhausted: start a new pass next tick
+                scanner.close()
+                self._scanners[category] = None
+                break
+            if entry.is_file() and entry.name.lower().endswith(".jpg"):
+                batch.append(entry)
+        if not batch:
+            return
+        known = self.capture_index.has_paths(e.path for e in batch)
+        for entry in batch:
+            if entry.path in known:
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            # Quality unknown: only evicted by age or as the oldest once over budget
+            self.capture_index.add(entry.path, category, self._camera_from_name(entry.name), st.st_mtime, size=st.st_size)
+
+    @staticmethod
+    def _camera_from_name(name: str) -> str:
+        # ..._192_168_1_100.jpg
+        parts = name.rsplit(".", 1)[0].split("_")
+        return ".".join(parts[-4:]) if len(parts) >= 6 else "unknown"
+
+    def _enforce(self, category: str, limit: int) -> int:
+        budget = self.budgets.get(category) or {}
+        max_bytes = int(float(budget.get("max_mb", 0)) * 1024 * 1024)
+        max_age_days = float(budget.get("max_age_days", 0))
+        deleted = 0
+
+        if max_age_days > 0:
+            before = time.time() - max_age_days * 86400
+            deleted += self._evict(category, self.capture_index.eviction_candidates(category, "expired", limit, before_ts=before))
+
+        if max_bytes > 0:
+            _, used = self.capture_index.usage(category)
+            for kind in EVICTION_ORDER:
+                if used <= max_bytes or deleted >= limit:
+                    break
+                candidates = self.capture_index.eviction_candidates(category, kind, limit - deleted, dup_window_sec=self.dup_window_sec)
+                picked: List = []
+                for path, size in candidates:
+                    if used <= max_bytes:
+                        break
+                    picked.append((path, size))
+                    used -= size
+                deleted += self._evict(category, picked)
+        return deleted
+
+    def _evict(self, category: str, candidates) -> int:
+        removed = []
+        for path, size in candidates:
+            try:
+                os.remove(path)
+                self.freed_bytes += size
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logging.warning(f"Retention could not delete {path}: {e}")
+                continue
+            removed.append(path)
+        self.capture_index.remove(removed)
+        if removed and self.attributes is not None:
+            self.attributes.forget(removed)
+        if removed:
+            self.deleted[category] = self.deleted.get(category, 0) + len(removed)
+            logging.info(f"Retention: removed {len(removed)} file(s) from {category}/unknown")
+        return len(removed)
+
+    def stats(self) -> Dict:
+        usage = {c: dict(zip(("files", "bytes"), self.capture_index.usage(c))) for c in self.budgets}
+        return {"usage": usage, "deleted": dict(self.deleted), "freed_bytes": self.freed_bytes}
@@ -0,0 +1,17 @@
+import sqlite3
+from pathlib import Path
+
+
+def connect(db_path, timeout: float = 5.0) -> sqlite3.Connection:
+    """
+    Open a SQLite database in WAL mode so the NVR service and the webhook can
+    share it: readers never block the writer and each commit is atomic.
+    The connection is in autocommit mode; use explicit BEGIN for multi-statement
+    transactions. Callers sharing it across threads must serialize access.
+    """
+    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path), timeout=timeout, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+    return conn
@@ -1,37 +1,79 @@
+import logging
 import threading
 import time
-from typing import Callable, Any, Optional
+from typing import Callable, Optional, Union
 import cv2
 
+from .camera_source import FrameSource, RtspSource
+from .load_governor import LoadGovernor, Policy
+from .metrics import get_metrics
+
+
+def prepare_frame(frame, policy: Optional[Policy] = None):
+    """Downscale a decoded frame to the analysis resolution."""
+    h, w = frame.shape[:2]
+    if max(h, w) > 960:
+        frame = cv2.resize(frame, (w // 2, h // 2))
+    if policy is not None and policy.analysis_scale < 1.0:
+        h, w = frame.shape[:2]
+        frame = cv2.resize(frame, (int(w * policy.analysis_scale), int(h * policy.analysis_scale)), interpolation=cv2.INTER_AREA)
+    return frame
+
 
 class StreamWorker(threading.Thread):
-    def __init__(self, camera_ip: str, rtsp_url: str, on_frame: Callable[[str, Any], None], stop_event: threading.Event) -> None:
+    def __init__(self, camera_ip: str, source: Union[str, FrameSource], on_frame: Callable[..., None], stop_event: threading.Event, governor: Optional[LoadGovernor] = None) -> None:
         super().__init__(daemon=True)
         self.camera_ip = camera_ip
-        self.rtsp_url = rtsp_url
+        # A plain URL keeps the original RTSP behaviour
+        self.source = RtspSource(source) if isinstance(source, str) else source
         self.on_frame = on_frame
         self.stop_event = stop_event
-        self.cap: Optional[cv2.VideoCapture] = None
+        self.governor = governor
+        self.skipped_frames = 0
 
     def run(self) -> None:
-        self.cap = cv2.VideoCapture(self.rtsp_url)
-        if not self.cap.isOpened():
+        if not self.source.open():
+            self.source.release()
             return
+        metrics = get_metrics()
+        frames = metrics.counter("nvr_frames_total", camera=self.camera_ip)
+        skipped = metrics.counter("nvr_frames_skipped_total", camera=self.camera_ip)
+        errors = metrics.counter("nvr_frame_errors_total", camera=self.camera_ip)
+        decode = metrics.histogram("nvr_stage_seconds", camera=self.camera_ip, stage="decode")
+        last_analysis = 0.0
         while not self.stop_event.is_set():
-            ret, frame = self.cap.read()
-            if not ret:
+            # grab() keeps the stream drained. The FFmpeg backend decodes inside
+            # grab(), so skipped frames save analysis time, not decode time
+            t0 = time.perf_counter()
+            if not self.source.grab():
                 time.sleep(0.2)
                 continue
-            h, w = frame.shape[:2]
-            if max(h, w) > 960:
-                frame = cv2.resize(frame, (w // 2, h // 2))
+            policy = self.governor.policy(self.camera_ip) if self.governor else None
+            if policy is not None and policy.max_fps > 0 and time.monotonic() - last_analysis < 1.0 / policy.max_fps:
+                decode.observe(time.perf_counter() - t0)
+                self.skipped_frames += 1
+                skipped.inc()
+                continue
+            ret, frame = self.source.retrieve()
+            # "decode" is grab() + retrieve(), per frame read from the stream
+            decode.observe(time.perf_counter() - t0)
+            if not ret:
+                continue
+            with metrics.stage(self.camera_ip, "resize"):
+                frame = prepare_frame(frame, policy)
+            last_analysis = time.monotonic()
+            frames.inc()
             try:
-                self.on_frame(self.camera_ip, frame)
-            except Exception:
-                # Avoid breaking the thread on callback errors
-                pass
-        if self.cap is not None:
-            self.cap.release()
+                # The policy the frame was scaled with, not whatever the governor says by now
+                self.on_frame(self.camera_ip, frame, policy=policy)
+            except Exception as e:
+                # Avoid breaking the thread on callback errors, but keep them visible
+                errors.inc()
+                if errors.value == 1 or errors.value % 100 == 0:
+                    logging.error(f"on_frame failed for {self.camera_ip} ({int(errors.value)} error(s) so far): {e}")
+            if self.governor is not None:
+                self.governor.record(self.camera_ip, time.monotonic() - last_analysis)
+        self.source.release()
 
     def stop(self) -> None:
         self.stop_event.set()
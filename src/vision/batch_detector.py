@@ -0,0 +1,127 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from typing import List
+
+from .object_detection import Detection, ObjectDetector
+
+
+class BatchedObjectDetector:
+    """
+    Drop-in wrapper around ObjectDetector that merges frames from several
+    camera threads into one detect_batch() call.
+
+    detect() enqueues the frame and blocks until its result is ready. A
+    single inference thread takes the first waiting frame, then keeps
+    collecting for up to max_wait_ms (or until max_batch frames) before
+    running one blobFromImages() + forward() for all of them. max_wait_ms
+    is therefore the most latency batching adds to a frame.
+
+    A camera thread never waits more than timeout_ms for the batch: if its
+    frame has not been picked up by then it is withdrawn and detected
+    directly (ObjectDetector serializes forward passes itself). After
+    stop(), detect() always goes straight to the wrapped detector.
+    """
+
+    def __init__(self, detector: ObjectDetector, max_batch: int = 4, max_wait_ms: float = 15.0, timeout_ms: float = 2000.0) -> None:
+        self.detector = detector
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait_sec = max(0.0, float(max_wait_ms) / 1000.0)
+        self.timeout_sec = max(0.0, float(timeout_ms) / 1000.0)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+        self.batches = 0
+        self.frames = 0
+        self.fallbacks = 0
+
+    @property
+    def available(self) -> bool:
+        return self.detector.available
+
+    @staticmethod
+    def classify_group(label: str):
+        return ObjectDetector.classify_group(label)
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="batched-detector", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        # Release camera threads still waiting on a result
+        while True:
+            try:
+                _, future = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if not future.done():
+                future.set_result([])
+
+    def detect(self, frame) -> List[Detection]:
+        if not self.available:
+            return []
+        if self._stop.is_set():
+            return self.detector.detect(frame)
+        future: Future = Future()
+        self._queue.put((frame, future))
+        try:
+            return future.result(self.timeout_sec)
+        except TimeoutError:
+            pass
+        # Not picked up in time (inference thread stalled or stopped): withdraw it and run it here
+        if future.cancel():
+            self.fallbacks += 1
+            return self.detector.detect(frame)
+        # Already in a running batch: give it one more timeout
+        try:
+            return future.result(self.timeout_sec)
+        except TimeoutError:
+            logging.warning("Batched detection timed out; frame skipped")
+            return []
+
+    def _collect(self) -> list:
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.max_wait_sec
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            # Frames whose camera thread gave up waiting are skipped; the rest can no longer be cancelled
+            batch = [item for item in self._collect() if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            frames = [frame for frame, _ in batch]
+            try:
+                results = self.detector.detect_batch(frames)
+            except Exception as e:
+                logging.error(f"Batched detection failed: {e}")
+                results = [[] for _ in frames]
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+            self.batches += 1
+            self.frames += len(frames)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "frames": self.frames,
+            "avg_batch": round(self.frames / self.batches, 2) if self.batches else 0.0,
+            "queue_depth": self._queue.qsize(),
+            "fallbacks": self.fallbacks,
+        }
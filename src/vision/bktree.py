@@ -0,0 +1,58 @@
+from typing import Callable, Generic, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class BKTree(Generic[T]):
+    """
+    Árbol BK (Burkhard-Keller) para búsquedas por cercanía con una métrica
+    discreta (Hamming entre hashes, distancia de edición entre textos...).
+
+    search(item, radius) solo desciende a los hijos cuya arista está en
+    [d - radius, d + radius], así un radio pequeño visita una parte pequeña
+    del árbol en lugar de comparar contra todos los elementos.
+    """
+
+    def __init__(self, distance: Callable[[T, T], int]) -> None:
+        self.distance = distance
+        # Nodo: [item, {distancia_arista: nodo_hijo}]
+        self._root: Optional[list] = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, item: T) -> bool:
+        """Inserta item. Retorna False si ya existe uno idéntico (distancia 0)."""
+        if self._root is None:
+            self._root = [item, {}]
+            self._size = 1
+            return True
+        node = self._root
+        while True:
+            d = self.distance(item, node[0])
+            if d == 0:
+                return False
+            child = node[1].get(d)
+            if child is None:
+                node[1][d] = [item, {}]
+                self._size += 1
+                return True
+            node = child
+
+    def search(self, item: T, radius: int) -> List[Tuple[int, T]]:
+        """Pares (distancia, item_guardado) dentro de radius, del más cercano al más lejano."""
+        if self._root is None:
+            return []
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            d = self.distance(item, node[0])
+            if d <= radius:
+                found.append((d, node[0]))
+            for edge, child in node[1].items():
+                if d - radius <= edge <= d + radius:
+                    stack.append(child)
+        found.sort(key=lambda x: x[0])
+        return found
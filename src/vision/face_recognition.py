@@ -1,7 +1,11 @@
 import cv2
+import logging
 import os
-from pathlib import Path
-from typing import List, Tuple, Optional
+import tempfile
+import numpy as np
+from typing import Dict, List, Tuple, Optional
+
+from .gallery_cache import GalleryCache
 
 
 class FaceRecognizer:
@@ -12,34 +16,96 @@ class FaceRecognizer:
         self.labels = {}
         self.trained = False
     
-    def train_from_dir(self, face_dir: str, detector=None) -> None:
-        """Entrena el reconocedor con rostros de un directorio."""
-        face_dir_path = Path(face_dir)
-        if not face_dir_path.exists():
+    def train_from_dir(self, face_dir: str, detector=None, cache_dir: Optional[str] = None, entries: Optional[Dict[str, Dict]] = None) -> None:
+        """
+        Entrena el reconocedor con rostros de un directorio.
+        Con cache_dir carga el modelo LBPH guardado y solo procesa imágenes
+        nuevas (vía update); si alguna cambió o se eliminó, reentrena completo.
+        entries: resultado de GalleryCache.scan(face_dir) ya hecho por el llamador.
+        """
+        if entries is None:
+            entries = GalleryCache.scan(face_dir)
+        if not entries:
             return
-        
+        cache = GalleryCache(cache_dir, "faces") if cache_dir else None
+        manifest = cache.load_manifest() if cache else {"files": {}, "labels": {}}
+        cached_files = manifest["files"]
+
+        # Un manifiesto vacío o sin etiquetas no describe lbph.yml: entrenar desde cero
+        reusable = (
+            cache is not None
+            and cache.model_path.exists()
+            and bool(cached_files)
+            and bool(manifest["labels"])
+            and all(path in entries and GalleryCache.unchanged(entries[path], cached) for path, cached in cached_files.items())
+        )
+        if reusable:
+            # Ids de etiqueta estables entre arranques para poder usar update()
+            name_to_label = {name: int(label) for name, label in manifest["labels"].items()}
+        else:
+            name_to_label = {}
+        for entry in entries.values():
+            if entry["identity"] not in name_to_label:
+                name_to_label[entry["identity"]] = max(name_to_label.values(), default=-1) + 1
+
+        pending = [path for path in entries if not (reusable and path in cached_files)]
         faces_data = []
         labels_data = []
-        label_id = 0
-        
-        for person_dir in face_dir_path.iterdir():
-            if not person_dir.is_dir():
-                continue
-            
-            person_name = person_dir.name
-            self.labels[label_id] = person_name
-            
-            for img_file in person_dir.glob("*.jpg") + person_dir.glob("*.png"):
-                img = cv2.imread(str(img_file), cv2.IMREAD_GRAYSCALE)
-                if img is not None:
-                    faces_data.append(img)
-                    labels_data.append(label_id)
-            
-            label_id += 1
-        
-        if faces_data:
-            self.recognizer.train(faces_data, cv2.array(labels_data))
-            self.trained = True
+        for path in pending:
+            img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+            if img is not None:
+                faces_data.append(img)
+                labels_data.append(name_to_label[entries[path]["identity"]])
+
+        if reusable:
+            self.recognizer.read(str(cache.model_path))
+            if faces_data:
+                self.recognizer.update(faces_data, np.array(labels_data))
+        elif faces_data:
+            self.recognizer.train(faces_data, np.array(labels_data))
+        self.labels = {label: name for name, label in name_to_label.items()}
+        self.trained = reusable or bool(faces_data)
+        logging.info(f"Rostros: {len(entries)} imágenes, {len(pending)} procesadas, {len(entries) - len(pending)} desde caché")
+
+        if cache and self.trained and pending:
+            cache.root.mkdir(parents=True, exist_ok=True)
+            self.recognizer.write(str(cache.model_path))
+            manifest["files"] = entries
+            manifest["labels"] = name_to_label
+            cache.save_manifest(manifest)
+    
+    def enroll(self, identity: str, paths: List[str]) -> int:
+        """
+        Agrega rostros nuevos sin reiniciar el servicio.
+        LBPH.update() no es seguro mientras otro hilo llama predict(), así que
+        se actualiza una copia del modelo y luego se reemplaza la referencia.
+        """
+        faces_data = [img for img in (cv2.imread(p, cv2.IMREAD_GRAYSCALE) for p in paths) if img is not None]
+        if not faces_data:
+            return 0
+        labels: Dict[int, str] = dict(self.labels)
+        label = next((l for l, name in labels.items() if name == identity), None)
+        if label is None:
+            label = max(labels, default=-1) + 1
+            labels[label] = identity
+
+        model = cv2.face.LBPHFaceRecognizer_create()
+        if self.trained:
+            fd, tmp_path = tempfile.mkstemp(suffix=".yml")
+            os.close(fd)
+            try:
+                self.recognizer.write(tmp_path)
+                model.read(tmp_path)
+            finally:
+                os.remove(tmp_path)
+        model.update(faces_data, np.array([label] * len(faces_data)))
+
+        # Primero las etiquetas (superconjunto) y luego el modelo: un predict()
+        # concurrente siempre encuentra el nombre de la etiqueta que retorna
+        self.labels = labels
+        self.recognizer = model
+        self.trained = True
+        return len(faces_data)
     
     def recognize(self, frame, faces: List[Tuple[int, int, int, int]]) -> List[Tuple[Optional[str], float, Tuple[int, int, int, int]]]:
         """Reconoce rostros en un frame. Retorna lista de (nombre, confianza, bbox)."""
@@ -48,10 +114,11 @@ class FaceRecognizer:
         
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
         results = []
+        recognizer = self.recognizer
         
         for (x, y, w, h) in faces:
             roi = gray[y:y+h, x:x+w]
-            label, confidence = self.recognizer.predict(roi)
+            label, confidence = recognizer.predict(roi)
             name = self.labels.get(label)
             # LBPH: menor es mejor, invertir para que mayor sea mejor
             conf_score = max(0, 100 - confidence) / 100.0
@@ -0,0 +1,175 @@
+"""
+Caché en disco de galerías conocidas para arrancar rápido.
+
+Estructura dentro de <cache_dir>/<name>/:
+    manifest.json       -> {"files": {ruta: {identity, size, mtime}}, "labels": {...}}
+    lbph.yml            -> modelo LBPH serializado (solo rostros)
+    shards/<id>.npz     -> descriptores ORB comprimidos, uno por identidad
+
+Una imagen se considera sin cambios si su ruta, tamaño y mtime coinciden con
+el manifiesto; solo las nuevas o modificadas se vuelven a procesar.
+"""
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def _atomic_write_text(path: Path, text: str) -> None:
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+class GalleryCache:
+    """Manifiesto + artefactos cacheados de una galería (faces/vehicles/pets)."""
+
+    def __init__(self, cache_dir: str, name: str) -> None:
+        self.root = Path(cache_dir) / name
+        self.shards_dir = self.root / "shards"
+        self.manifest_path = self.root / "manifest.json"
+        self.model_path = self.root / "lbph.yml"
+
+    @staticmethod
+    def scan(root_dir: str) -> Dict[str, Dict]:
+        """Lista las imágenes de root_dir/<identidad>/ con tamaño y mtime."""
+        entries: Dict[str, Dict] = {}
+        if not os.path.isdir(root_dir):
+            return entries
+        for identity in sorted(os.listdir(root_dir)):
+            identity_dir = os.path.join(root_dir, identity)
+            if not os.path.isdir(identity_dir):
+                continue
+            with os.scandir(identity_dir) as it:
+                for entry in it:
+                    if not entry.is_file() or not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                        continue
+                    st = entry.stat()
+                    entries[entry.path] = {"identity": identity, "size": st.st_size, "mtime": st.st_mtime}
+        return entries
+
+    @staticmethod
+    def unchanged(entry: Dict, cached: Optional[Dict]) -> bool:
+        return (
+            cached is not None
+            and cached.get("identity") == entry["identity"]
+            and cached.get("size") == entry["size"]
+            and cached.get("mtime") == entry["mtime"]
+        )
+
+    def load_manifest(self) -> Dict:
+        if not self.manifest_path.exists():
+            return {"files": {}, "labels": {}}
+        try:
+            data = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+            data.setdefault("files", {})
+            data.setdefault("labels", {})
+            return data
+        except Exception:
+            logging.warning(f"Manifiesto de caché corrupto, se reconstruye: {self.manifest_path}")
+            return {"files": {}, "labels": {}}
+
+    def save_manifest(self, manifest: Dict) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        _atomic_write_text(self.manifest_path, json.dumps(manifest))
+
+    def _shard_path(self, identity: str) -> Path:
+        return self.shards_dir / f"{identity}.npz"
+
+    def load_shard(self, identity: str) -> Dict[str, np.ndarray]:
+        """Retorna {nombre_archivo: descriptores} de una identidad."""
+        path = self._shard_path(identity)
+        if not path.exists():
+            return {}
+        try:
+            with np.load(path) as data:
+                return {key: data[key] for key in data.files}
+        except Exception:
+            return {}
+
+    def save_shard(self, identity: str, descriptors: Dict[str, np.ndarray]) -> None:
+        self.shards_dir.mkdir(parents=True, exist_ok=True)
+        path = self._shard_path(identity)
+        if not descriptors:
+            if path.exists():
+                path.unlink()
+            return
+        # np.savez agrega ".npz" si falta, por eso el temporal termina en .npz
+        tmp = path.with_name(path.stem + ".tmp.npz")
+        np.savez_compressed(tmp, **descriptors)
+        os.replace(tmp, path)
+
+    def drop_stale_shards(self, identities: List[str]) -> None:
+        if not self.shards_dir.exists():
+            return
+        keep = set(identities)
+        for shard in self.shards_dir.glob("*.npz"):
+            if shard.stem not in keep:
+                shard.unlink()
+
+
+def compute_orb_descriptors(orb, path: str) -> Optional[np.ndarray]:
+    img = cv2.imread(path)
+    if img is None:
+        return None
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    _, des = orb.detectAndCompute(gray, None)
+    if des is None or len(des) == 0:
+        return None
+    return des
+
+
+def load_orb_gallery(root_dir: str, orb, cache: Optional[GalleryCache] = None, entries: Optional[Dict[str, Dict]] = None) -> Dict[str, List[np.ndarray]]:
+    """
+    Construye {identidad: [descriptores, ...]} reutilizando los shards
+    cacheados y calculando ORB solo para imágenes nuevas o modificadas.
+    """
+    if entries is None:
+        entries = GalleryCache.scan(root_dir)
+    by_identity: Dict[str, List[Tuple[str, Dict]]] = {}
+    for path, entry in entries.items():
+        by_identity.setdefault(entry["identity"], []).append((path, entry))
+
+    manifest = cache.load_manifest() if cache else {"files": {}}
+    cached_files = manifest["files"]
+    new_files: Dict[str, Dict] = {}
+    gallery: Dict[str, List[np.ndarray]] = {}
+    computed = 0
+
+    for identity, files in by_identity.items():
+        shard = cache.load_shard(identity) if cache else {}
+        descriptors: Dict[str, np.ndarray] = {}
+        dirty = False
+        for path, entry in files:
+            fname = os.path.basename(path)
+            cached = cached_files.get(path)
+            # "empty" marca imágenes ya procesadas que no produjeron descriptores
+            if GalleryCache.unchanged(entry, cached) and (fname in shard or cached.get("empty")):
+                des = shard.get(fname)
+            else:
+                des = compute_orb_descriptors(orb, path)
+                computed += 1
+                dirty = True
+            if des is not None:
+                descriptors[fname] = des
+            new_files[path] = dict(entry, empty=des is None)
+        if len(descriptors) != len(shard):
+            dirty = True
+        if cache and dirty:
+            cache.save_shard(identity, descriptors)
+        if descriptors:
+            gallery[identity] = list(descriptors.values())
+
+    if cache:
+        cache.drop_stale_shards(list(by_identity.keys()))
+        if computed or new_files.keys() != cached_files.keys():
+            manifest["files"] = new_files
+            cache.save_manifest(manifest)
+    logging.info(f"Galería {root_dir}: {len(entries)} imágenes, {computed} procesadas, {len(entries) - computed} desde caché")
+    return gallery
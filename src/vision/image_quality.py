@@ -1,7 +1,9 @@
 import cv2
 import numpy as np
 import yaml
+from functools import lru_cache
 from pathlib import Path
+from typing import Sequence
 
 # Umbrales por defecto (ajustables según necesidad)
 DEFAULTS = {
@@ -10,6 +12,9 @@ DEFAULTS = {
     "min_sharpness": 120,   # varianza del Laplaciano
     "min_contrast": 20,     # desviación estándar de grises
     "min_size": 48,         # tamaño mínimo del recorte
+    # evaluate() y evaluate_batch() miden sobre el recorte reducido (sin deformar)
+    # hasta este lado mayor, así nitidez y umbrales están en la misma escala
+    "analysis_side": 160,
 }
 
 
@@ -28,8 +33,33 @@ def _load_overrides() -> dict:
         return {}
 
 
-# Aplicar overrides en import
-DEFAULTS.update(_load_overrides())
+@lru_cache(maxsize=1)
+def get_thresholds() -> dict:
+    """Umbrales efectivos (DEFAULTS + config), leídos una sola vez al primer uso."""
+    params = DEFAULTS.copy()
+    params.update(_load_overrides())
+    return params
+
+
+def reload_thresholds() -> None:
+    """Vuelve a leer config/settings.yaml en el próximo uso."""
+    get_thresholds.cache_clear()
+
+
+def _analysis_gray(image: np.ndarray, side: int) -> np.ndarray:
+    """Gris float32 reducido, conservando la proporción, a lo sumo side px de lado mayor."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    h, w = gray.shape[:2]
+    scale = side / float(max(h, w))
+    if scale < 1.0:
+        gray = cv2.resize(gray, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+    return gray.astype(np.float32)
+
+
+def _laplacian(gray: np.ndarray) -> np.ndarray:
+    """Laplaciano de 4 vecinos (el kernel de cv2.Laplacian con ksize=1) sobre el interior."""
+    return (gray[..., :-2, 1:-1] + gray[..., 2:, 1:-1] + gray[..., 1:-1, :-2] + gray[..., 1:-1, 2:]
+            - 4.0 * gray[..., 1:-1, 1:-1])
 
 
 def evaluate(image: np.ndarray, category: str, **kwargs) -> dict:
@@ -40,21 +70,21 @@ def evaluate(image: np.ndarray, category: str, **kwargs) -> dict:
         return {"ok": False, "reason": "empty"}
 
     # Parámetros
-    params = DEFAULTS.copy()
+    params = get_thresholds().copy()
     params.update(kwargs)
 
     h, w = image.shape[:2]
     if h < params["min_size"] or w < params["min_size"]:
         return {"ok": False, "reason": "too_small", "h": h, "w": w}
 
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    gray = _analysis_gray(image, int(params["analysis_side"]))
 
     # Brillo y contraste
     brightness = float(np.mean(gray))
     contrast = float(np.std(gray))
 
-    # Nitidez (Laplaciano)
-    sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+    # Nitidez (varianza del Laplaciano)
+    sharpness = float(_laplacian(gray).var())
 
     ok = True
     reasons = []
@@ -86,3 +116,129 @@ def evaluate(image: np.ndarray, category: str, **kwargs) -> dict:
 
 def is_good(image: np.ndarray, category: str, **kwargs) -> bool:
     return evaluate(image, category, **kwargs).get("ok", False)
+
+
+# Una fila por recorte en evaluate_batch()
+BATCH_DTYPE = np.dtype([
+    ("ok", np.bool_),
+    ("brightness", np.float32),
+    ("contrast", np.float32),
+    ("sharpness", np.float32),
+    ("h", np.int32),
+    ("w", np.int32),
+    ("too_small", np.bool_),
+    ("dark", np.bool_),
+    ("overexposed", np.bool_),
+    ("blurry", np.bool_),
+    ("low_contrast", np.bool_),
+])
+BATCH_REASONS = ("too_small", "dark", "overexposed", "blurry", "low_contrast")
+
+
+def evaluate_batch(images: Sequence[np.ndarray], category: str, **kwargs) -> np.ndarray:
+    """
+    Evalúa muchos recortes ya decodificados de una vez (p. ej. una ráfaga).
+
+    Cada recorte se pasa a gris y se reduce como en evaluate() (misma
+    escala, mismas métricas y umbrales); se apilan en (N, side, side) con
+    una máscara de los pixeles válidos y las métricas se calculan en
+    float32 sobre la pila completa. Retorna un arreglo estructurado
+    BATCH_DTYPE de N filas.
+    """
+    params = get_thresholds().copy()
+    params.update(kwargs)
+    side = int(params["analysis_side"])
+    out = np.zeros(len(images), dtype=BATCH_DTYPE)
+    if len(images) == 0:
+        return out
+
+    stack = np.zeros((len(images), side, side), dtype=np.float32)
+    mask = np.zeros((len(images), side, side), dtype=bool)
+    valid = np.zeros(len(images), dtype=bool)
+    for i, image in enumerate(images):
+        if image is None or image.size == 0:
+            continue
+        out["h"][i], out["w"][i] = image.shape[:2]
+        gray = _analysis_gray(image, side)
+        gh, gw = gray.shape
+        stack[i, :gh, :gw] = gray
+        mask[i, :gh, :gw] = True
+        valid[i] = True
+
+    def masked_moments(values: np.ndarray, where: np.ndarray):
+        n = np.maximum(where.reshape(len(images), -1).sum(axis=1), 1)
+        flat = (values * where).reshape(len(images), -1)
+        mean = flat.sum(axis=1) / n
+        var = ((values - mean[:, None, None]) ** 2 * where).reshape(len(images), -1).sum(axis=1) / n
+        return mean, var
+
+    out["brightness"], var = masked_moments(stack, mask)
+    out["contrast"] = np.sqrt(var)
+    # El Laplaciano solo cuenta donde los 5 pixeles del kernel caen dentro del recorte
+    inner = mask[:, 1:-1, 1:-1] & mask[:, :-2, 1:-1] & mask[:, 2:, 1:-1] & mask[:, 1:-1, :-2] & mask[:, 1:-1, 2:]
+    _, out["sharpness"] = masked_moments(_laplacian(stack), inner)
+
+    out["too_small"] = (out["h"] < params["min_size"]) | (out["w"] < params["min_size"])
+    out["dark"] = out["brightness"] < params["min_brightness"]
+    out["overexposed"] = out["brightness"] > params["max_brightness"]
+    out["blurry"] = out["sharpness"] < params["min_sharpness"]
+    out["low_contrast"] = out["contrast"] < params["min_contrast"]
+    bad = np.zeros(len(images), dtype=bool)
+    for reason in BATCH_REASONS:
+        bad |= out[reason]
+    out["ok"] = valid & ~bad
+    return out
+
+
+def batch_row_to_dict(row: np.void, category: str) -> dict:
+    """Convierte una fila de evaluate_batch() al formato de evaluate()."""
+    return {
+        "ok": bool(row["ok"]),
+        "reasons": [r for r in BATCH_REASONS if row[r]],
+        "brightness": float(row["brightness"]),
+        "contrast": float(row["contrast"]),
+        "sharpness": float(row["sharpness"]),
+        "h": int(row["h"]),
+        "w": int(row["w"]),
+        "category": category,
+    }
+
+
+# Pesos por defecto del puntaje de "mejor toma"
+SHOT_WEIGHTS = {
+    "sharpness": 0.4,
+    "size": 0.25,
+    "frontal": 0.2,
+    "exposure": 0.15,
+}
+SHOT_REFERENCE_SIZE = 160  # lado (px) a partir del cual el tamaño ya no suma
+
+
+def symmetry(image: np.ndarray) -> float:
+    """Simetría izquierda-derecha en [0, 1]; aproxima qué tan de frente está el objeto."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (64, 64), interpolation=cv2.INTER_AREA).astype(np.float32)
+    diff = float(np.mean(np.abs(small - small[:, ::-1])))
+    return max(0.0, 1.0 - diff / 128.0)
+
+
+def shot_score(image: np.ndarray, category: str, metrics: dict = None, weights: dict = None) -> float:
+    """
+    Puntaje combinado en [0, 1] para elegir las mejores tomas de un objeto:
+    nitidez, tamaño, frontalidad y exposición. Las tomas que no pasan
+    evaluate() conservan la mitad del puntaje, para que igual se pueda
+    elegir la menos mala si no hay otra.
+    """
+    metrics = metrics if metrics is not None else evaluate(image, category)
+    if "sharpness" not in metrics:
+        return 0.0
+    w = SHOT_WEIGHTS.copy()
+    w.update(weights or {})
+    parts = {
+        "sharpness": min(1.0, float(np.log1p(metrics["sharpness"]) / np.log1p(1000.0))),
+        "size": min(1.0, min(metrics["h"], metrics["w"]) / float(SHOT_REFERENCE_SIZE)),
+        "frontal": symmetry(image),
+        "exposure": max(0.0, 1.0 - abs(metrics["brightness"] - 128.0) / 128.0),
+    }
+    score = sum(w.get(k, 0.0) * v for k, v in parts.items())
+    return score if metrics.get("ok", False) else score * 0.5
@@ -1,14 +1,45 @@
-from typing import List, Tuple, Dict
+from typing import List, Optional, Sequence, Tuple, Dict
+import logging
 import os
+import threading
 import cv2
 import numpy as np
 
+Detection = Tuple[str, float, Tuple[int, int, int, int]]
+
+# Config names -> cv2.dnn constants (names missing from the OpenCV build are ignored)
+DNN_BACKENDS = {
+    "default": "DNN_BACKEND_DEFAULT",
+    "opencv": "DNN_BACKEND_OPENCV",
+    "openvino": "DNN_BACKEND_INFERENCE_ENGINE",
+    "cuda": "DNN_BACKEND_CUDA",
+    "vulkan": "DNN_BACKEND_VKCOM",
+    "timvx": "DNN_BACKEND_TIMVX",
+}
+DNN_TARGETS = {
+    "cpu": "DNN_TARGET_CPU",
+    "opencl": "DNN_TARGET_OPENCL",
+    "opencl_fp16": "DNN_TARGET_OPENCL_FP16",
+    "myriad": "DNN_TARGET_MYRIAD",
+    "cuda": "DNN_TARGET_CUDA",
+    "cuda_fp16": "DNN_TARGET_CUDA_FP16",
+    "vulkan": "DNN_TARGET_VULKAN",
+    "npu": "DNN_TARGET_NPU",
+}
+
 
 class ObjectDetector:
     """
     MobileNet-SSD (Caffe) object detector via OpenCV DNN.
     Detects: person, car, bus, motorbike, bicycle, train, dog, cat.
-    Provide paths to prototxt and caffemodel.
+    Provide paths to prototxt and caffemodel, or onnx_model for an ONNX
+    export of the same network (its output must keep the SSD
+    DetectionOutput layout [1, 1, N, 7]). Quantized (int8 QDQ) ONNX models
+    load the same way; they run on the default/opencv backend + cpu target.
+
+    The network is shared by every camera thread, so forward passes are
+    serialized with a lock; detect_batch() amortizes that over several
+    frames with a single blobFromImages() + forward().
     """
 
     LABELS = [
@@ -20,33 +51,61 @@ class ObjectDetector:
     VEHICLE_CLASSES = {"car", "bus", "motorbike", "bicycle", "train"}
     PET_CLASSES = {"dog", "cat"}
 
-    def __init__(self, prototxt: str, model: str, conf_thresh: float = 0.5) -> None:
-        self.available = os.path.exists(prototxt) and os.path.exists(model)
+    INPUT_SIZE = (300, 300)
+    SCALE = 0.007843
+    MEAN = 127.5
+
+    def __init__(self, prototxt: str, model: str, conf_thresh: float = 0.5, onnx_model: Optional[str] = None, backend: str = "default", target: str = "cpu") -> None:
         self.conf_thresh = conf_thresh
-        if self.available:
-            self.net = cv2.dnn.readNetFromCaffe(prototxt, model)
+        self.net = None
+        self._lock = threading.Lock()
+        if onnx_model:
+            self.available = os.path.exists(onnx_model)
+            if self.available:
+                self.net = cv2.dnn.readNetFromONNX(onnx_model)
         else:
-            self.net = None
+            self.available = os.path.exists(prototxt) and os.path.exists(model)
+            if self.available:
+                self.net = cv2.dnn.readNetFromCaffe(prototxt, model)
+        if self.net is not None:
+            self._set_preferences(backend, target)
+
+    def _set_preferences(self, backend: str, target: str) -> None:
+        backend_id = getattr(cv2.dnn, DNN_BACKENDS.get(backend, ""), None)
+        target_id = getattr(cv2.dnn, DNN_TARGETS.get(target, ""), None)
+        if backend_id is None or target_id is None:
+            logging.warning(f"DNN backend/target not available in this OpenCV build: {backend}/{target}; using defaults")
+            return
+        self.net.setPreferableBackend(backend_id)
+        self.net.setPreferableTarget(target_id)
+
+    def detect(self, frame) -> List[Detection]:
+        return self.detect_batch([frame])[0]
 
-    def detect(self, frame) -> List[Tuple[str, float, Tuple[int, int, int, int]]]:
-        results: List[Tuple[str, float, Tuple[int, int, int, int]]] = []
-        if not self.available or self.net is None:
+    def detect_batch(self, frames: Sequence[np.ndarray]) -> List[List[Detection]]:
+        """Detect on several frames (any size) with a single forward pass."""
+        results: List[List[Detection]] = [[] for _ in frames]
+        if not self.available or self.net is None or not frames:
             return results
-        (h, w) = frame.shape[:2]
-        blob = cv2.dnn.blobFromImage(cv2.resize(frame, (300, 300)), 0.007843, (300, 300), 127.5)
-        self.net.setInput(blob)
-        detections = self.net.forward()
-        for i in range(0, detections.shape[2]):
-            confidence = detections[0, 0, i, 2]
-            if confidence < self.conf_thresh:
+        resized = [cv2.resize(f, self.INPUT_SIZE) for f in frames]
+        blob = cv2.dnn.blobFromImages(resized, self.SCALE, self.INPUT_SIZE, self.MEAN)
+        with self._lock:
+            self.net.setInput(blob)
+            detections = self.net.forward()
+        # Each row: [image_id, class_id, confidence, x0, y0, x1, y1] (relative coordinates)
+        rows = detections.reshape(-1, 7)
+        for image_id, idx, confidence, x0, y0, x1, y1 in rows:
+            if confidence < self.conf_thresh or not 0 <= int(image_id) < len(frames):
                 continue
-            idx = int(detections[0, 0, i, 1])
+            i = int(image_id)
+            h, w = frames[i].shape[:2]
+            idx = int(idx)
             label = self.LABELS[idx] if 0 <= idx < len(self.LABELS) else "unknown"
-            box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
+            box = np.array([x0, y0, x1, y1]) * np.array([w, h, w, h])
             (startX, startY, endX, endY) = box.astype("int")
             x, y = max(0, startX), max(0, startY)
             bw, bh = max(0, endX - startX), max(0, endY - startY)
-            results.append((label, float(confidence), (x, y, bw, bh)))
+            results[i].append((label, float(confidence), (x, y, bw, bh)))
         return results
 
     @staticmethod
@@ -0,0 +1,139 @@
+"""
+Hashes perceptuales de recortes y supresión de casi-duplicados.
+
+Un objeto quieto frente a la cámara produce recortes casi idénticos en cada
+frame; guardarlos todos llena el disco y engorda las galerías ORB/LBPH sin
+aportar información. Cada recorte se reduce a un hash de 64 bits y se compara
+por distancia de Hamming contra los recientes de la misma clave.
+"""
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Hashable, Iterable, Optional
+
+import cv2
+import numpy as np
+
+from .bktree import BKTree
+
+
+def _gray(image: np.ndarray) -> np.ndarray:
+    if image.ndim == 3:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.astype(np.uint8).ravel()).tobytes(), "big")
+
+
+def dhash(image: np.ndarray, hash_size: int = 8) -> int:
+    """Difference hash: gradiente horizontal sobre el recorte reducido a (hash_size+1)x hash_size."""
+    small = cv2.resize(_gray(image), (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    return _bits_to_int(small[:, 1:] > small[:, :-1])
+
+
+def phash(image: np.ndarray, hash_size: int = 8) -> int:
+    """Hash por DCT: frecuencias bajas de una versión 4x más grande que el hash, contra su mediana."""
+    side = hash_size * 4
+    small = cv2.resize(_gray(image), (side, side), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:hash_size, :hash_size]
+    # El coeficiente DC (brillo medio) no se usa para la mediana
+    median = np.median(low.ravel()[1:])
+    return _bits_to_int(low > median)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+HASHERS: Dict[str, Callable[[np.ndarray], int]] = {"dhash": dhash, "phash": phash}
+
+
+class DuplicateSuppressor:
+    """
+    Índice de hashes recientes por clave (p. ej. (cámara, categoría) o
+    (categoría, identidad)) con un árbol BK por clave.
+
+    check() retorna True si el hash está a max_distance bits o menos de uno
+    guardado para esa clave (el recorte se debe descartar); si no, lo agrega.
+    Con window_sec > 0 los hashes caducan tras ese tiempo, de modo que un
+    objeto que sigue quieto se vuelve a guardar una vez por ventana.
+    window_sec <= 0 significa sin caducidad (galerías known/).
+    Con enabled=False is_duplicate() nunca suprime nada.
+    """
+
+    def __init__(self, max_distance: int = 6, window_sec: float = 10.0, method: str = "dhash", enabled: bool = True) -> None:
+        if method not in HASHERS:
+            raise ValueError(f"Unknown hash method: {method}")
+        self.max_distance = int(max_distance)
+        self.window_sec = float(window_sec)
+        self.hasher = HASHERS[method]
+        self.enabled = enabled
+        self._trees: Dict[Hashable, BKTree] = {}
+        self._entries: Dict[Hashable, deque] = {}
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.suppressed: Dict[str, int] = {}
+
+    def hash(self, image: np.ndarray) -> int:
+        return self.hasher(image)
+
+    def has_key(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._trees
+
+    def seed(self, key: Hashable, hashes: Iterable[int]) -> None:
+        """Carga hashes existentes para key (p. ej. las imágenes ya en known/<identidad>)."""
+        now = time.time()
+        with self._lock:
+            for h in hashes:
+                self._add(key, h, now)
+            self._trees.setdefault(key, BKTree(hamming))
+            self._entries.setdefault(key, deque())
+
+    def _add(self, key: Hashable, h: int, now: float) -> None:
+        self._trees.setdefault(key, BKTree(hamming)).add(h)
+        self._entries.setdefault(key, deque()).append((now, h))
+
+    def _expire(self, key: Hashable, now: float) -> None:
+        entries = self._entries.get(key)
+        if not entries or self.window_sec <= 0:
+            return
+        expired = False
+        while entries and now - entries[0][0] > self.window_sec:
+            entries.popleft()
+            expired = True
+        if expired:
+            # Los árboles BK no soportan borrado: se reconstruye con lo vigente
+            tree = BKTree(hamming)
+            for _, h in entries:
+                tree.add(h)
+            self._trees[key] = tree
+
+    def check(self, key: Hashable, h: int, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        with self._lock:
+            self.checked += 1
+            self._expire(key, now)
+            tree = self._trees.get(key)
+            if tree is not None and tree.search(h, self.max_distance):
+                label = ":".join(str(k) for k in key) if isinstance(key, tuple) else str(key)
+                self.suppressed[label] = self.suppressed.get(label, 0) + 1
+                return True
+            self._add(key, h, now)
+            return False
+
+    def is_duplicate(self, key: Hashable, image: np.ndarray) -> bool:
+        if not self.enabled:
+            return False
+        return self.check(key, self.hash(image))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "checked": self.checked,
+                "suppressed": sum(self.suppressed.values()),
+                "suppressed_by_key": dict(self.suppressed),
+                "keys": len(self._trees),
+            }
@@ -1,8 +1,9 @@
 from typing import List, Tuple, Optional, Dict
-import os
 import cv2
 import numpy as np
 
+from .gallery_cache import GalleryCache, compute_orb_descriptors, load_orb_gallery
+
 
 class PetRecognizer:
     """
@@ -16,34 +17,29 @@ class PetRecognizer:
         self.pet_descriptors: Dict[str, List] = {}
         self.trained = False
 
-    def train_from_dir(self, root_dir: str) -> None:
+    def train_from_dir(self, root_dir: str, cache_dir: Optional[str] = None, entries: Optional[Dict[str, Dict]] = None) -> None:
         """
         Carga imágenes de mascotas conocidas desde subdirectorios.
         Estructura: data/pets/known/Fido/foto1.jpg
+        Con cache_dir, reutiliza los descriptores ORB guardados en disco.
+        entries: resultado de GalleryCache.scan(root_dir) ya hecho por el llamador.
         """
-        if not os.path.exists(root_dir):
-            return
-        for pet_name in sorted(os.listdir(root_dir)):
-            pet_dir = os.path.join(root_dir, pet_name)
-            if not os.path.isdir(pet_dir):
-                continue
-            descriptors_list = []
-            for fname in os.listdir(pet_dir):
-                if not fname.lower().endswith((".jpg", ".jpeg", ".png")):
-                    continue
-                path = os.path.join(pet_dir, fname)
-                img = cv2.imread(path)
-                if img is None:
-                    continue
-                gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-                kp, des = self.orb.detectAndCompute(gray, None)
-                if des is not None and len(des) > 0:
-                    descriptors_list.append(des)
-            if descriptors_list:
-                self.pet_descriptors[pet_name] = descriptors_list
+        cache = GalleryCache(cache_dir, "pets") if cache_dir else None
+        self.pet_descriptors = load_orb_gallery(root_dir, self.orb, cache, entries)
         if self.pet_descriptors:
             self.trained = True
 
+    def enroll(self, identity: str, paths: List[str]) -> int:
+        """Agrega fotos nuevas de una mascota en caliente (copia + reemplazo atómico)."""
+        new_des = [d for d in (compute_orb_descriptors(self.orb, p) for p in paths) if d is not None]
+        if not new_des:
+            return 0
+        gallery = dict(self.pet_descriptors)
+        gallery[identity] = list(gallery.get(identity, [])) + new_des
+        self.pet_descriptors = gallery
+        self.trained = True
+        return len(new_des)
+
     def recognize(self, frame, bbox: Tuple[int, int, int, int]) -> Tuple[Optional[str], float]:
         """
         Reconoce mascota por descriptores ORB.
@@ -65,7 +61,8 @@ class PetRecognizer:
         best_match = None
         best_score = 0.0
         
-        for pet_name, desc_list in self.pet_descriptors.items():
+        gallery = self.pet_descriptors
+        for pet_name, desc_list in gallery.items():
             max_matches = 0
             for stored_des in desc_list:
                 matches = self.bf.match(des, stored_des)
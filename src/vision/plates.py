@@ -0,0 +1,393 @@
+"""
+Placas de vehículos: localización, OCR e índice de placas conocidas.
+
+- localize_plates() busca regiones candidatas en el recorte del vehículo
+  por morfología (black-hat + gradiente horizontal + cierre), sin modelos.
+- OcrEngine es la interfaz de lectura; hay un motor con Tesseract
+  (pytesseract, opcional) y otro con un modelo CRNN de OpenCV DNN.
+- PlateReader lee cada vehículo seguido (por IoU) solo en sus mejores
+  frames, en un hilo aparte, vota entre lecturas ponderando la confianza
+  del OCR y guarda el resultado por track: el OCR no corre en cada frame
+  ni en el hilo de la cámara.
+- PlateIndex: las carpetas de data/vehicles/known/ llevan la placa en el
+  nombre (ABC123, PLACA_ABC123, ABC123_toyota_rojo...). Al entrenar se
+  construye un diccionario placa_normalizada -> vehículo para la búsqueda
+  exacta (O(1)) y un árbol BK con distancia de edición para tolerar errores
+  de OCR (0 por O, 8 por B, un carácter perdido...), acotado a max_edits.
+"""
+import heapq
+import logging
+import os
+import re
+import string
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .bktree import BKTree
+from .image_quality import shot_score
+from .tracking import iou
+
+PLATE_MIN_LEN = 5
+PLATE_MAX_LEN = 8
+
+
+def normalize_plate(text: Optional[str]) -> str:
+    """Mayúsculas, solo letras y dígitos: 'abc-123 ' -> 'ABC123'."""
+    return re.sub(r"[^A-Z0-9]", "", (text or "").upper())
+
+
+def plate_from_identity(identity: str) -> Optional[str]:
+    """Primer fragmento del nombre con letras y dígitos y largo de placa, normalizado."""
+    for token in re.split(r"[^A-Za-z0-9]+", identity):
+        token = token.upper()
+        if PLATE_MIN_LEN <= len(token) <= PLATE_MAX_LEN and re.search(r"[A-Z]", token) and re.search(r"[0-9]", token):
+            return token
+    return None
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Distancia de Levenshtein (inserción, borrado, sustitución)."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+class PlateIndex:
+    """Placa normalizada -> vehículo, exacta o con hasta max_edits errores."""
+
+    def __init__(self, max_edits: int = 1) -> None:
+        self.max_edits = max(0, int(max_edits))
+        self.by_plate: Dict[str, str] = {}
+        self.tree: BKTree[str] = BKTree(edit_distance)
+
+    @classmethod
+    def from_identities(cls, identities: Iterable[str], max_edits: int = 1) -> "PlateIndex":
+        index = cls(max_edits)
+        for identity in identities:
+            index.add(identity)
+        return index
+
+    @staticmethod
+    def identities_in(root_dir: str) -> Iterable[str]:
+        if not os.path.isdir(root_dir):
+            return []
+        return [d for d in os.listdir(root_dir) if os.path.isdir(os.path.join(root_dir, d))]
+
+    def add(self, identity: str) -> Optional[str]:
+        plate = plate_from_identity(identity)
+        if plate is not None:
+            self.by_plate[plate] = identity
+            self.tree.add(plate)
+        return plate
+
+    def copy(self) -> "PlateIndex":
+        return PlateIndex.from_identities(self.by_plate.values(), self.max_edits)
+
+    def __len__(self) -> int:
+        return len(self.by_plate)
+
+    def lookup(self, text: Optional[str]) -> Tuple[Optional[str], int]:
+        """
+        (vehículo, distancia) de la placa leída, o (None, -1). Si dos
+        vehículos distintos quedan a la misma distancia mínima no se elige
+        ninguno: mejor caer al reconocimiento visual que acertar al azar.
+        """
+        plate = normalize_plate(text)
+        if len(plate) < PLATE_MIN_LEN - self.max_edits:
+            return (None, -1)
+        identity = self.by_plate.get(plate)
+        if identity is not None:
+            return (identity, 0)
+        if self.max_edits == 0:
+            return (None, -1)
+        found = self.tree.search(plate, self.max_edits)
+        if not found:
+            return (None, -1)
+        best = found[0][0]
+        closest = {self.by_plate[p] for d, p in found if d == best}
+        if len(closest) != 1:
+            return (None, -1)
+        return (closest.pop(), best)
+
+
+def localize_plates(crop: np.ndarray, max_candidates: int = 3) -> List[Tuple[int, int, int, int]]:
+    """
+    Cajas (x, y, w, h) candidatas a placa dentro del recorte, de la más
+    grande a la más chica. Caracteres oscuros sobre fondo claro: el
+    black-hat los resalta, el gradiente en x marca los bordes verticales de
+    los caracteres y el cierre los une en un bloque alargado.
+    """
+    if crop is None or crop.size == 0:
+        return []
+    h, w = crop.shape[:2]
+    scale = 320.0 / w if w > 320 else 1.0
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    if scale != 1.0:
+        gray = cv2.resize(gray, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+    rect = cv2.getStructuringElement(cv2.MORPH_RECT, (13, 5))
+    blackhat = cv2.morphologyEx(gray, cv2.MORPH_BLACKHAT, rect)
+    light = cv2.morphologyEx(gray, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3)))
+    light = cv2.threshold(light, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
+    grad = np.absolute(cv2.Sobel(blackhat, cv2.CV_32F, 1, 0, ksize=-1))
+    grad = cv2.normalize(grad, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+    grad = cv2.GaussianBlur(grad, (5, 5), 0)
+    grad = cv2.morphologyEx(grad, cv2.MORPH_CLOSE, rect)
+    mask = cv2.threshold(grad, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
+    mask = cv2.dilate(cv2.erode(mask, None, iterations=2), None, iterations=2)
+    mask = cv2.bitwise_and(mask, mask, mask=light)
+    mask = cv2.erode(cv2.dilate(mask, None, iterations=2), None, iterations=1)
+    contours = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
+    boxes = []
+    for c in sorted(contours, key=cv2.contourArea, reverse=True):
+        x, y, bw, bh = cv2.boundingRect(c)
+        # Proporción de placa (de una línea) y tamaño mínimo legible
+        if bh < 8 or bw < 0.1 * gray.shape[1] or not 2.0 <= bw / float(bh) <= 6.5:
+            continue
+        boxes.append(tuple(int(round(v / scale)) for v in (x, y, bw, bh)))
+        if len(boxes) >= max_candidates:
+            break
+    return boxes
+
+
+class OcrEngine:
+    """Interfaz de OCR de placas: read(imagen) -> (texto, confianza 0-1)."""
+
+    available = True
+
+    def read(self, image: np.ndarray) -> Tuple[str, float]:
+        raise NotImplementedError
+
+
+class TesseractOcr(OcrEngine):
+    """Tesseract vía pytesseract (opcional: pip install pytesseract + apt install tesseract-ocr)."""
+
+    def __init__(self, psm: int = 7) -> None:
+        self.config = f"--psm {int(psm)} -c tessedit_char_whitelist={string.ascii_uppercase}{string.digits}"
+        try:
+            import pytesseract
+            pytesseract.get_tesseract_version()
+            self._tesseract = pytesseract
+            self.available = True
+        except Exception as e:
+            logging.warning(f"Tesseract no disponible, OCR de placas desactivado: {e}")
+            self._tesseract = None
+            self.available = False
+
+    def read(self, image: np.ndarray) -> Tuple[str, float]:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
+        data = self._tesseract.image_to_data(binary, config=self.config, output_type=self._tesseract.Output.DICT)
+        words = [(t, float(c)) for t, c in zip(data["text"], data["conf"]) if t.strip() and float(c) >= 0]
+        if not words:
+            return ("", 0.0)
+        return ("".join(t for t, _ in words), sum(c for _, c in words) / len(words) / 100.0)
+
+
+class DnnOcr(OcrEngine):
+    """
+    Modelo CRNN (CTC) con cv2.dnn.TextRecognitionModel, p. ej. los crnn*.onnx
+    de los ejemplos de OpenCV. El modelo no reporta confianza: cada lectura
+    pesa 1 en la votación.
+    """
+
+    def __init__(self, model: str, vocabulary: str, gray: bool = True) -> None:
+        self.gray = gray
+        self.available = os.path.exists(model) and os.path.exists(vocabulary)
+        self._model = None
+        if not self.available:
+            logging.warning(f"Modelo OCR no encontrado ({model} / {vocabulary}), OCR de placas desactivado")
+            return
+        with open(vocabulary, "r", encoding="utf-8") as f:
+            vocab = [line.strip() for line in f if line.strip()]
+        self._model = cv2.dnn.TextRecognitionModel(model)
+        self._model.setDecodeType("CTC-greedy")
+        self._model.setVocabulary(vocab)
+        self._model.setInputParams(1.0 / 127.5, (100, 32), (127.5, 127.5, 127.5), True)
+
+    def read(self, image: np.ndarray) -> Tuple[str, float]:
+        if self.gray and image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        text = self._model.recognize(image)
+        return (text, 1.0 if text else 0.0)
+
+
+def build_ocr(engine: str, **options) -> Optional[OcrEngine]:
+    """Motor de OCR según configuración ("tesseract", "dnn" o "none"); None si no está disponible."""
+    if engine == "tesseract":
+        ocr = TesseractOcr(psm=int(options.get("psm", 7)))
+    elif engine == "dnn":
+        ocr = DnnOcr(options.get("model", "models/crnn.onnx"), options.get("vocabulary", "models/alphabet_36.txt"), gray=bool(options.get("gray", True)))
+    else:
+        return None
+    return ocr if ocr.available else None
+
+
+def read_plate(crop: np.ndarray, ocr: OcrEngine, localize: Callable = localize_plates) -> Tuple[Optional[str], float]:
+    """Localiza y lee la placa de un recorte de vehículo: (texto normalizado, confianza) o (None, 0.0)."""
+    best_text, best_conf = None, 0.0
+    for x, y, w, h in localize(crop):
+        region = crop[y:y + h, x:x + w]
+        # Tesseract y CRNN leen mejor con caracteres de ~30-40 px de alto
+        if h < 40:
+            region = cv2.resize(region, None, fx=40.0 / h, fy=40.0 / h, interpolation=cv2.INTER_CUBIC)
+        text, conf = ocr.read(region)
+        text = normalize_plate(text)
+        if PLATE_MIN_LEN <= len(text) <= PLATE_MAX_LEN and conf > best_conf:
+            best_text, best_conf = text, conf
+    return (best_text, best_conf)
+
+
+class _PlateTrack:
+    __slots__ = ("bbox", "last_seen", "scores", "reads", "counts", "weights", "pending", "plate")
+
+    def __init__(self, bbox: tuple, now: float) -> None:
+        self.bbox = bbox
+        self.last_seen = now
+        self.scores: List[float] = []  # min-heap de los mejores puntajes leídos
+        self.reads = 0
+        self.counts: Dict[str, int] = defaultdict(int)  # lecturas por texto
+        self.weights: Dict[str, float] = defaultdict(float)  # suma de confianzas por texto
+        self.pending = False  # hay una lectura en curso
+        self.plate: Optional[str] = None  # decidida: ya no se hace OCR
+
+    def leader(self, min_votes: int) -> Optional[str]:
+        """
+        Texto con mayoría estricta del peso (confianza) de las lecturas y al
+        menos min_votes lecturas: una lectura confiada no la tapan varias
+        dudosas de otro texto, pero ninguna lectura sola basta.
+        """
+        total = sum(self.weights.values())
+        for text, weight in self.weights.items():
+            if weight * 2 > total and self.counts[text] >= min_votes:
+                return text
+        return None
+
+
+class PlateReader:
+    """
+    OCR de placas consciente de tracks.
+
+    Cada vehículo se sigue por IoU dentro de su cámara. Un frame solo se
+    lee si su shot_score llega a min_quality y entra en el top_k de los ya
+    leídos del track (los primeros top_k siempre entran; después, solo
+    frames mejores), y nunca más de max_reads veces por track. La lectura
+    corre en un pool de workers hilos: observe() solo copia el recorte y
+    vuelve, y el resultado se ve en los frames siguientes. Hay a lo sumo
+    una lectura en curso por track, y max_pending en total; el resto de
+    los frames se salta.
+
+    Cada lectura con texto es un voto ponderado por la confianza del OCR.
+    Una placa queda decidida cuando suma min_votes lecturas y tiene
+    mayoría estricta del peso; si se agotan las max_reads, con la mayoría
+    del peso y al menos 2 lecturas (salvo min_votes=1). Hasta que haya
+    placa decidida observe() devuelve None: una sola lectura de OCR nunca
+    basta para dar por conocido un vehículo.
+    """
+
+    def __init__(self, ocr: OcrEngine, top_k: int = 3, max_reads: int = 5, min_votes: int = 2, iou_threshold: float = 0.3, track_idle_sec: float = 2.0, min_quality: float = 0.3, workers: int = 1, max_pending: int = 8, localize: Callable = localize_plates) -> None:
+        self.ocr = ocr
+        self.top_k = max(1, int(top_k))
+        self.max_reads = max(1, int(max_reads))
+        self.min_votes = max(1, int(min_votes))
+        self.iou_threshold = float(iou_threshold)
+        self.track_idle_sec = float(track_idle_sec)
+        self.min_quality = float(min_quality)
+        self.max_pending = max(1, int(max_pending))
+        self.localize = localize
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="plate-ocr")
+        self._tracks: Dict[str, List[_PlateTrack]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.ocr_calls = 0
+        self.cache_hits = 0
+        self.skipped = 0
+        self.low_quality = 0
+
+    def _track(self, camera_ip: str, bbox: tuple, now: float) -> _PlateTrack:
+        tracks = [t for t in self._tracks[camera_ip] if now - t.last_seen <= self.track_idle_sec]
+        best, best_iou = None, self.iou_threshold
+        for t in tracks:
+            overlap = iou(t.bbox, bbox)
+            if overlap >= best_iou:
+                best, best_iou = t, overlap
+        if best is None:
+            best = _PlateTrack(bbox, now)
+            tracks.append(best)
+        best.bbox = bbox
+        best.last_seen = now
+        self._tracks[camera_ip] = tracks
+        return best
+
+    def observe(self, camera_ip: str, bbox: Tuple[int, int, int, int], frame: np.ndarray, now: Optional[float] = None) -> Optional[str]:
+        """Placa decidida del vehículo en bbox, o None mientras no la haya."""
+        now = time.time() if now is None else now
+        bbox = tuple(int(v) for v in bbox)
+        with self._lock:
+            track = self._track(camera_ip, bbox, now)
+            if track.plate is not None:
+                self.cache_hits += 1
+                return track.plate
+            if track.pending or track.reads >= self.max_reads or self._pending >= self.max_pending:
+                self.skipped += 1
+                return None
+        x, y, w, h = bbox
+        crop = frame[max(0, y):y + h, max(0, x):x + w]
+        if crop.size == 0:
+            return None
+        score = shot_score(crop, "vehicles")
+        with self._lock:
+            if score < self.min_quality:
+                self.low_quality += 1
+                return None
+            if track.pending or (len(track.scores) >= self.top_k and score <= track.scores[0]):
+                self.skipped += 1
+                return None
+            # Reservar la lectura antes de soltar el lock (otro frame del mismo track no la repite)
+            if len(track.scores) >= self.top_k:
+                heapq.heapreplace(track.scores, score)
+            else:
+                heapq.heappush(track.scores, score)
+            track.reads += 1
+            track.pending = True
+            self._pending += 1
+            self.ocr_calls += 1
+        # Copia: el worker lee después y el buffer del frame se reutiliza
+        self._executor.submit(self._read, track, crop.copy())
+        return None
+
+    def _read(self, track: _PlateTrack, crop: np.ndarray) -> None:
+        try:
+            text, conf = read_plate(crop, self.ocr, self.localize)
+        except Exception as e:
+            logging.debug(f"Plate OCR failed: {e}")
+            text, conf = None, 0.0
+        with self._lock:
+            track.pending = False
+            self._pending -= 1
+            if text:
+                track.counts[text] += 1
+                track.weights[text] += conf
+            leader = track.leader(self.min_votes)
+            if leader is None and track.reads >= self.max_reads:
+                leader = track.leader(min(2, self.min_votes))
+            track.plate = leader
+
+    def stop(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            active = sum(len(t) for t in self._tracks.values())
+        return {"active_tracks": active, "ocr_calls": self.ocr_calls, "pending": self._pending, "cache_hits": self.cache_hits, "skipped_frames": self.skipped, "low_quality": self.low_quality}
@@ -0,0 +1,180 @@
+"""
+Seguimiento simple por IoU y selección de las mejores tomas por objeto.
+
+Un mismo objeto aparece en decenas de frames seguidos; en lugar de guardar,
+notificar y enrolar cada recorte, se agrupan por track y solo se conservan
+los top-K según image_quality.shot_score().
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .image_quality import batch_row_to_dict, evaluate_batch, shot_score
+
+
+def iou(a: Tuple[int, int, int, int], b: Tuple[int, int, int, int]) -> float:
+    """IoU entre dos cajas (x, y, w, h)."""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Track:
+    """Objeto seguido en una cámara, con un heap (mínimo arriba) de sus mejores tomas."""
+
+    def __init__(self, track_id: int, camera_ip: str, category: str, bbox: tuple, now: float) -> None:
+        self.track_id = track_id
+        self.camera_ip = camera_ip
+        self.category = category
+        self.bbox = bbox
+        self.first_seen = now
+        self.last_seen = now
+        self.last_frame = None
+        self.frames = 0
+        self.reported = False
+        # (score, seq, crop, quality, context)
+        self.shots: List[tuple] = []
+
+    def best(self) -> List[tuple]:
+        """Tomas de mejor a peor como (score, crop, quality, context)."""
+        return [(s[0], s[2], s[3], s[4]) for s in sorted(self.shots, key=lambda s: (-s[0], s[1]))]
+
+
+class BestShotSelector:
+    """
+    Asocia detecciones a tracks por IoU (por cámara y categoría) y guarda
+    las top_k tomas de cada uno.
+
+    Un track queda listo (pop_ready) cuando deja de verse track_idle_sec o
+    cuando lleva max_track_sec activo, lo que ocurra primero; así la
+    notificación se demora como mucho max_track_sec. Tras reportarse, el
+    track se sigue asociando para no volver a reportar el mismo objeto,
+    pero ya no acumula tomas; reported() permite al llamador darles otro
+    destino (p. ej. una sesión de captura activa).
+
+    on_frame revisa los tracks de su cámara en cada frame; start() agrega un
+    barrido periódico de todas las cámaras para que un objeto se reporte
+    aunque su cámara deje de entregar frames, y stop() reporta lo pendiente.
+    """
+
+    def __init__(self, top_k: int = 3, iou_threshold: float = 0.3, track_idle_sec: float = 1.5, max_track_sec: float = 3.0, weights: Optional[Dict[str, float]] = None) -> None:
+        self.top_k = max(1, int(top_k))
+        self.iou_threshold = float(iou_threshold)
+        self.track_idle_sec = float(track_idle_sec)
+        self.max_track_sec = float(max_track_sec)
+        self.weights = weights or {}
+        self._tracks: Dict[int, Track] = {}
+        self._ids = itertools.count(1)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.offered = 0
+        self.reported_tracks = 0
+        self._on_ready: Optional[Callable[[Track], None]] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _match(self, camera_ip: str, category: str, bbox: tuple, frame_ts) -> Optional[Track]:
+        best, best_iou = None, self.iou_threshold
+        for t in self._tracks.values():
+            if t.camera_ip != camera_ip or t.category != category:
+                continue
+            # Una detección por track y por frame
+            if frame_ts is not None and t.last_frame == frame_ts:
+                continue
+            overlap = iou(t.bbox, bbox)
+            if overlap >= best_iou:
+                best, best_iou = t, overlap
+        return best
+
+    def offer(self, camera_ip: str, category: str, bbox: tuple, crop: np.ndarray, context: Optional[dict] = None, frame_ts=None, quality: Optional[dict] = None) -> int:
+        """
+        Registra una detección; retorna el id de su track. quality permite
+        pasar métricas ya calculadas (p. ej. con evaluate_batch por frame).
+        """
+        now = time.time()
+        bbox = tuple(int(v) for v in bbox)
+        with self._lock:
+            self.offered += 1
+            track = self._match(camera_ip, category, bbox, frame_ts)
+            if track is None:
+                track = Track(next(self._ids), camera_ip, category, bbox, now)
+                self._tracks[track.track_id] = track
+            track.bbox = bbox
+            track.last_seen = now
+            track.last_frame = frame_ts
+            track.frames += 1
+            if track.reported or crop is None or crop.size == 0:
+                return track.track_id
+        # Puntaje fuera del lock: es lo más costoso
+        if quality is None:
+            quality = batch_row_to_dict(evaluate_batch([crop], category)[0], category)
+        score = shot_score(crop, category, metrics=quality, weights=self.weights)
+        with self._lock:
+            if track.reported:
+                return track.track_id
+            if len(track.shots) < self.top_k:
+                heapq.heappush(track.shots, (score, next(self._seq), crop.copy(), quality, context or {}))
+            elif score > track.shots[0][0]:
+                heapq.heapreplace(track.shots, (score, next(self._seq), crop.copy(), quality, context or {}))
+        return track.track_id
+
+    def reported(self, track_id: int) -> bool:
+        """True si el track ya se reportó (offer() descarta sus tomas)."""
+        with self._lock:
+            track = self._tracks.get(track_id)
+            return track is not None and track.reported
+
+    def pop_ready(self, camera_ip: Optional[str] = None, flush: bool = False) -> List[Track]:
+        """Tracks listos para reportar (todos los pendientes si flush=True)."""
+        now = time.time()
+        ready = []
+        with self._lock:
+            for track_id, t in list(self._tracks.items()):
+                if camera_ip is not None and t.camera_ip != camera_ip:
+                    continue
+                idle = now - t.last_seen > self.track_idle_sec
+                if not t.reported and t.shots and (flush or idle or now - t.first_seen >= self.max_track_sec):
+                    t.reported = True
+                    ready.append(t)
+                if idle or flush:
+                    del self._tracks[track_id]
+            self.reported_tracks += len(ready)
+        return ready
+
+    def start(self, on_ready: Callable[[Track], None], interval_sec: float = 1.0) -> None:
+        """Barre todas las cámaras cada interval_sec y entrega los tracks listos a on_ready."""
+        self._on_ready = on_ready
+        self._thread = threading.Thread(target=self._sweep, args=(max(0.1, float(interval_sec)),), name="best-shot-sweep", daemon=True)
+        self._thread.start()
+
+    def _sweep(self, interval_sec: float) -> None:
+        while not self._stop_event.wait(interval_sec):
+            self._report(self.pop_ready())
+
+    def _report(self, tracks: List[Track]) -> None:
+        for track in tracks:
+            try:
+                self._on_ready(track)
+            except Exception as e:
+                logging.error(f"Reporte del track {track.track_id} falló: {e}")
+
+    def stop(self, flush: bool = True, timeout: float = 5.0) -> None:
+        """Detiene el barrido; con flush, reporta los tracks con tomas aún pendientes."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+        if flush and self._on_ready is not None:
+            self._report(self.pop_ready(flush=True))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"active_tracks": len(self._tracks), "offered": self.offered, "reported_tracks": self.reported_tracks}
@@ -1,9 +1,11 @@
 from typing import List, Tuple, Optional, Dict
-import os
 import cv2
 import numpy as np
 import re
 
+from .gallery_cache import GalleryCache, compute_orb_descriptors, load_orb_gallery
+from .plates import OcrEngine, PlateIndex, plate_from_identity, read_plate
+
 
 class VehicleRecognizer:
     """
@@ -11,45 +13,58 @@ class VehicleRecognizer:
     Almacena descriptores de vehículos conocidos desde data/vehicles/known/
     """
 
-    def __init__(self) -> None:
+    def __init__(self, plate_max_edits: int = 1, ocr: Optional[OcrEngine] = None) -> None:
         self.orb = cv2.ORB_create(nfeatures=500)
         self.bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
         self.vehicle_descriptors: Dict[str, List] = {}
+        self.plate_index = PlateIndex(plate_max_edits)
+        self.ocr = ocr
         self.trained = False
 
-    def train_from_dir(self, root_dir: str) -> None:
+    def train_from_dir(self, root_dir: str, cache_dir: Optional[str] = None, entries: Optional[Dict[str, Dict]] = None) -> None:
         """
         Carga imágenes de vehículos conocidos desde subdirectorios.
         Estructura: data/vehicles/known/PLACA_ABC123/foto1.jpg
+        Con cache_dir, reutiliza los descriptores ORB guardados en disco.
+        entries: resultado de GalleryCache.scan(root_dir) ya hecho por el llamador.
         """
-        if not os.path.exists(root_dir):
-            return
-        for vehicle_id in sorted(os.listdir(root_dir)):
-            vehicle_dir = os.path.join(root_dir, vehicle_id)
-            if not os.path.isdir(vehicle_dir):
-                continue
-            descriptors_list = []
-            for fname in os.listdir(vehicle_dir):
-                if not fname.lower().endswith((".jpg", ".jpeg", ".png")):
-                    continue
-                path = os.path.join(vehicle_dir, fname)
-                img = cv2.imread(path)
-                if img is None:
-                    continue
-                gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-                kp, des = self.orb.detectAndCompute(gray, None)
-                if des is not None and len(des) > 0:
-                    descriptors_list.append(des)
-            if descriptors_list:
-                self.vehicle_descriptors[vehicle_id] = descriptors_list
+        cache = GalleryCache(cache_dir, "vehicles") if cache_dir else None
+        self.vehicle_descriptors = load_orb_gallery(root_dir, self.orb, cache, entries)
+        # Todas las carpetas cuentan para placas, aunque aún no tengan fotos útiles
+        self.plate_index = PlateIndex.from_identities(PlateIndex.identities_in(root_dir), self.plate_index.max_edits)
         if self.vehicle_descriptors:
             self.trained = True
 
+    def enroll(self, identity: str, paths: List[str]) -> int:
+        """
+        Agrega imágenes nuevas a la galería sin reiniciar.
+        Construye una copia y la publica con una sola asignación, de modo que
+        los hilos de detección nunca ven una galería a medio actualizar.
+        """
+        new_des = [d for d in (compute_orb_descriptors(self.orb, p) for p in paths) if d is not None]
+        if not new_des:
+            return 0
+        gallery = dict(self.vehicle_descriptors)
+        gallery[identity] = list(gallery.get(identity, [])) + new_des
+        self.vehicle_descriptors = gallery
+        plate = plate_from_identity(identity)
+        if plate is not None and self.plate_index.by_plate.get(plate) != identity:
+            plate_index = self.plate_index.copy()
+            plate_index.add(identity)
+            self.plate_index = plate_index
+        self.trained = True
+        return len(new_des)
+
     def recognize(self, frame, bbox: Tuple[int, int, int, int], plate_text: Optional[str] = None) -> Tuple[Optional[str], float]:
         """
-        Reconoce vehículo por descriptores ORB y/o placa detectada.
+        Reconoce vehículo por placa detectada y, si no coincide, por descriptores ORB.
         Retorna (vehicle_id, confidence) o (None, 0.0) si desconocido.
         """
+        # Placa conocida (exacta o con pocos errores de OCR): sin matching visual
+        if plate_text:
+            vehicle_id, edits = self.plate_index.lookup(plate_text)
+            if vehicle_id is not None:
+                return (vehicle_id, 0.95 - 0.1 * edits)
         if not self.trained:
             return (None, 0.0)
         
@@ -66,11 +81,9 @@ class VehicleRecognizer:
         best_match = None
         best_score = 0.0
         
-        for vehicle_id, desc_list in self.vehicle_descriptors.items():
-            # Match por placa si disponible
-            if plate_text and plate_text.upper() in vehicle_id.upper():
-                return (vehicle_id, 0.95)
-            
+        # Referencia local: enroll() puede publicar otra galería mientras tanto
+        gallery = self.vehicle_descriptors
+        for vehicle_id, desc_list in gallery.items():
             # Match por características visuales
             max_matches = 0
             for stored_des in desc_list:
@@ -89,21 +102,18 @@ class VehicleRecognizer:
 
     def detect_plate(self, frame, bbox: Tuple[int, int, int, int]) -> Optional[str]:
         """
-        Detecta placa de vehículo usando OCR simple (Tesseract no incluido).
-        Retorna texto de placa o None.
-        Nota: Requiere pytesseract para producción.
+        Localiza y lee la placa en un solo frame. Retorna texto de placa o None
+        (también si no hay motor de OCR configurado).
+        Para video usar PlateReader, que lee solo los mejores frames de cada
+        vehículo y vota entre lecturas.
         """
+        if self.ocr is None:
+            return None
         x, y, w, h = bbox
         vehicle_crop = frame[y:y+h, x:x+w]
         if vehicle_crop.size == 0:
             return None
-        
-        # Preprocesamiento para detectar región de placa
-        gray = cv2.cvtColor(vehicle_crop, cv2.COLOR_BGR2GRAY)
-        # Buscar regiones rectangulares que puedan ser placas
-        # Implementación básica sin Tesseract: retorna None
-        # Para producción: integrar pytesseract aquí
-        return None
+        return read_plate(vehicle_crop, self.ocr)[0]
 
     def extract_features(self, frame, bbox: Tuple[int, int, int, int]) -> Dict[str, any]:
         """
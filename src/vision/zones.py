@@ -0,0 +1,131 @@
+"""
+Zonas de detección por cámara.
+
+config/settings.yaml:
+    zones:
+      "192.168.1.100":
+        - category: vehicles      # person | faces | vehicles | pets | all
+          type: include           # include | exclude
+          points: [[0.0, 0.5], [1.0, 0.5], [1.0, 1.0], [0.0, 1.0]]
+
+Los puntos pueden ser relativos (0..1, independientes de la resolución) o en
+píxeles del frame de análisis a servicio completo; cuando el gobernador de
+carga reduce el frame (analysis_scale < 1) los puntos en píxeles se escalan
+con él. Para cada cámara y tamaño de frame los polígonos se rasterizan una
+sola vez en una máscara por categoría más su rectángulo envolvente (ROI):
+los detectores corren solo sobre el ROI y se descartan las detecciones cuyo
+centro cae fuera de la máscara.
+"""
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+Box = Tuple[int, int, int, int]
+
+
+def offset_boxes(boxes, ox: int, oy: int) -> List[Box]:
+    """Lleva cajas (x, y, w, h) detectadas en un ROI a coordenadas del frame."""
+    return [(int(x) + ox, int(y) + oy, int(w), int(h)) for (x, y, w, h) in boxes]
+
+
+class FrameZones:
+    """Máscaras y ROIs ya rasterizados de una cámara para un tamaño de frame."""
+
+    def __init__(self, zones: List[dict], shape: Tuple[int, int], scale: float = 1.0) -> None:
+        self.shape = shape
+        self.scale = scale
+        h, w = shape
+        self.masks: Dict[str, np.ndarray] = {}
+        self.rois: Dict[str, Optional[Box]] = {}
+        categories = {z.get("category", "all") for z in zones} - {"all"}
+        for category in categories | ({"all"} if any(z.get("category", "all") == "all" for z in zones) else set()):
+            relevant = [z for z in zones if z.get("category", "all") in (category, "all")]
+            includes = [self._polygon(z["points"], w, h, scale) for z in relevant if z.get("type", "include") == "include"]
+            excludes = [self._polygon(z["points"], w, h, scale) for z in relevant if z.get("type", "include") == "exclude"]
+            if includes:
+                mask = np.zeros((h, w), dtype=np.uint8)
+                cv2.fillPoly(mask, includes, 1)
+            else:
+                mask = np.ones((h, w), dtype=np.uint8)
+            if excludes:
+                cv2.fillPoly(mask, excludes, 0)
+            self.masks[category] = mask
+            x, y, bw, bh = cv2.boundingRect(mask)
+            self.rois[category] = (x, y, bw, bh) if bw and bh else None
+
+    @staticmethod
+    def _polygon(points: Iterable, w: int, h: int, scale: float = 1.0) -> np.ndarray:
+        pts = np.asarray(points, dtype=np.float32)
+        if pts.size and float(pts.max()) <= 1.0:
+            pts = pts * np.array([w - 1, h - 1], dtype=np.float32)
+        else:
+            # Píxeles a servicio completo -> píxeles del frame reducido
+            pts = pts * np.float32(scale)
+        return np.round(pts).astype(np.int32)
+
+    def _mask(self, category: str) -> Optional[np.ndarray]:
+        return self.masks.get(category, self.masks.get("all"))
+
+    def roi(self, *categories: str) -> Optional[Box]:
+        """Rectángulo que cubre las zonas de las categorías; None si no hay área útil."""
+        h, w = self.shape
+        boxes = []
+        for category in categories:
+            if self._mask(category) is None:
+                return (0, 0, w, h)
+            roi = self.rois.get(category, self.rois.get("all"))
+            if roi is not None:
+                boxes.append(roi)
+        if not boxes:
+            return None
+        x0 = min(b[0] for b in boxes)
+        y0 = min(b[1] for b in boxes)
+        x1 = max(b[0] + b[2] for b in boxes)
+        y1 = max(b[1] + b[3] for b in boxes)
+        return (x0, y0, x1 - x0, y1 - y0)
+
+    def crop(self, frame: np.ndarray, *categories: str) -> Tuple[Optional[np.ndarray], int, int]:
+        """(vista del ROI, offset_x, offset_y); la vista es None si no hay nada que procesar."""
+        roi = self.roi(*categories)
+        if roi is None:
+            return None, 0, 0
+        x, y, w, h = roi
+        if (x, y, w, h) == (0, 0, frame.shape[1], frame.shape[0]):
+            return frame, 0, 0
+        return frame[y:y+h, x:x+w], x, y
+
+    def allows(self, category: str, box: Box) -> bool:
+        mask = self._mask(category)
+        if mask is None:
+            return True
+        x, y, w, h = box
+        cx = min(max(int(x + w / 2), 0), mask.shape[1] - 1)
+        cy = min(max(int(y + h / 2), 0), mask.shape[0] - 1)
+        return bool(mask[cy, cx])
+
+    def filter(self, category: str, boxes: Iterable[Box]) -> List[Box]:
+        return [b for b in boxes if self.allows(category, b)]
+
+
+class ZoneMap:
+    """Zonas de todas las cámaras; rasteriza bajo demanda y cachea por (cámara, tamaño, escala)."""
+
+    def __init__(self, zones_cfg: Optional[Dict[str, List[dict]]] = None) -> None:
+        self.zones_cfg = zones_cfg or {}
+        self._cache: Dict[tuple, FrameZones] = {}
+        self._lock = threading.Lock()
+
+    def for_frame(self, camera_ip: str, frame_shape, scale: float = 1.0) -> FrameZones:
+        """scale: analysis_scale con el que se redujo el frame (1.0 = servicio completo)."""
+        shape = (int(frame_shape[0]), int(frame_shape[1]))
+        scale = round(float(scale), 4)
+        key = (camera_ip, shape, scale)
+        zones = self._cache.get(key)
+        if zones is None:
+            with self._lock:
+                zones = self._cache.get(key)
+                if zones is None:
+                    zones = self._cache[key] = FrameZones(self.zones_cfg.get(camera_ip, []), shape, scale)
+        return zones
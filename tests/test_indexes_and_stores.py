@@ -0,0 +1,188 @@
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from src.core.attribute_store import AttributeStore
+from src.core.conversation_store import MemoryConversationStore, SQLiteConversationStore
+from src.core.event_store import EventStore
+from src.vision.bktree import BKTree
+from src.vision.plates import PlateIndex, edit_distance
+
+
+# PlateIndex
+
+def test_plate_index_exact_lookup_normalizes_text():
+    index = PlateIndex.from_identities(["ABC123_toyota_rojo", "PLACA_XYZ789"])
+    assert index.lookup("abc-123") == ("ABC123_toyota_rojo", 0)
+    assert index.lookup("XYZ 789") == ("PLACA_XYZ789", 0)
+
+
+def test_plate_index_one_edit_lookup():
+    index = PlateIndex.from_identities(["ABC123", "XYZ789"], max_edits=1)
+    # 8 read instead of B
+    assert index.lookup("A8C123") == ("ABC123", 1)
+    # Dropped character
+    assert index.lookup("XYZ78") == ("XYZ789", 1)
+    assert index.lookup("QQQ000") == (None, -1)
+
+
+def test_plate_index_tie_returns_nothing():
+    # ABC124 is one edit from both plates: no guess
+    index = PlateIndex.from_identities(["ABC123", "ABC125"], max_edits=1)
+    assert index.lookup("ABC124") == (None, -1)
+
+
+def test_plate_index_without_fuzzy_matching():
+    index = PlateIndex.from_identities(["ABC123"], max_edits=0)
+    assert index.lookup("ABC123") == ("ABC123", 0)
+    assert index.lookup("A8C123") == (None, -1)
+
+
+# BKTree
+
+def test_bktree_matches_brute_force():
+    words = ["ABC123", "ABC124", "ABD123", "XYZ789", "XYZ788", "AB123", "QWERTY"]
+    tree = BKTree(edit_distance)
+    for word in words:
+        assert tree.add(word)
+    assert not tree.add("ABC123")
+    assert len(tree) == len(words)
+    for query in ("ABC123", "XYZ780", "ZZZ"):
+        for radius in (0, 1, 2):
+            expected = sorted((edit_distance(query, w), w) for w in words if edit_distance(query, w) <= radius)
+            found = tree.search(query, radius)
+            assert sorted(found) == expected
+            assert [d for d, _ in found] == sorted(d for d, _ in found)
+
+
+def test_bktree_empty():
+    assert BKTree(edit_distance).search("ABC", 3) == []
+
+
+# EventStore
+
+@pytest.fixture
+def event_store(tmp_path):
+    store = EventStore(tmp_path / "events.db", flush_interval_sec=0.05, min_interval_sec=5.0)
+    store.start()
+    yield store
+    store.stop()
+
+
+def _drain(store):
+    deadline = time.time() + 5
+    while store.queue.qsize() and time.time() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.1)
+
+
+def test_event_store_keeps_distinct_unknown_tracks(event_store):
+    ts = int(time.time() * 1000)
+    assert event_store.append("face_unknown", {"camera_ip": "cam1", "track_id": 1, "ts": ts})
+    # Another stranger on the same camera within min_interval_sec
+    assert event_store.append("face_unknown", {"camera_ip": "cam1", "track_id": 2, "ts": ts + 500})
+    # The same track again is coalesced
+    assert not event_store.append("face_unknown", {"camera_ip": "cam1", "track_id": 1, "ts": ts + 1000})
+    _drain(event_store)
+    rows = event_store.query(types=["face_unknown"])
+    assert sorted(r["payload"]["track_id"] for r in rows) == [1, 2]
+    assert event_store.coalesced == 1
+
+
+def test_event_store_coalesces_known_identity(event_store):
+    ts = int(time.time() * 1000)
+    assert event_store.append("face_known", {"camera_ip": "cam1", "name": "Juan", "ts": ts})
+    assert not event_store.append("face_known", {"camera_ip": "cam1", "name": "Juan", "ts": ts + 1000})
+    assert event_store.append("face_known", {"camera_ip": "cam1", "name": "Maria", "ts": ts + 1000})
+    assert event_store.append("face_known", {"camera_ip": "cam1", "name": "Juan", "ts": ts + 6000})
+    _drain(event_store)
+    assert len(event_store.query(identity="Juan")) == 2
+
+
+def test_event_store_identity_filter_matches_plate(event_store):
+    ts = int(time.time() * 1000)
+    event_store.append("vehicle_known", {"camera_ip": "cam1", "vehicle_id": "ABC123_toyota", "plate": "abc123", "ts": ts})
+    _drain(event_store)
+    assert len(event_store.query(identity="ABC123")) == 1
+    assert len(event_store.query(identity="ABC123_toyota")) == 1
+
+
+# AttributeStore
+
+def _save_crop(root, category, name, color):
+    folder = root / category / "unknown"
+    folder.mkdir(parents=True, exist_ok=True)
+    crop = np.zeros((40, 60, 3), dtype=np.uint8)
+    crop[:] = color
+    path = folder / name
+    cv2.imwrite(str(path), crop)
+    return crop, path
+
+
+def test_attribute_store_skips_tombstoned_rows(tmp_path):
+    store = AttributeStore(tmp_path / "attributes", crops_dir=str(tmp_path), initial_capacity=8)
+    now = time.time()
+    red, red_path = _save_crop(tmp_path, "vehicles", "red.jpg", (0, 0, 255))
+    red2, red2_path = _save_crop(tmp_path, "vehicles", "red2.jpg", (0, 0, 250))
+    blue, blue_path = _save_crop(tmp_path, "vehicles", "blue.jpg", (255, 0, 0))
+    store.add("vehicles", "cam1", now, red, str(red_path))
+    store.add("vehicles", "cam1", now + 1, red2, str(red2_path))
+    store.add("vehicles", "cam1", now + 2, blue, str(blue_path))
+
+    assert {r["path"] for r in store.search("vehicles", color="red")} == {str(red_path), str(red2_path)}
+
+    # Moved to known/ by the webhook
+    assert store.forget([str(red_path)]) == 1
+    assert store.forget([str(red_path)]) == 0
+    assert [r["path"] for r in store.search("vehicles", color="red")] == [str(red2_path)]
+    assert str(red_path) not in {r["path"] for r in store.similar(red, "vehicles")}
+
+    # Deleted without forget(): pruned and tombstoned by the search itself
+    red2_path.unlink()
+    assert store.search("vehicles", color="red") == []
+    assert store.stats()["deleted"] == 2
+    assert [r["path"] for r in store.search("vehicles")] == [str(blue_path)]
+
+
+def test_attribute_store_tombstones_survive_reopen(tmp_path):
+    store = AttributeStore(tmp_path / "attributes", crops_dir=str(tmp_path), initial_capacity=8)
+    crop, path = _save_crop(tmp_path, "pets", "dog.jpg", (0, 0, 255))
+    store.add("pets", "cam1", time.time(), crop, str(path))
+    store.forget([str(path)])
+    store.flush()
+    reopened = AttributeStore(tmp_path / "attributes", crops_dir=str(tmp_path))
+    assert reopened.search("pets") == []
+
+
+# ConversationStore
+
+@pytest.fixture(params=["memory", "sqlite"])
+def conversation_store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryConversationStore(ttl_sec=60)
+    return SQLiteConversationStore(tmp_path / "conversations.db", ttl_sec=60)
+
+
+def test_conversation_store_compare_and_set(conversation_store):
+    key = "whatsapp:+100"
+    assert conversation_store.get(key) is None
+    assert conversation_store.compare_and_set(key, None, {"step": "ask_type"})
+    # A second worker that also read "no conversation" loses
+    assert not conversation_store.compare_and_set(key, None, {"step": "ask_type"})
+    assert not conversation_store.compare_and_set(key, "ask_name", {"step": "done"})
+    assert conversation_store.compare_and_set(key, "ask_type", {"step": "ask_name", "category": "faces"})
+    assert conversation_store.get(key) == {"step": "ask_name", "category": "faces"}
+    # new_state=None ends the conversation
+    assert conversation_store.compare_and_set(key, "ask_name", None)
+    assert conversation_store.get(key) is None
+
+
+def test_conversation_store_expires(tmp_path):
+    store = SQLiteConversationStore(tmp_path / "conversations.db", ttl_sec=0.05)
+    assert store.compare_and_set("k", None, {"step": "ask_type"})
+    time.sleep(0.1)
+    assert store.get("k") is None
+    # An expired conversation counts as none
+    assert store.compare_and_set("k", None, {"step": "ask_type"})